@@ -1,4 +1,6 @@
+import asyncio
 import laser
+from laser import aio
 from abc import ABC, abstractmethod
 
 ##
@@ -8,17 +10,39 @@ from abc import ABC, abstractmethod
 # Internally, this is used in a run_wrapper which is what the user
 # should call to actually change the state of the laser. The user
 # is not supposed to subclass the Action class
+#
+# Actions act on the default laser unless given the name of an instrument
+# registered with laser.register.
 
 class Action(ABC):
 
   _field_name = None
+  _instrument = None
 
-  def __init__(self, field):
+  def __init__(self, field, instrument = None):
     self._field_name = field
+    self._instrument = instrument
 
   def run_wrapper(self, current_time):
     value = self.run(current_time)
-    laser.get().set_field(self._field_name, value)
+    # None means the action leaves the laser alone at this time
+    if value is not None:
+      laser.get(self._instrument).set_field(self._field_name, value)
+    return value
+
+  ##
+  # Awaitable version of run_wrapper, which sets the field without
+  # blocking the event loop. Subclasses that act through their own
+  # run_wrapper, such as asking for a sample change, have it run on the
+  # loop's default executor instead
+  async def run_wrapper_async(self, current_time):
+    if type(self).run_wrapper is not Action.run_wrapper:
+      loop = asyncio.get_event_loop()
+      return await loop.run_in_executor(None, self.run_wrapper, current_time)
+    value = self.run(current_time)
+    if value is not None:
+      await aio.get(self._instrument).set_field(self._field_name, value)
+    return value
 
   @abstractmethod
   def run(self, current_time):
@@ -27,13 +51,27 @@ class Action(ABC):
 
 ##
 # The EndAction class is what is used by the experiment class
-# to turnoff the laser
+# to turnoff the laser, or the named instrument, with save_data False
+# when the samples went into segments rather than Data.csv
 
 class EndAction:
+  def __init__(self, instrument = None, save_data = True):
+    self._instrument = instrument
+    self._save_data = save_data
+
   def run(self):
-    laser.get().turn_off_laser()
+    if self._save_data:
+      laser.get(self._instrument).turn_off_laser()
+    else:
+      laser.get(self._instrument).turn_off_laser(save_data = False)
     return
 
+  async def run_async(self):
+    if self._save_data:
+      await aio.get(self._instrument).turn_off_laser()
+    else:
+      await aio.get(self._instrument).turn_off_laser(save_data = False)
+
 ##
 # The PulseWidthAction class is what should be subclassed
 # by actions that wish to alter the pulse width of the laser.
@@ -52,8 +90,8 @@ class EndAction:
 #       self.results = 7
 
 class PulseWidthAction(Action):
-  def __init__(self):
-    super().__init__('pulse_width')
+  def __init__(self, instrument = None):
+    super().__init__('pulse_width', instrument)
 
 ##
 # The PulseRateAction class is what should be subclassed
@@ -73,8 +111,8 @@ class PulseWidthAction(Action):
 #       self.results = 7
 
 class PulseRateAction(Action):
-  def __init__(self):
-    super().__init__('pulse_rate')
+  def __init__(self, instrument = None):
+    super().__init__('pulse_rate', instrument)
 
 ##
 # The WavelengthAction class is what should be subclassed
@@ -94,8 +132,8 @@ class PulseRateAction(Action):
 #       self.results = 7
 
 class WavelengthAction(Action):
-  def __init__(self):
-    super().__init__('wavelength')
+  def __init__(self, instrument = None):
+    super().__init__('wavelength', instrument)
 
 ##
 # The CurrentAction class is what should be subclassed
@@ -115,5 +153,23 @@ class WavelengthAction(Action):
 #       self.results = 7
 
 class CurrentAction(Action):
-  def __init__(self):
-    super().__init__('current')
\ No newline at end of file
+  def __init__(self, instrument = None):
+    super().__init__('current', instrument)
+
+##
+# The ScheduledAction class sets a field to predetermined values at
+# predetermined times. It is what the built-in experiments compile their
+# steps into, rather than being subclassed by the user.
+#
+# Example: The following sets the wavelength to 1000 after 1 second and to
+# 1010 after 11 seconds
+#
+# action = ScheduledAction('wavelength', {1: 1000, 11: 1010})
+
+class ScheduledAction(Action):
+  def __init__(self, field, schedule, instrument = None):
+    super().__init__(field, instrument)
+    self._schedule = dict(schedule)
+
+  def run(self, current_time):
+    return self._schedule.get(current_time)
@@ -0,0 +1,163 @@
+## @package benchmark
+#  Benchmark suite for the analysis, display, acquisition and experiment
+#  code paths, and for cold start import times.
+#
+#  Every benchmark Case is swept over input sizes (1e3 to 1e8 samples by
+#  default), repeated, and summarised by its median and 95th percentile
+#  run time and its peak traced memory. Results are saved as JSON baselines
+#  that later runs are compared against to catch regressions.
+#
+#  From the src folder:
+#
+#  python -m benchmark run -o baseline.json
+#  python -m benchmark run --sizes 1e3 1e5 --filter analysis -o current.json
+#  python -m benchmark compare baseline.json current.json
+
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+
+## Input sizes swept by default.
+DEFAULT_SIZES = [10**k for k in range(3, 9)]
+
+## Relative slow-down (or memory growth) reported as a regression.
+DEFAULT_TOLERANCE = 0.25
+
+## A single benchmark. setup(size) builds fresh untimed input for every
+#  repetition and run(state) is the timed part.
+class Case:
+    ## @param name Dotted name, the part before the first dot is its group.
+    #  @param setup Function of the input size returning the state to run on.
+    #  @param run Function of the state, the code being measured.
+    #  @param max_size Largest size this case is run at, None for no limit.
+    def __init__(self, name, setup, run, max_size=None):
+        self.name = name
+        self.setup = setup
+        self.run = run
+        self.max_size = max_size
+
+## @brief Time and memory profile of one case at one size.
+#
+#  @param case Case to measure.
+#  @param size Input size passed to setup.
+#  @param repeats Number of timed repetitions.
+#  @returns Dictionary of median, p95, min and all times in seconds,
+#           peak_bytes traced during one extra run, and repeats.
+def measure(case, size, repeats=5):
+    times = []
+    for _ in range(repeats):
+        state = case.setup(size)
+        gc.collect()
+        start = time.perf_counter()
+        case.run(state)
+        times.append(time.perf_counter() - start)
+        del state
+
+    # memory is traced on its own run as tracing slows allocation down
+    state = case.setup(size)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        case.run(state)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'median': float(np.median(times)),
+        'p95': float(np.percentile(times, 95)),
+        'min': float(np.min(times)),
+        'times': times,
+        'peak_bytes': int(peak),
+        'repeats': repeats,
+    }
+
+## @brief Run cases over a sweep of sizes.
+#
+#  @param cases List of Case.
+#  @param sizes List of input sizes, sizes above a case's max_size are skipped.
+#  @param repeats Number of timed repetitions per case and size.
+#  @param report Optional function called with (case name, size, result).
+#  @returns Baseline dictionary with 'meta' and 'results' entries, results
+#           keyed by case name then by size as a string.
+def run_suite(cases, sizes=DEFAULT_SIZES, repeats=5, report=None):
+    results = {}
+    for case in cases:
+        for size in sizes:
+            if case.max_size is not None and size > case.max_size:
+                continue
+            result = measure(case, size, repeats)
+            results.setdefault(case.name, {})[str(size)] = result
+            if report is not None:
+                report(case.name, size, result)
+    return {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+
+## @brief Write a baseline to a JSON file.
+def save(baseline, path):
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=1)
+
+## @brief Read a baseline from a JSON file.
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+## @brief Compare a run against a baseline.
+#
+#  Only case and size pairs present in both are compared. Medians are
+#  compared for time, peak traced bytes for memory.
+#
+#  @param baseline Baseline dictionary, as returned by run_suite or load.
+#  @param current Baseline dictionary of the run being checked.
+#  @param tolerance Allowed relative slow-down before flagging a regression.
+#  @param memory_tolerance Allowed relative memory growth.
+#  @returns List of dictionaries with case, size, both medians and peaks,
+#           time_ratio, memory_ratio and regression (bool), one per pair.
+def compare(baseline, current, tolerance=DEFAULT_TOLERANCE,
+            memory_tolerance=DEFAULT_TOLERANCE):
+    rows = []
+    for name, sizes in sorted(current['results'].items()):
+        for size, new in sorted(sizes.items(), key=lambda item: int(item[0])):
+            old = baseline['results'].get(name, {}).get(size)
+            if old is None:
+                continue
+            time_ratio = new['median'] / old['median'] if old['median'] else float('inf')
+            memory_ratio = (new['peak_bytes'] / old['peak_bytes']
+                            if old['peak_bytes'] else 1.0)
+            rows.append({
+                'case': name,
+                'size': int(size),
+                'baseline_median': old['median'],
+                'median': new['median'],
+                'baseline_peak_bytes': old['peak_bytes'],
+                'peak_bytes': new['peak_bytes'],
+                'time_ratio': time_ratio,
+                'memory_ratio': memory_ratio,
+                'regression': (time_ratio > 1 + tolerance or
+                               memory_ratio > 1 + memory_tolerance),
+            })
+    return rows
+
+## @brief Print a comparison as a table.
+def print_comparison(rows, out=sys.stdout):
+    out.write('{:<34} {:>10} {:>11} {:>11} {:>7} {:>7}\n'.format(
+        'case', 'size', 'base (s)', 'now (s)', 'time', 'memory'))
+    for row in rows:
+        out.write('{:<34} {:>10} {:>11.4g} {:>11.4g} {:>6.2f}x {:>6.2f}x{}\n'.format(
+            row['case'], row['size'], row['baseline_median'], row['median'],
+            row['time_ratio'], row['memory_ratio'],
+            '  REGRESSION' if row['regression'] else ''))
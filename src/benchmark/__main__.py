@@ -0,0 +1,66 @@
+## @package benchmark.__main__
+#  Command line entry point of the benchmark suite, see the benchmark package.
+
+import argparse
+import sys
+
+import benchmark
+
+## @brief Parse arguments and run the requested command.
+#
+#  @returns Process exit status, 1 if a comparison found regressions.
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmark')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    run = commands.add_parser('run', help='run the suite and save a baseline')
+    run.add_argument('-o', '--output', default='benchmark.json',
+                     help='baseline file to write')
+    run.add_argument('--sizes', nargs='+', type=float,
+                     default=benchmark.DEFAULT_SIZES, help='input sizes to sweep')
+    run.add_argument('--repeats', type=int, default=5,
+                     help='timed repetitions per case and size')
+    run.add_argument('--filter', default='',
+                     help='only run cases whose name contains this text')
+    run.add_argument('--compare', metavar='BASELINE',
+                     help='compare against this baseline once done')
+    run.add_argument('--tolerance', type=float, default=benchmark.DEFAULT_TOLERANCE)
+
+    comp = commands.add_parser('compare', help='compare a run against a baseline')
+    comp.add_argument('baseline', help='baseline file')
+    comp.add_argument('current', help='file of the run being checked')
+    comp.add_argument('--tolerance', type=float, default=benchmark.DEFAULT_TOLERANCE,
+                      help='allowed relative slow-down')
+    comp.add_argument('--memory-tolerance', type=float,
+                      default=benchmark.DEFAULT_TOLERANCE,
+                      help='allowed relative growth of peak memory')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        from benchmark.cases import CASES
+        cases = [case for case in CASES if args.filter in case.name]
+        sizes = [int(size) for size in args.sizes]
+
+        def report(name, size, result):
+            sys.stdout.write('{:<34} {:>10} median {:>10.4g} s  p95 {:>10.4g} s  peak {:>12} B\n'.format(
+                name, size, result['median'], result['p95'], result['peak_bytes']))
+            sys.stdout.flush()
+
+        current = benchmark.run_suite(cases, sizes, args.repeats, report)
+        benchmark.save(current, args.output)
+        if args.compare:
+            rows = benchmark.compare(benchmark.load(args.compare), current,
+                                     args.tolerance, args.tolerance)
+            benchmark.print_comparison(rows)
+            return 1 if any(row['regression'] for row in rows) else 0
+        return 0
+
+    rows = benchmark.compare(benchmark.load(args.baseline), benchmark.load(args.current),
+                             args.tolerance, args.memory_tolerance)
+    benchmark.print_comparison(rows)
+    return 1 if any(row['regression'] for row in rows) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+## @package benchmark.cases
+#  The benchmark cases of the suite, grouped by the first part of their name:
+#
+#  - analysis: every Analysis method on a noisy trace of the given size.
+#  - spectral: batched Welch PSD of the given number of samples split into
+#    4096 sample traces.
+#  - display: building a Display and rendering it with the headless Agg
+#    backend.
+#  - acquisition: the per-slice buffering done by the acquisition thread
+#    (magnitude, list append, LiveFeed publish) for the given number of
+#    samples in 0.1 s slices at 2 kHz, then joining the slices as
+#    turn_off_laser does.
+#  - experiment: dispatching the given number of one second ticks of an
+#    experiment with four actions to an EmulatedLaser, which is the work
+#    Experiment.run does between its sleeps.
+#  - startup: importing a module in a fresh interpreter, i.e. cold start
+#    time. It does not depend on the size, so it only runs at sizes up to
+#    1e3.
+
+import os
+import subprocess
+import sys
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+
+import laser
+from action import ScheduledAction
+from benchmark import Case
+from data_analysis import analysis, display, spectral
+from laser.emulator import EmulatedLaser
+from laser.live_feed import LiveFeed
+
+## noisy test trace, seeded so that every run sees the same data
+def _trace(size):
+    rng = np.random.RandomState(0)
+    return np.sin(np.linspace(0, 50, size)) + 0.1*rng.standard_normal(size)
+
+def _analysis(size):
+    return analysis.Analysis(_trace(size))
+
+def _analysis_case(name, run, max_size=None):
+    return Case('analysis.' + name, _analysis, run, max_size)
+
+def _ratio_setup(size):
+    return _analysis(size), np.linspace(1, 2, size)
+
+def _traces(size):
+    n = min(size, 4096)
+    return _trace(size - size % n).reshape(-1, n)
+
+def _display_setup(size):
+    plt.close('all')
+    return np.array([_analysis(size)])
+
+def _display_run(data):
+    display_obj = display.Display(data)
+    display_obj.fig.canvas.draw()
+    plt.close(display_obj.fig)
+
+def _acquisition_setup(size):
+    slice_samples = 200
+    rng = np.random.RandomState(0)
+    x = rng.standard_normal(slice_samples)
+    y = rng.standard_normal(slice_samples)
+    t = np.arange(slice_samples) / 2e3
+    return size // slice_samples, x, y, t
+
+def _acquisition_run(state):
+    slices, x, y, t = state
+    feed = LiveFeed()
+    data_list = []
+    time_list = []
+    for i in range(slices):
+        data = np.hypot(x, y)
+        time_axis = t + i * 0.1
+        data_list.append(data)
+        time_list.append(time_axis)
+        feed.publish(time_axis, data)
+    np.stack([np.concatenate(data_list), np.concatenate(time_list)])
+
+def _experiment_setup(size):
+    laser.reset_for_testing()
+    laser.set_for_test(EmulatedLaser())
+    steps = np.arange(1, size + 1, 10)
+    actions = [
+        ScheduledAction('wavelength', {int(t): 950 + (t % 300) for t in steps}),
+        ScheduledAction('current', {int(t): 1300 for t in steps[::5]}),
+        ScheduledAction('pulse_rate', {}),
+        ScheduledAction('pulse_width', {}),
+    ]
+    return size, actions
+
+def _experiment_run(state):
+    duration, actions = state
+    for current_time in range(1, duration + 1):
+        for action in actions:
+            action.run_wrapper(current_time)
+    laser.get().turn_off_laser()
+
+## case importing module in a fresh interpreter started in the src folder
+def _startup_case(module):
+    src = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    command = [sys.executable, '-c', 'import ' + module]
+    return Case('startup.' + module, lambda size: None,
+                lambda state: subprocess.run(command, cwd=src, check=True),
+                max_size=10**3)
+
+## All benchmark cases, in the order they are run.
+CASES = [
+    _analysis_case('reset', lambda a: a.reset()),
+    _analysis_case('differentiate', lambda a: a.differentiate()),
+    _analysis_case('integrate', lambda a: a.integrate()),
+    _analysis_case('trim', lambda a: a.trim(10, -10)),
+    _analysis_case('normalize', lambda a: a.normalize()),
+    Case('analysis.ratio', _ratio_setup, lambda s: s[0].ratio(s[1])),
+    _analysis_case('psd', lambda a: a.psd()),
+    _analysis_case('moving_average', lambda a: a.moving_average(11)),
+    _analysis_case('savitzky_golay', lambda a: a.savitzky_golay(11)),
+    _analysis_case('median_filter', lambda a: a.median_filter(11)),
+    _analysis_case('exponential', lambda a: a.exponential(0.1)),
+    _analysis_case('find_peaks', lambda a: a.find_peaks(0.5)),
+    Case('spectral.welch_batch', _traces,
+         lambda traces: spectral.welch(traces, 2e3, 1024)),
+    Case('display.render', _display_setup, _display_run, max_size=10**7),
+    Case('acquisition.buffer', _acquisition_setup, _acquisition_run, max_size=10**7),
+    Case('experiment.schedule', _experiment_setup, _experiment_run, max_size=10**6),
+    _startup_case('data_analysis.analysis'),
+    _startup_case('data_analysis.display'),
+    _startup_case('experiment'),
+]
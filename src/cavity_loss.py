@@ -0,0 +1,162 @@
+import laser
+import numpy as np
+from action import Action, ScheduledAction
+from experiment import Experiment
+from data_analysis import ringdown
+
+##
+# The RingdownCaptureAction class captures ring-down transients at
+# scheduled times and keeps them by wavelength. It is run after the
+# wavelength has been set in the same second.
+
+class RingdownCaptureAction(Action):
+  def __init__(self, schedule, count, duration):
+    super().__init__(None)
+    self._schedule = dict(schedule)
+    self._count = count
+    self._duration = duration
+    ## Time axis shared by all transients, set by the first capture
+    self.time_axis = None
+    ## List of (wavelength, transients array) captured so far
+    self.captures = []
+
+  def run(self, current_time):
+    return self._schedule.get(current_time)
+
+  def run_wrapper(self, current_time):
+    wavelength = self.run(current_time)
+    if wavelength is not None:
+      self.time_axis, transients = laser.get().capture_transients(
+        self._count, self._duration)
+      self.captures.append((wavelength, transients))
+
+##
+# The CavityLossExperiment class measures the loss of an optical cavity
+# over a set of wavelengths from ring-down transients. At every wavelength
+# the laser is tuned, allowed to settle, and a number of decay transients
+# are captured by the lock-in on its trigger input. All transients are
+# fitted together, see data_analysis.ringdown, and the decay times are
+# averaged per wavelength into a loss spectrum.
+#
+# Example: The following measures 50 transients of 20 ms at each of three
+# wavelengths in a 50 cm cavity.
+#
+# loss_exp = CavityLossExperiment.builder() \
+#   .with_wavelengths([1000, 1050, 1100]) \
+#   .with_transients(50, 0.02) \
+#   .with_cavity_length(50) \
+#   .build()
+# wavelengths, loss, loss_err, tau, round_trip = loss_exp.run()
+
+class CavityLossExperiment:
+
+  ##
+  # Builder for the cavity loss experiment, validates the parameters
+  class Builder:
+    _wavelengths = None
+    _count = 100
+    _duration = None
+    _settle = 2
+    _cavity_length = None
+    _refine = True
+
+    ##
+    # Wavelengths, in wavenumbers, at which transients are captured
+    def with_wavelengths(self, wavelengths):
+      self._wavelengths = list(wavelengths)
+      return self
+
+    ##
+    # Number of transients per wavelength and length of each in seconds
+    def with_transients(self, count, duration):
+      self._count = count
+      self._duration = duration
+      return self
+
+    ##
+    # Seconds waited after tuning before capturing
+    def with_settle(self, settle):
+      self._settle = settle
+      return self
+
+    ##
+    # Cavity length in cm, to report loss per round trip as well
+    def with_cavity_length(self, cavity_length):
+      self._cavity_length = cavity_length
+      return self
+
+    ##
+    # Whether the closed form fits are refined by nonlinear least squares
+    def with_refine(self, refine):
+      self._refine = refine
+      return self
+
+    ##
+    # Validates the parameters and builds the experiment
+    def build(self):
+      assert self._wavelengths
+      assert self._count > 0
+      assert not self._duration is None and self._duration > 0
+      assert int(self._settle) == self._settle and self._settle >= 0
+      return CavityLossExperiment(self)
+
+  @staticmethod
+  ##
+  # Should be called by the user to retrieve the class Builder
+  def builder():
+    return CavityLossExperiment.Builder()
+
+  def __init__(self, builder):
+    self._cavity_length = builder._cavity_length
+    self._refine = builder._refine
+
+    # tune at one second, capture settle seconds later
+    step = int(builder._settle) + 1
+    tunes = {}
+    captures = {}
+    for j, wavelength in enumerate(builder._wavelengths):
+      tunes[1 + j*step] = wavelength
+      captures[1 + j*step + int(builder._settle)] = wavelength
+
+    ## Action holding the captured transients
+    self.capture = RingdownCaptureAction(captures, builder._count,
+      builder._duration)
+    ## RingdownFit of every transient after the last analysis
+    self.fit = None
+
+    self._experiment = Experiment.builder() \
+      .with_actions([ScheduledAction('wavelength', tunes), self.capture]) \
+      .with_duration(len(builder._wavelengths)*step) \
+      .build()
+
+  ##
+  # The underlying Experiment the steps are compiled into
+  def experiment(self):
+    return self._experiment
+
+  ##
+  # Runs the experiment and analyzes the captured transients
+  def run(self):
+    self._experiment.run()
+    return self.analyze()
+
+  ##
+  # Fits every captured transient and reduces them to a loss spectrum.
+  #
+  # @param time_axis 1D numpy array of times since the trigger, defaults
+  #   to the captured time axis
+  # @param captures list of (wavelength, transients array), defaults to
+  #   the captured transients
+  # @returns tuple as returned by data_analysis.ringdown.loss_spectrum
+  def analyze(self, time_axis = None, captures = None):
+    if time_axis is None or captures is None:
+      time_axis = self.capture.time_axis
+      captures = self.capture.captures
+
+    transients = np.concatenate([t for _, t in captures])
+    wavelengths = np.concatenate([np.full(t.shape[0], w, dtype = float)
+                                  for w, t in captures])
+    self.fit = ringdown.fit_log_linear(time_axis, transients)
+    if self._refine:
+      self.fit = ringdown.refine(time_axis, transients, self.fit)
+    return ringdown.loss_spectrum(self.fit.tau, wavelengths, self._cavity_length)
@@ -0,0 +1,96 @@
+import asyncio
+import time
+from threading import Lock
+
+##
+# The SystemClock class is the clock of real runs. now reads the monotonic
+# clock and sleep really waits. Experiment and Laser wait through a clock
+# so that a VirtualClock can take its place.
+
+class SystemClock:
+
+  ##
+  # Seconds on the monotonic clock
+  def now(self):
+    return time.monotonic()
+
+  ##
+  # Waits for the given seconds
+  def sleep(self, seconds):
+    time.sleep(seconds)
+
+  ##
+  # Awaitable version of sleep, which leaves the event loop free
+  async def sleep_async(self, seconds):
+    await asyncio.sleep(seconds)
+
+##
+# The VirtualClock class is a clock that advances instantly. Every sleep
+# moves now forward by the seconds slept without waiting, so an experiment
+# driving an EmulatedLaser on a VirtualClock runs in as long as its
+# actions take to compute, and now reads the time the run would take on
+# the bench.
+#
+# Example: The following runs a 2-hour experiment in milliseconds against
+# an EmulatedLaser, as Experiment.simulate does.
+#
+# clock = VirtualClock()
+# laser.set_for_test(EmulatedLaser(tune_time = 5, clock = clock))
+# experiment = Experiment.builder() \
+#   .with_actions(actions) \
+#   .with_duration(7199) \
+#   .with_clock(clock) \
+#   .build()
+# experiment.run()
+# clock.now()
+
+class VirtualClock:
+
+  def __init__(self, start = 0.0):
+    self._now = start
+    self._lock = Lock()
+
+  ##
+  # Seconds slept so far, from start
+  def now(self):
+    return self._now
+
+  ##
+  # Moves now forward by seconds, without waiting
+  def sleep(self, seconds):
+    with self._lock:
+      self._now += seconds
+
+  ##
+  # Awaitable version of sleep. It yields to the event loop once, so other
+  # tasks still get to run
+  async def sleep_async(self, seconds):
+    self.sleep(seconds)
+    await asyncio.sleep(0)
+
+##
+# The SimulationReport class holds what a dry run of an experiment on
+# EmulatedLasers predicts: the ticks run, the seconds the run takes
+# including the hardware delays, the seconds of those delays per
+# instrument, and the setpoints made, each stamped with the second of the
+# run it would be made at.
+
+class SimulationReport:
+
+  def __init__(self, ticks, seconds, hardware_time, setpoints):
+    self.ticks = ticks
+    self.seconds = seconds
+    self.hardware_time = hardware_time
+    self.setpoints = setpoints
+
+  ##
+  # Human readable summary of the prediction
+  def report(self):
+    lines = ['{} ticks, predicted to take {:.1f} s'.format(self.ticks, self.seconds)]
+    for name in self.setpoints:
+      label = 'default laser' if name is None else name
+      lines.append('{}: {} setpoints, {:.1f} s of hardware time'.format(
+        label, len(self.setpoints[name]), self.hardware_time[name]))
+      for when, field_name, value in self.setpoints[name]:
+        lines.append('  {:10.1f} s  {} = {}'.format(when, field_name, value))
+    return '\n'.join(lines)
@@ -0,0 +1,112 @@
+##
+# align contains the alignment engine that joins two traces on their
+# timestamps, so that traces recorded with different sample counts or start
+# times, such as a sample and a reference channel, can be compared sample by
+# sample. Every timestamp of the left trace is matched to the right trace
+# as-of (the last right sample at or before it), forward (the first at or
+# after it), nearest, or by linear interpolation between the two, optionally
+# within a tolerance.
+#
+# Both time axes must be sorted. They are joined in one sorted merge, which
+# the stable sort does in linear time as its input is two sorted runs, so
+# aligning n samples against m costs O(n + m).
+#
+# Example of normalizing a sample channel by a reference channel:
+# reference_at_sample = align.align(t_sample, t_reference, reference)
+# normalized = sample/reference_at_sample
+
+import numpy as np
+
+## Ways align can match the samples of the right trace.
+METHODS = ('backward', 'forward', 'nearest', 'linear')
+
+##
+# Index of the last right timestamp at or before every left timestamp.
+#
+# @param t_left 1D numpy array of sorted timestamps to match
+# @param t_right 1D numpy array of sorted timestamps matched against
+# @returns 1D int numpy array, -1 where no right timestamp is at or before
+#
+def backward_indices(t_left, t_right):
+    n, m = len(t_left), len(t_right)
+    # right first, so a right timestamp equal to a left one comes before it
+    order = np.argsort(np.concatenate((t_right, t_left)), kind = 'stable')
+    is_right = order < m
+    latest = np.maximum.accumulate(np.where(is_right, order, -1))
+    indices = np.empty(n, dtype = np.intp)
+    indices[order[~is_right] - m] = latest[~is_right]
+    return indices
+
+##
+# Index of the first right timestamp at or after every left timestamp.
+#
+# @param t_left 1D numpy array of sorted timestamps to match
+# @param t_right 1D numpy array of sorted timestamps matched against
+# @returns 1D int numpy array, len(t_right) where no right timestamp is at
+#   or after
+#
+def forward_indices(t_left, t_right):
+    n, m = len(t_left), len(t_right)
+    # left first, so a right timestamp equal to a left one comes after it
+    order = np.argsort(np.concatenate((t_left, t_right)), kind = 'stable')
+    is_right = order >= n
+    candidates = np.where(is_right, order - n, m)
+    earliest = np.minimum.accumulate(candidates[::-1])[::-1]
+    indices = np.empty(n, dtype = np.intp)
+    indices[order[~is_right]] = earliest[~is_right]
+    return indices
+
+##
+# Values of the right trace at the timestamps of the left trace.
+#
+# @param t_left 1D numpy array of sorted timestamps to align to
+# @param t_right 1D numpy array of sorted timestamps of the right trace
+# @param y_right numpy array of the right trace's samples along its last
+#   axis, so several traces on the same time axis can be stacked
+# @param method str; one of METHODS. backward takes the last right sample
+#   at or before, forward the first at or after, nearest the closer of the
+#   two and linear interpolates between them
+# @param tolerance float; largest time between a left timestamp and the
+#   right samples it takes, both neighbours for linear. None for no limit
+# @returns numpy array of y_right's leading shape and t_left's length,
+#   NaN where no right sample matches
+#
+def align(t_left, t_right, y_right, method = 'linear', tolerance = None):
+    if method not in METHODS:
+        raise ValueError('Unknown alignment {}, expected one of {}'.format(method, METHODS))
+    t_left = np.asarray(t_left, dtype = float)
+    t_right = np.asarray(t_right, dtype = float)
+    y_right = np.asarray(y_right, dtype = float)
+    # a sentinel sample past either end stands for no match
+    t_padded = np.concatenate(([-np.inf], t_right, [np.inf]))
+    y_padded = np.concatenate((np.full(y_right.shape[:-1] + (1,), np.nan), y_right,
+        np.full(y_right.shape[:-1] + (1,), np.nan)), axis = -1)
+
+    before = backward_indices(t_left, t_right) + 1
+    after = forward_indices(t_left, t_right) + 1
+    gap_before = t_left - t_padded[before]
+    gap_after = t_padded[after] - t_left
+    tolerance = np.inf if tolerance is None else tolerance
+
+    if method == 'backward':
+        index, ok = before, gap_before <= tolerance
+    elif method == 'forward':
+        index, ok = after, gap_after <= tolerance
+    elif method == 'nearest':
+        closer = gap_before <= gap_after
+        index = np.where(closer, before, after)
+        ok = np.where(closer, gap_before, gap_after) <= tolerance
+    else:
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            weight = gap_before/(gap_before + gap_after)
+        # on a right timestamp both neighbours are that sample, or samples
+        # of that same timestamp, and the last of them is taken
+        weight = np.where(gap_before + gap_after == 0, 0.0, weight)
+        out = y_padded[..., before]*(1 - weight) + y_padded[..., after]*weight
+        ok = (gap_before <= tolerance) & (gap_after <= tolerance)
+        out[..., ~ok] = np.nan
+        return out
+
+    out = y_padded[..., index]
+    out[..., ~ok] = np.nan
+    return out
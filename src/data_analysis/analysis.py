@@ -5,14 +5,14 @@
 # data_raw being the raw input that is never changed and data_adjusted
 # starting at the raw input and being able to be changed with class methods.
 
+# Plotting lives in display, and SciPy modules are imported on first use,
+# so importing this module is cheap and needs no GUI or hardware packages.
+
 import numpy as np
-import numpy.random as npr
-import matplotlib.pyplot as plt
-from matplotlib.widgets import TextBox, Button
-import os
-from datetime import date
-import csv
-from scipy import integrate
+from data_analysis import spectral
+from data_analysis import filters
+from data_analysis import peaks
+from data_analysis import resample as resampling
 
 ##
 # The Analysis class handles all storage and manipulation of input data.
@@ -30,6 +30,13 @@ from scipy import integrate
 # would be the derivitive of the data array and data_raw would
 # still be the same untouched array.
 #
+# Data sampled on a known axis, evenly spaced or not, is given it as x, e.g.
+# Analysis(data, x = time_axis). Derivatives and integrals are then taken
+# over x, ratio() aligns the other data set on x first, so a sample channel
+# can be normalized by a reference recorded with other timestamps:
+# sample.ratio(reference)
+# and resample() brings the data onto an evenly spaced grid.
+#
 
 class Analysis:
 
@@ -38,12 +45,64 @@ class Analysis:
     #
     # @param self the object pointer
     # @param data Nx1 Numpy array containing data to be analyzed
+    # @param sample_rate float; samples per second of data, used by the
+    #   frequency domain methods. spectral.sample_rate(time_axis) gives it
+    #   for lock-in data. Defaults to 1, ie frequencies in cycles per sample
+    # @param x Nx1 numpy array of the sorted positions data was sampled at,
+    #   e.g. the lock-in time axis or the wavenumbers of a scan. None if
+    #   unknown, in which case differentiate and integrate assume samples
+    #   one apart
     #
-    def __init__(self, data):
+    def __init__(self, data, sample_rate = None, x = None):
         ## Nx1 numpy array composed of input data, never altered
         self.data_raw = data
         ## Nx1 numpy array composed of data, changed by each method run
         self.data_adjusted = np.copy(data)
+        ## Nx1 numpy array of the sample positions of data_raw, or None
+        self.x_raw = None if x is None else np.asarray(x, dtype = float)
+        ## Nx1 numpy array of the sample positions of data_adjusted, or None
+        self.x_axis = self.x_raw
+        ## float, samples per second of data_raw
+        self.sample_rate = 1.0 if sample_rate is None else float(sample_rate)
+        ## Nx1 numpy array of frequencies in Hz once data_adjusted has been
+        # taken to the frequency domain, None while it is in the time domain
+        self.frequency_axis = None
+        ## LineIndex of the peaks found by the last find_peaks, or None
+        self.lines = None
+
+    ## method to create an Analysis of the magnitude of a CompactLog, which
+    # is only now converted from x and y, with the sample rate of its
+    # longest run of equally spaced timestamps
+    #
+    # @param log data_analysis.compact.CompactLog, e.g. from
+    #   CompactLog.load('Data.npz')
+    # @returns Analysis
+    #
+    @staticmethod
+    def from_compact(log):
+        index, tick, step = log.runs()
+        lengths = np.diff(np.append(index, log.count))
+        longest = np.argmax(lengths) if lengths.size else None
+        if longest is None or step[longest] == 0:
+            return Analysis(log.magnitude(), x = log.time_axis())
+        return Analysis(log.magnitude(), log.clockbase/step[longest],
+            x = log.time_axis())
+
+    ## method to create an Analysis of a time window of a run split into
+    # segments, loading only the segments that overlap the window
+    #
+    # @param directory str; directory written by a segments.SegmentWriter
+    # @param start float; start of the window in seconds, None for the start
+    # @param stop float; end of the window in seconds, None for the end
+    # @returns Analysis over the window's time axis, with its sample rate
+    #
+    @staticmethod
+    def from_segments(directory, start = None, stop = None):
+        from data_analysis.segments import SegmentIndex
+        time_axis, data = SegmentIndex(directory).window(start, stop)
+        if time_axis.size < 2:
+            return Analysis(data, x = time_axis)
+        return Analysis(data, spectral.sample_rate(time_axis), x = time_axis)
 
     ## method to reset data_adjusted, set it equal to data_raw the 
     # original untouched data
@@ -52,23 +111,37 @@ class Analysis:
     #
     def reset(self):
         self.data_adjusted = self.data_raw
+        self.x_axis = self.x_raw
+        self.frequency_axis = None
 
-    ## method to calculate the derivitve of data_adjusted
+    ## method to calculate the derivitve of data_adjusted, over x_axis if
+    # known, which may be unevenly spaced, and per sample otherwise
     #
     # @param self the object pointer
     #
     def differentiate(self):
-        self.data_adjusted = np.gradient(self.data_adjusted, \
-            self.data_raw[1]-self.data_raw[0])
-        
+        if self.x_axis is not None:
+            self.data_adjusted = np.gradient(self.data_adjusted, self.x_axis)
+        else:
+            self.data_adjusted = np.gradient(self.data_adjusted)
+
         self.data_adjusted = np.around(self.data_adjusted,12)
 
-    ## method to integrate data_adjusted
+    ## method to integrate data_adjusted with the trapezoid rule, over
+    # x_axis if known, which may be unevenly spaced. The integral from the
+    # first sample to each of the others is one sample shorter than the data
     #
     # @param self the object pointer 
     #
     def integrate(self):
-        self.data_adjusted = integrate.cumtrapz(self.data_adjusted)
+        from scipy import integrate
+        # cumtrapz was renamed in SciPy 1.6 and removed in 1.14
+        cumulative = getattr(integrate, 'cumulative_trapezoid', None)
+        if cumulative is None:
+            cumulative = integrate.cumtrapz
+        self.data_adjusted = cumulative(self.data_adjusted, self.x_axis)
+        if self.x_axis is not None:
+            self.x_axis = self.x_axis[1:]
 
     ## method to cut data at specifed points, picks out a range from 
     # data_adjusted and sets it to this specific range of the array
@@ -80,6 +153,10 @@ class Analysis:
     #
     def trim(self, start, stop):
         self.data_adjusted = self.data_adjusted[start:stop]
+        if self.x_axis is not None:
+            self.x_axis = self.x_axis[start:stop]
+        if self.frequency_axis is not None:
+            self.frequency_axis = self.frequency_axis[start:stop]
 
     ## method to normalize data by the largest element in data_adjusted
     #
@@ -88,17 +165,154 @@ class Analysis:
     def normalize(self):
         self.data_adjusted = self.data_adjusted/max(self.data_adjusted)
 
-    ## method to calculated the ratio of data_adjusted with another input
-    # array that must be of equal length
+    ## method to calculated the ratio of data_adjusted with another data
+    # set. If both have an x axis, e.g. the time axes of a sample and a
+    # reference channel, the other data set is first aligned to x_axis, or
+    # frequency_axis in the frequency domain (see align.align), so they may
+    # differ in length and start. Otherwise they must be of equal length
+    # and are divided element wise. Raises ValueError if they are not, or
+    # if one data set is in the frequency domain and the other is not
     #
     # @param self the object pointer
-    # param ratio_data the array which data_Adjusted will the element wise
-    #   divided by
+    # @param ratio_data the array which data_Adjusted will the element wise
+    #   divided by, or an Analysis whose data_adjusted and x_axis are used
+    # @param x 1D numpy array of the sorted positions of ratio_data, None if
+    #   unknown
+    # @param method str; how ratio_data is aligned, one of align.METHODS
+    # @param tolerance float; largest distance along x of the samples of
+    #   ratio_data taken, None for no limit. Samples of data_adjusted with
+    #   none within it become NaN
     #
-    def ratio(self, ratio_data):
-        if np.prod(self.data_adjusted.shape) == np.prod(ratio_data.shape):
+    def ratio(self, ratio_data, x = None, method = 'linear', tolerance = None):
+        if isinstance(ratio_data, Analysis):
+            if (ratio_data.frequency_axis is None) != (self.frequency_axis is None):
+                raise ValueError('Ratio of data in the frequency domain and '
+                    'data in the time domain')
+            x = ratio_data.x_axis if ratio_data.frequency_axis is None \
+                else ratio_data.frequency_axis
+            ratio_data = ratio_data.data_adjusted
+        ratio_data = np.asarray(ratio_data)
+        # in the frequency domain the data is aligned on its frequencies
+        own_x = self.x_axis if self.frequency_axis is None else self.frequency_axis
+        if own_x is not None and x is not None:
+            from data_analysis import align
+            self.data_adjusted = np.divide(self.data_adjusted,
+                align.align(own_x, x, ratio_data, method, tolerance))
+        elif np.prod(self.data_adjusted.shape) == np.prod(ratio_data.shape):
             self.data_adjusted = np.divide( 
                 self.data_adjusted,
                 ratio_data
                 )
+        else:
+            missing = [name for name, axis in (('the data', own_x),
+                ('ratio_data', x)) if axis is None]
+            raise ValueError('Data of {} and {} samples need aligning, but '
+                'the x axis of {} is missing'.format(self.data_adjusted.size,
+                ratio_data.size, ' and '.join(missing)))
+
+    ## method to interpolate data_adjusted from x_axis onto an evenly spaced
+    # grid, which becomes the new x_axis and sets sample_rate. Grid points
+    # outside x_axis are NaN
+    #
+    # @param self the object pointer
+    # @param grid 1D numpy array of evenly spaced positions, e.g. from
+    #   resample.common_grid. Defaults to num points spanning x_axis
+    # @param num int; points of the default grid, defaults to the number
+    #   of samples
+    # @param kind str; 'linear' or 'cubic' interpolation
+    #
+    def resample(self, grid = None, num = None, kind = 'linear'):
+        if self.x_axis is None:
+            raise ValueError('Resampling needs the x axis of the data')
+        if grid is None:
+            grid = resampling.uniform_grid(self.x_axis, num)
+        grid = np.asarray(grid, dtype = float)
+        self.data_adjusted = resampling.resample(self.x_axis,
+            self.data_adjusted, grid, kind)
+        self.x_axis = grid
+        if grid.size > 1 and grid[-1] != grid[0]:
+            self.sample_rate = (grid.size - 1)/(grid[-1] - grid[0])
+
+    ## method to smooth data_adjusted with a centered moving average
+    #
+    # @param self the object pointer
+    # @param window int; odd number of samples averaged
+    #
+    def moving_average(self, window):
+        self.data_adjusted = filters.moving_average(self.data_adjusted, window)
+
+    ## method to smooth data_adjusted with a Savitzky-Golay filter
+    #
+    # @param self the object pointer
+    # @param window int; odd number of samples in each polynomial fit
+    # @param order int; order of the fitted polynomial
+    #
+    def savitzky_golay(self, window, order = 3):
+        self.data_adjusted = filters.savitzky_golay(self.data_adjusted,
+            window, order)
+
+    ## method to smooth data_adjusted with a centered running median
+    #
+    # @param self the object pointer
+    # @param window int; odd number of samples in each median
+    #
+    def median_filter(self, window):
+        self.data_adjusted = filters.median(self.data_adjusted, window)
+
+    ## method to smooth data_adjusted with an exponential moving average
+    #
+    # @param self the object pointer
+    # @param alpha float in (0, 1]; weight of the newest sample
+    #
+    def exponential(self, alpha):
+        self.data_adjusted = filters.exponential(self.data_adjusted, alpha)
+
+    ## method to locate the peaks of data_adjusted, which is left unchanged.
+    # Positions are on x_axis if known and in samples otherwise, or in Hz in
+    # the frequency domain
+    #
+    # @param self the object pointer
+    # @param min_prominence float; peaks less prominent than this are ignored
+    # @returns LineIndex of the peaks, also kept in self.lines
+    #
+    def find_peaks(self, min_prominence = 0.0):
+        x = self.x_axis if self.frequency_axis is None else self.frequency_axis
+        self.lines = peaks.find_peaks(self.data_adjusted, x, min_prominence)
+        return self.lines
+
+    ## method to replace data_adjusted by its one sided amplitude spectrum,
+    # frequency_axis is set to the matching frequencies and x_axis cleared
+    #
+    # @param self the object pointer
+    # @param window str; window applied before the transform, None for none
+    #
+    def fft(self, window = None):
+        self.frequency_axis, spectrum = spectral.fft(
+            self.data_adjusted, self.sample_rate, window)
+        self.data_adjusted = np.abs(spectrum)
+        self.x_axis = None
+
+    ## method to replace data_adjusted by its Welch power spectral density,
+    # frequency_axis is set to the matching frequencies and x_axis cleared
+    #
+    # @param self the object pointer
+    # @param nperseg int; samples per averaged segment
+    # @param noverlap int; overlap between segments, defaults to half
+    #
+    def psd(self, nperseg = 1024, noverlap = None):
+        self.frequency_axis, self.data_adjusted = spectral.welch(
+            self.data_adjusted, self.sample_rate, nperseg, noverlap)
+        self.x_axis = None
+
+    ## method to compute the spectrogram of data_adjusted, which is left
+    # unchanged as the result is two dimensional
+    #
+    # @param self the object pointer
+    # @param nperseg int; samples per segment
+    # @param noverlap int; overlap between segments, defaults to an eighth
+    # @returns tuple of (frequencies, segment times, PSD per segment)
+    #
+    def spectrogram(self, nperseg = 256, noverlap = None):
+        return spectral.spectrogram(
+            self.data_adjusted, self.sample_rate, nperseg, noverlap)
 
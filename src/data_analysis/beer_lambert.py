@@ -0,0 +1,112 @@
+##
+# beer_lambert contains the fit behind the extinction coefficient
+# experiment. By the Beer-Lambert law the absorbance of a sample is
+#   A = -log10(I/I0) = epsilon * c * l
+# so for every wavelength the absorbance measured on samples of known
+# amount (concentration times path length) is a straight line whose slope is
+# the extinction coefficient. All wavelengths are fitted together: the
+# unweighted fit is one least-squares solve with a right hand side per
+# wavelength, the weighted fit one batched solve of the normal equations.
+#
+# Example with three samples measured at 200 wavelengths:
+# A = beer_lambert.absorbance(sample_signal, reference_signal)  # (3, 200)
+# fit = beer_lambert.fit(np.array([0.5, 1.0, 2.0]), A)
+# fit.coefficient, fit.coefficient_err
+
+import numpy as np
+
+## Result of a Beer-Lambert fit, one entry per wavelength in every array.
+class BeerLambertFit:
+
+    def __init__(self, coefficient, coefficient_err, intercept, intercept_err,
+            residual):
+        ## extinction coefficient, absorbance per unit of amount
+        self.coefficient = coefficient
+        ## one standard deviation uncertainty of coefficient
+        self.coefficient_err = coefficient_err
+        ## fitted absorbance at zero amount, zeros if not fitted
+        self.intercept = intercept
+        ## one standard deviation uncertainty of intercept
+        self.intercept_err = intercept_err
+        ## root mean square residual of the fit
+        self.residual = residual
+
+##
+# Absorbance of a sample relative to a reference signal
+#
+# @param sample numpy array of signal through the sample
+# @param reference numpy array of signal without the sample, broadcastable
+# @returns numpy array of absorbance, -log10(sample/reference)
+#
+def absorbance(sample, reference):
+    return -np.log10(np.asarray(sample, dtype = float)/reference)
+
+##
+# Uncertainty of absorbance given the uncertainty of both signals
+#
+# @param sample numpy array of signal through the sample
+# @param sample_err numpy array of uncertainty of sample
+# @param reference numpy array of signal without the sample
+# @param reference_err numpy array of uncertainty of reference
+# @returns numpy array of absorbance uncertainty
+#
+def absorbance_err(sample, sample_err, reference, reference_err):
+    return np.hypot(np.asarray(sample_err)/sample,
+        np.asarray(reference_err)/reference)/np.log(10)
+
+##
+# Fit absorbance against amount for every wavelength at once
+#
+# @param amounts 1D numpy array of k sample amounts (concentration times
+#   path length)
+# @param absorbance numpy array (k, m) of absorbance of each sample at each
+#   of m wavelengths
+# @param absorbance_err optional numpy array (k, m) of absorbance
+#   uncertainties. If given the fit is weighted and the uncertainties are
+#   propagated from them, otherwise they come from the scatter of the
+#   residuals, which needs more samples than fitted parameters
+# @param intercept bool; fit an absorbance offset as well as the slope,
+#   which absorbs a mismatch between the reference and the empty cell
+# @returns BeerLambertFit
+#
+def fit(amounts, absorbance, absorbance_err = None, intercept = True):
+    amounts = np.asarray(amounts, dtype = float)
+    absorbance = np.asarray(absorbance, dtype = float)
+    if absorbance.ndim == 1:
+        absorbance = absorbance[:, np.newaxis]
+    k = amounts.size
+    columns = [amounts, np.ones(k)] if intercept else [amounts]
+    design = np.stack(columns, axis = 1)
+    p = design.shape[1]
+
+    if absorbance_err is None:
+        if k < p:
+            raise ValueError('Need at least {} samples for this fit'.format(p))
+        beta, _, rank, _ = np.linalg.lstsq(design, absorbance, rcond = None)
+        if rank < p:
+            raise ValueError('Sample amounts do not determine the fit')
+        resid = absorbance - design @ beta
+        dof = k - p
+        if dof > 0:
+            scale = np.sum(resid**2, axis = 0)/dof
+        else:
+            scale = np.full(absorbance.shape[1], np.nan)
+        cov_diag = np.diag(np.linalg.inv(design.T @ design))
+        err = np.sqrt(cov_diag[:, np.newaxis]*scale)
+    else:
+        weights = 1.0/np.asarray(absorbance_err, dtype = float)**2
+        if weights.ndim == 1:
+            weights = weights[:, np.newaxis]
+        weights = np.broadcast_to(weights, absorbance.shape)
+        # normal equations for every wavelength, shape (m, p, p) and (m, p)
+        normal = np.einsum('ki,km,kj->mij', design, weights, design)
+        rhs = np.einsum('ki,km,km->mi', design, weights, absorbance)
+        beta = np.linalg.solve(normal, rhs[..., np.newaxis])[..., 0].T
+        err = np.sqrt(np.diagonal(np.linalg.inv(normal), axis1 = 1, axis2 = 2)).T
+        resid = absorbance - design @ beta
+
+    rms = np.sqrt(np.mean(resid**2, axis = 0))
+    if intercept:
+        return BeerLambertFit(beta[0], err[0], beta[1], err[1], rms)
+    zeros = np.zeros_like(beta[0])
+    return BeerLambertFit(beta[0], err[0], zeros, zeros, rms)
@@ -0,0 +1,249 @@
+##
+# compact contains the CompactLog class, a compact representation of
+# lock-in samples for long runs.
+#
+# Samples are kept as the lock-in gives them: timestamps in clock ticks and
+# x and y as float32, 8 bytes per sample instead of the 16 of float64 seconds
+# and magnitude. Timestamps are not stored one by one but as runs of equally
+# spaced ticks, each run a (first sample index, first tick, tick step), so
+# uniform sampling costs one run plus one per gap or rate change. When the
+# ticks are too irregular for runs to pay off, e.g. jittered timestamps, the
+# log falls back to keeping them raw as uint64. Times in
+# seconds and magnitudes are only computed when asked for, e.g. by
+# Analysis.from_compact.
+#
+# Example of recording and reading back:
+# log = CompactLog(clockbase = 60e6)
+# log.append(sample['timestamp'], sample['x'], sample['y'])
+# log.save('Data.npz')
+# log = CompactLog.load('Data.npz')
+# time_axis, data = log.time_axis(), log.magnitude()
+#
+
+import numpy as np
+
+# a run costs about as much memory as this many raw ticks
+_RUN_COST = 16
+# runs are kept regardless of cost up to this many
+_MIN_RUNS = 64
+
+
+class CompactLog:
+
+    ## initialize an empty log
+    #
+    # @param self the object pointer
+    # @param clockbase float; lock-in clock ticks per second
+    #
+    def __init__(self, clockbase):
+        ## float, lock-in clock ticks per second
+        self.clockbase = float(clockbase)
+        ## int, number of samples held
+        self.count = 0
+        # runs of equally spaced ticks as [first index, first tick, step],
+        # step being None while the run holds a single sample
+        self._runs = []
+        # uint64 chunks of raw ticks instead of runs, or None while runs pay off
+        self._ticks = None
+        self._x = []
+        self._y = []
+
+    ## method to add a chunk of samples, in time order
+    #
+    # @param self the object pointer
+    # @param ticks 1D array of timestamps in clock ticks
+    # @param x 1D array of in-phase components
+    # @param y 1D array of quadrature components
+    #
+    def append(self, ticks, x, y):
+        ticks = np.asarray(ticks, dtype = np.int64)
+        n = ticks.size
+        if n == 0:
+            return
+        # diffs[i] leads from sample i to i + 1, and the stretch of equal
+        # diffs holding diffs[i] ends at the first change at or after i
+        diffs = np.diff(ticks)
+        changes = np.flatnonzero(diffs[1:] != diffs[:-1])
+        if self._ticks is None and not self.__runs_pay_off(
+                len(self._runs) + changes.size // 2, self.count + n):
+            self._ticks = [self.ticks()]
+            self._runs = []
+        if self._ticks is not None:
+            self._ticks.append(ticks.astype(np.uint64))
+        else:
+            self.__append_runs(ticks, diffs, changes)
+            if not self.__runs_pay_off(len(self._runs), self.count + n):
+                self._ticks = [self.ticks(self.count + n)]
+                self._runs = []
+        self._x.append(np.asarray(x, dtype = np.float32))
+        self._y.append(np.asarray(y, dtype = np.float32))
+        self.count += n
+
+    ## method to tell if runs take less memory than the raw ticks would
+    #
+    # @param runs int; number of runs
+    # @param count int; number of samples
+    # @returns bool
+    #
+    @staticmethod
+    def __runs_pay_off(runs, count):
+        return runs <= _MIN_RUNS or runs * _RUN_COST <= count
+
+    ## method to extend the runs over a chunk of ticks; a run takes the step
+    # of its first two samples and holds every following sample that keeps it
+    #
+    # @param self the object pointer
+    # @param ticks 1D int64 array of timestamps in clock ticks
+    # @param diffs 1D array of the differences of ticks
+    # @param changes 1D array of the positions i where diffs[i + 1] != diffs[i]
+    #
+    def __append_runs(self, ticks, diffs, changes):
+        n = ticks.size
+
+        # position after the last sample held by a run of the given step
+        # that holds the sample at pos
+        def run_end(pos, step):
+            if pos == n - 1 or diffs[pos] != step:
+                return pos + 1
+            change = np.searchsorted(changes, pos)
+            return int(changes[change]) + 2 if change < changes.size else n
+
+        pos = 0
+        if self._runs:
+            index, tick, step = self._runs[-1]
+            if step is None:
+                # a single sample takes the step to the next, or a run of
+                # loaded equal ticks keeps 0
+                step = int(ticks[0]) - tick if index == self.count - 1 else 0
+                self._runs[-1][2] = step
+            if tick + (self.count - index) * step == ticks[0]:
+                pos = run_end(0, step)
+        while pos < n:
+            step = int(diffs[pos]) if pos < n - 1 else None
+            self._runs.append([self.count + pos, int(ticks[pos]), step])
+            pos = run_end(pos, step)
+
+    ## method to give the runs of ticks as arrays
+    #
+    # @param self the object pointer
+    # @returns tuple of (first sample index, first tick, tick step) arrays
+    #
+    def runs(self):
+        if self._ticks is not None:
+            ticks = self.ticks()
+            log = CompactLog(self.clockbase)
+            diffs = np.diff(ticks.astype(np.int64))
+            log.__append_runs(ticks, diffs, np.flatnonzero(diffs[1:] != diffs[:-1]))
+            return log.runs()
+        runs = np.array([[index, tick, step or 0] for index, tick, step in self._runs],
+            dtype = np.int64).reshape(-1, 3)
+        return runs[:, 0], runs[:, 1], runs[:, 2]
+
+    ## method to give the timestamps of every sample
+    #
+    # @param self the object pointer
+    # @param count int; number of samples the runs hold, by default count
+    # @returns 1D uint64 array of timestamps in clock ticks
+    #
+    def ticks(self, count = None):
+        if self._ticks is not None:
+            if len(self._ticks) > 1:
+                self._ticks = [np.concatenate(self._ticks)]
+            return self._ticks[0]
+        return self.__run_ticks(np.arange(self.count if count is None else count))
+
+    ## method to give the samples from an index on, converting none of the
+    # ones before it, e.g. to follow a log as it grows
+    #
+    # @param self the object pointer
+    # @param first int; index of the first sample to give
+    # @returns tuple of 1D arrays (uint64 ticks, float32 x, float32 y)
+    #
+    def tail(self, first):
+        first = min(max(first, 0), self.count)
+        if self._ticks is not None:
+            ticks = _tail(self._ticks, self.count, first, np.uint64)
+        else:
+            ticks = self.__run_ticks(np.arange(first, self.count))
+        return (ticks, _tail(self._x, self.count, first, np.float32),
+                _tail(self._y, self.count, first, np.float32))
+
+    def __run_ticks(self, samples):
+        index, tick, step = self.runs()
+        run = np.searchsorted(index, samples, side = 'right') - 1
+        return (tick[run] + (samples - index[run]) * step[run]).astype(np.uint64)
+
+    ## method to give the time of every sample
+    #
+    # @param self the object pointer
+    # @returns 1D float64 array of times in seconds
+    #
+    def time_axis(self):
+        return self.ticks() / self.clockbase
+
+    ## method to give the in-phase and quadrature components
+    #
+    # @param self the object pointer
+    # @returns tuple of 1D float32 arrays (x, y)
+    #
+    def xy(self):
+        if self.count == 0:
+            return np.empty(0, np.float32), np.empty(0, np.float32)
+        if len(self._x) > 1:
+            self._x = [np.concatenate(self._x)]
+            self._y = [np.concatenate(self._y)]
+        return self._x[0], self._y[0]
+
+    ## method to give the magnitude of every sample
+    #
+    # @param self the object pointer
+    # @returns 1D float64 array of magnitudes
+    #
+    def magnitude(self):
+        x, y = self.xy()
+        return np.hypot(x.astype(np.float64), y.astype(np.float64))
+
+    ## method to write the log to a .npz file
+    #
+    # @param self the object pointer
+    # @param path str; file to write
+    #
+    def save(self, path):
+        x, y = self.xy()
+        with open(path, 'wb') as f:
+            if self._ticks is not None:
+                np.savez(f, clockbase = self.clockbase, ticks = self.ticks(), x = x, y = y)
+                return
+            index, tick, step = self.runs()
+            np.savez(f, clockbase = self.clockbase, run_index = index,
+                run_tick = tick, run_step = step, x = x, y = y)
+
+    ## method to read a log written by save
+    #
+    # @param path str; file to read
+    # @returns CompactLog
+    #
+    @staticmethod
+    def load(path):
+        with np.load(path) as f:
+            log = CompactLog(f['clockbase'])
+            if 'ticks' in f:
+                log._ticks = [f['ticks']]
+            else:
+                log._runs = [[int(index), int(tick), int(step) or None] for index, tick, step
+                    in zip(f['run_index'], f['run_tick'], f['run_step'])]
+            log._x = [f['x']]
+            log._y = [f['y']]
+            log.count = f['x'].size
+        return log
+
+
+## the entries from index first on of chunks holding count entries in all
+def _tail(chunks, count, first, dtype):
+    parts = []
+    for chunk in reversed(chunks):
+        if count <= first:
+            break
+        parts.append(chunk[max(first - (count - chunk.size), 0):])
+        count -= chunk.size
+    return np.concatenate(parts[::-1]) if parts else np.empty(0, dtype)
@@ -1,7 +1,8 @@
 ## 
 # display contains the Display class which takes in an Analysis class as input
 # and handles all plotting and interaction with plots. Also contains methods
-# to save data to csv file
+# to save data to csv file, and the GridDisplay class which shows a GridMap
+# as a heatmap while a grid scan fills it
 
 import numpy as np
 import matplotlib.pyplot as plt
@@ -9,7 +10,8 @@ from matplotlib.widgets import TextBox, Button
 import os
 from datetime import date
 import csv
-from analysis import *
+from threading import Thread
+from data_analysis.analysis import Analysis
 
 
 ## Display class handles all plotting and interactions
@@ -34,6 +36,13 @@ class Display:
         # set entered or the left most plot, use Num = 0
         self.Num = 0
 
+        ## smooth_window: int, odd window length used by the smoothing
+        # buttons, the exponential filter uses alpha = 2/(smooth_window + 1)
+        self.smooth_window = 11
+
+        ## min_prominence: float, peaks less prominent are not marked
+        self.min_prominence = 0.0
+
         # creating subplots given number requested
         # for 1-3 plots, just lay out in a row
         if self._NumPlots == 1:
@@ -76,7 +85,8 @@ class Display:
     def place_buttons(self):
 
         # adjust all subplots to make room for buttons
-        self.fig.subplots_adjust(left = 0.18, bottom = 0.2, wspace = 0.2)
+        self.fig.subplots_adjust(left = 0.18, right = 0.86, bottom = 0.2,
+            wspace = 0.2)
         self.fig.suptitle('Alira Laser Data Plotting')
 
         # placing reset button
@@ -122,6 +132,45 @@ class Display:
         self._text_save = TextBox(axtext_save, 'Save Adjusted Data (.csv):',
             initial = 'DataAdjusted')
         self._text_save.on_submit(self.saveData)
+
+        # placing power spectral density button in the right hand column
+        axbutton_psd = plt.axes([0.89, 0.90, 0.08, 0.05])
+        self._button_psd = Button(axbutton_psd, 'PSD')
+        self._button_psd.on_clicked(self.psd)
+
+        # text box for the window length used by the smoothing buttons
+        axtext_window = plt.axes([0.91, 0.80, 0.06, 0.05])
+        self._text_window = TextBox(axtext_window, 'Window:',
+            initial = str(self.smooth_window))
+        self._text_window.on_submit(self.window_change)
+
+        # placing smoothing buttons
+        axbutton_mav = plt.axes([0.89, 0.70, 0.08, 0.05])
+        self._button_mav = Button(axbutton_mav, 'Moving Avg')
+        self._button_mav.on_clicked(self.moving_average)
+
+        axbutton_sgf = plt.axes([0.89, 0.60, 0.08, 0.05])
+        self._button_sgf = Button(axbutton_sgf, 'Savitzky-Golay')
+        self._button_sgf.on_clicked(self.savitzky_golay)
+
+        axbutton_med = plt.axes([0.89, 0.50, 0.08, 0.05])
+        self._button_med = Button(axbutton_med, 'Median')
+        self._button_med.on_clicked(self.median_filter)
+
+        axbutton_exp = plt.axes([0.89, 0.40, 0.08, 0.05])
+        self._button_exp = Button(axbutton_exp, 'Exponential')
+        self._button_exp.on_clicked(self.exponential)
+
+        # text box for the minimum prominence used when finding peaks
+        axtext_prom = plt.axes([0.91, 0.30, 0.06, 0.05])
+        self._text_prom = TextBox(axtext_prom, 'Prominence:',
+            initial = str(self.min_prominence))
+        self._text_prom.on_submit(self.prominence_change)
+
+        # placing peak finding button
+        axbutton_pks = plt.axes([0.89, 0.20, 0.08, 0.05])
+        self._button_pks = Button(axbutton_pks, 'Find Peaks')
+        self._button_pks.on_clicked(self.find_peaks)
  
 
     ## method to append data to specified subplot
@@ -133,21 +182,25 @@ class Display:
     # @param line_style sets line style, default is just a normal line
     #
     def subplot_data(self, plot_num, line_style = '-'):
-       
-        if plot_num == 0:
-            self.lines[0] = self.subplots[0].plot(
-                self.data[0].data_adjusted, line_style)
-        elif plot_num == 1:
-             self.lines[1] = self.subplots[1].plot(
-                 self.data[1].data_adjusted, line_style)
-        elif plot_num == 2:
-            self.lines[2] = self.subplots[2].plot(
-                 self.data[2].data_adjusted, line_style)
-        elif plot_num == 3:
-             self.lines[3] = self.subplots[3].plot(
-                self.data[3].data_adjusted, line_style)
+
+        if plot_num not in range(0, 4):
+            print('Data not found for plot')
+            return
+
+        data = self.data[plot_num]
+        subplot = self.subplots[plot_num]
+        # data in the frequency domain is drawn against its frequencies
+        if data.frequency_axis is not None:
+            self.lines[plot_num] = subplot.semilogy(
+                data.frequency_axis, data.data_adjusted, line_style)
+            subplot.set_xlabel('Frequency (Hz)')
+        # and otherwise against its x axis if known, where peaks are marked
+        elif data.x_axis is not None:
+            self.lines[plot_num] = subplot.plot(
+                data.x_axis, data.data_adjusted, line_style)
         else:
-             print('Data not found for plot')
+            self.lines[plot_num] = subplot.plot(
+                data.data_adjusted, line_style)
 
 
     ## method to restore adjusted data back to the raw original
@@ -205,6 +258,100 @@ class Display:
         self.subplot_data(plot_num = self.Num)
 
 
+    ## method to show the power spectral density of specified data set
+    # calls Analysis.psd() on specifed data set
+    #
+    # @param self the object pointer
+    # @param event click action on button, activates method
+    #
+    def psd(self, event):
+        self.data[self.Num].psd()
+
+        self.subplots[self.Num].cla()
+        self.subplot_data(plot_num = self.Num)
+
+    ## method to smooth specified data set with a moving average
+    # calls Analysis.moving_average() with smooth_window
+    #
+    # @param self the object pointer
+    # @param event click action on button, activates method
+    #
+    def moving_average(self, event):
+        self.data[self.Num].moving_average(self.smooth_window)
+
+        self.subplots[self.Num].cla()
+        self.subplot_data(plot_num = self.Num)
+
+    ## method to smooth specified data set with a Savitzky-Golay filter
+    # calls Analysis.savitzky_golay() with smooth_window
+    #
+    # @param self the object pointer
+    # @param event click action on button, activates method
+    #
+    def savitzky_golay(self, event):
+        self.data[self.Num].savitzky_golay(self.smooth_window)
+
+        self.subplots[self.Num].cla()
+        self.subplot_data(plot_num = self.Num)
+
+    ## method to smooth specified data set with a running median
+    # calls Analysis.median_filter() with smooth_window
+    #
+    # @param self the object pointer
+    # @param event click action on button, activates method
+    #
+    def median_filter(self, event):
+        self.data[self.Num].median_filter(self.smooth_window)
+
+        self.subplots[self.Num].cla()
+        self.subplot_data(plot_num = self.Num)
+
+    ## method to smooth specified data set with an exponential average
+    # calls Analysis.exponential() with the alpha matching smooth_window
+    #
+    # @param self the object pointer
+    # @param event click action on button, activates method
+    #
+    def exponential(self, event):
+        self.data[self.Num].exponential(2.0/(self.smooth_window + 1))
+
+        self.subplots[self.Num].cla()
+        self.subplot_data(plot_num = self.Num)
+
+    ## method to mark the peaks of specified data set on its plot
+    # calls Analysis.find_peaks() with min_prominence
+    #
+    # @param self the object pointer
+    # @param event click action on button, activates method
+    #
+    def find_peaks(self, event):
+        lines = self.data[self.Num].find_peaks(self.min_prominence)
+
+        self.subplots[self.Num].cla()
+        self.subplot_data(plot_num = self.Num)
+        self.subplots[self.Num].plot(lines.center, lines.height, 'rv')
+        print('{} peaks found'.format(len(lines)))
+
+    ## method to change the minimum prominence of marked peaks
+    #
+    # @param self the object pointer
+    # @param text text input from textbox, must be a number
+    #
+    def prominence_change(self, text):
+        self.min_prominence = float(text)
+
+    ## method to change the window length used by the smoothing buttons
+    #
+    # @param self the object pointer
+    # @param text text input from textbox, must be an odd int
+    #
+    def window_change(self, text):
+        window = int(text)
+        if window < 1 or window % 2 == 0:
+            print('please enter an odd window length')
+            return
+        self.smooth_window = window
+
     ## method to change which data set is being altered, ie change Num
     #
     # @param self the object pointer
@@ -251,7 +398,7 @@ class Display:
 
 
     ## method to take the ratio of current specified data set with another
-    # data set. 
+    # data set, aligned on their x axes if both have one.
     # Calls method Analysis.ratio()
     #
     # @param self the object pointer
@@ -264,7 +411,11 @@ class Display:
     def ratio(self, text):
         ratio_number = int(text)
 
-        self.data[self.Num].ratio(self.data[ratio_number].data_adjusted)
+        try:
+            self.data[self.Num].ratio(self.data[ratio_number])
+        except ValueError as e:
+            print(e)
+            return
 
         self.subplots[self.Num].cla()
         self.subplot_data(plot_num = self.Num)
@@ -307,3 +458,88 @@ class Display:
     def show(self):
         plt.show()
 
+
+## Edges of the cells centred on the given sorted values, halfway between
+# neighbours and as far out at the ends
+#
+# @param centers 1D numpy array of sorted cell centres
+# @returns 1D numpy array of one more edge than centres
+#
+def cell_edges(centers):
+    if centers.size == 1:
+        return centers[0] + np.array([-0.5, 0.5])
+    middle = (centers[1:] + centers[:-1])/2
+    return np.concatenate(([2*centers[0] - middle[0]], middle,
+        [2*centers[-1] - middle[-1]]))
+
+
+## GridDisplay class shows the mean of every cell of a GridMap as a heatmap
+# of wavelength against current. Unfilled cells are left blank and the map
+# is redrawn on a refresh timer whenever a cell was filled, so a grid scan
+# can be watched cell by cell.
+#
+# Example of watching a grid scan while it runs:
+# scan = GridScan.builder() ... .build()
+# GridDisplay(scan.grid).show(scan)
+#
+class GridDisplay:
+
+    ## initialize object by creating the figure and the refresh timer
+    #
+    # @param self the object pointer
+    # @param grid GridMap to draw
+    # @param max_fps maximum number of redraws per second
+    #
+    def __init__(self, grid, max_fps = 4):
+        ## grid: GridMap the heatmap is drawn from
+        self.grid = grid
+
+        self.fig, self.ax = plt.subplots(1,1, figsize = [10.0, 7.0])
+        self.fig.suptitle('Alira Laser Grid Scan')
+        self.ax.set_xlabel('Current (mA)')
+        self.ax.set_ylabel('Wavelength (cm$^{-1}$)')
+        ## mesh: matplotlib QuadMesh holding one quad per cell
+        self.mesh = self.ax.pcolormesh(cell_edges(grid.currents),
+            cell_edges(grid.wavelengths), np.ma.masked_invalid(grid.mean))
+        self.fig.colorbar(self.mesh, ax = self.ax, label = 'Signal')
+
+        self._last_fills = None
+
+        ## timer: matplotlib timer driving refresh, at most max_fps per second
+        self.timer = self.fig.canvas.new_timer(
+            interval = int(np.ceil(1000.0/max_fps)))
+        self.timer.add_callback(self.refresh)
+        self.refresh()
+
+    ## method to redraw the heatmap from the map. Does nothing if no cell
+    # was filled since the last redraw.
+    #
+    # @param self the object pointer
+    #
+    def refresh(self):
+        if self.grid.fills == self._last_fills:
+            return
+
+        self._last_fills = self.grid.fills
+        mean = np.ma.masked_invalid(self.grid.mean.copy())
+        self.mesh.set_array(mean)
+        if mean.count():
+            self.mesh.set_clim(mean.min(), mean.max())
+        self.fig.canvas.draw_idle()
+
+    ## method to show the heatmap. The plot has to own the main thread, so
+    # if a scan is given it is run in a background thread.
+    #
+    # @param self the object pointer
+    # @param scan optional built GridScan filling the map
+    # @returns the thread running the scan, or None
+    #
+    def show(self, scan = None):
+        runner = None
+        if scan is not None:
+            runner = Thread(target = scan.run, name = "grid_scan_thread",
+                daemon = True)
+            runner.start()
+        self.timer.start()
+        plt.show()
+        return runner
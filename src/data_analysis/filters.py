@@ -0,0 +1,193 @@
+##
+# filters contains the smoothing filters used by Analysis: a moving average
+# built on cumulative sums, Savitzky-Golay, median and an exponential (single
+# pole IIR) filter. Each filter exists twice: as a function over a whole
+# trace, and as a stream object that is fed the trace chunk by chunk (for
+# instance the per-poll chunks of Laser.data) and emits exactly the same
+# output, including at the edges of the trace.
+#
+# The centered filters need half a window of future samples before an output
+# is final, so their streams lag the input by half a window and the last half
+# window comes out of flush().
+#
+# Example of smoothing acquisition chunks as they arrive:
+# stream = filters.MovingAverageStream(25)
+# smoothed = [stream.process(chunk) for chunk in laser.get().data]
+# smoothed.append(stream.flush())
+
+from abc import ABC, abstractmethod
+import numpy as np
+
+## check a centered window length and return half of it
+def _half_window(window):
+    if window < 1 or window % 2 == 0:
+        raise ValueError('Window length must be a positive odd integer')
+    return window // 2
+
+##
+# Centered moving average in O(n) using cumulative sums. Near the edges the
+# average is taken over the samples that exist.
+#
+# @param x 1D numpy array to smooth
+# @param window int; odd number of samples averaged
+# @returns smoothed 1D numpy array
+#
+def moving_average(x, window):
+    half = _half_window(window)
+    x = np.asarray(x, dtype = float)
+    n = x.size
+    sums = np.concatenate(([0.0], np.cumsum(x)))
+    idx = np.arange(n)
+    lo = np.maximum(idx - half, 0)
+    hi = np.minimum(idx + half + 1, n)
+    return (sums[hi] - sums[lo])/(hi - lo)
+
+##
+# Savitzky-Golay filter. The edges are smoothed by fitting the polynomial to
+# the first and last window.
+#
+# @param x 1D numpy array to smooth, at least window samples long
+# @param window int; odd number of samples in each fit
+# @param order int; polynomial order, less than window
+# @returns smoothed 1D numpy array
+#
+def savitzky_golay(x, window, order = 3):
+    _half_window(window)
+    # scipy.signal and scipy.ndimage are slow to import, so only when used
+    from scipy import signal
+    return signal.savgol_filter(np.asarray(x, dtype = float), window, order,
+        mode = 'interp')
+
+##
+# Centered running median. Near the edges the first and last samples are
+# repeated to fill the window.
+#
+# @param x 1D numpy array to smooth
+# @param window int; odd number of samples in each median
+# @returns smoothed 1D numpy array
+#
+def median(x, window):
+    _half_window(window)
+    from scipy import ndimage
+    return ndimage.median_filter(np.asarray(x, dtype = float), size = window,
+        mode = 'nearest')
+
+##
+# Exponential moving average y[i] = alpha*x[i] + (1 - alpha)*y[i-1], started
+# at y[0] = x[0]. This is causal, so unlike the other filters it delays the
+# trace.
+#
+# @param x 1D numpy array to smooth
+# @param alpha float in (0, 1]; weight of the newest sample
+# @returns smoothed 1D numpy array
+#
+def exponential(x, alpha):
+    x = np.asarray(x, dtype = float)
+    if x.size == 0:
+        return x
+    return ExponentialStream(alpha).process(x)
+
+## Base of the centered filter streams. Keeps the last window of input so
+# that every emitted output is computed from the same samples the whole
+# trace function would use.
+class _CenteredStream(ABC):
+
+    def __init__(self, window):
+        ## int, odd number of samples in the filter window
+        self.window = window
+        self._half = _half_window(window)
+        self._tail = np.empty(0)
+        self._seen = 0
+        self._emitted = 0
+
+    ## whole trace version of the filter, implemented by subclasses
+    @abstractmethod
+    def _filter(self, x):
+        return
+
+    ## @brief Feed the next chunk of the trace.
+    #
+    #  @param chunk 1D array of new samples.
+    #  @returns 1D array of the outputs that became final, possibly empty.
+    def process(self, chunk):
+        chunk = np.asarray(chunk, dtype = float)
+        buf = np.concatenate((self._tail, chunk))
+        start = self._seen - self._tail.size
+        self._seen += chunk.size
+        self._tail = buf[-self.window:]
+        if buf.size < self.window:
+            return np.empty(0)
+        return self._emit(self._filter(buf), start, buf.size - self._half)
+
+    ## @brief Signal the end of the trace.
+    #
+    #  @returns 1D array of the outputs still held back, the trailing edge.
+    def flush(self):
+        if self._seen == 0:
+            return np.empty(0)
+        start = self._seen - self._tail.size
+        return self._emit(self._filter(self._tail), start, self._tail.size)
+
+    ## return outputs from the last emitted one up to buffer index stop
+    def _emit(self, y, start, stop):
+        lo = self._emitted - start
+        if stop <= lo:
+            return np.empty(0)
+        self._emitted = start + stop
+        return y[lo:stop]
+
+## Streaming form of moving_average.
+class MovingAverageStream(_CenteredStream):
+
+    def _filter(self, x):
+        return moving_average(x, self.window)
+
+## Streaming form of savitzky_golay.
+class SavitzkyGolayStream(_CenteredStream):
+
+    def __init__(self, window, order = 3):
+        super().__init__(window)
+        ## int, polynomial order
+        self.order = order
+
+    def _filter(self, x):
+        return savitzky_golay(x, self.window, self.order)
+
+## Streaming form of median.
+class MedianStream(_CenteredStream):
+
+    def _filter(self, x):
+        return median(x, self.window)
+
+## Streaming form of exponential. The filter state is carried from one chunk
+# to the next, so there is no lag and flush() never has anything left.
+class ExponentialStream:
+
+    def __init__(self, alpha):
+        if not 0 < alpha <= 1:
+            raise ValueError('alpha must be in (0, 1]')
+        ## float, weight of the newest sample
+        self.alpha = alpha
+        self._b = np.array([alpha])
+        self._a = np.array([1.0, alpha - 1.0])
+        self._state = None
+
+    ## @brief Feed the next chunk of the trace.
+    #
+    #  @param chunk 1D array of new samples.
+    #  @returns 1D array of smoothed samples, same length as chunk.
+    def process(self, chunk):
+        chunk = np.asarray(chunk, dtype = float)
+        if chunk.size == 0:
+            return chunk
+        if self._state is None:
+            self._state = np.array([(1.0 - self.alpha)*chunk[0]])
+        from scipy import signal
+        y, self._state = signal.lfilter(self._b, self._a, chunk, zi = self._state)
+        return y
+
+    ## @brief Signal the end of the trace.
+    #
+    #  @returns empty array, present so all streams can be used alike.
+    def flush(self):
+        return np.empty(0)
@@ -0,0 +1,103 @@
+##
+# grid_map contains the GridMap class, which holds the lock-in signal
+# mapped over a grid of wavelengths and currents, one cell per pair.
+#
+# The values are kept in a single preallocated array of shape
+# (wavelengths, currents, 3), the last axis being the mean, standard error
+# and number of samples of each cell, so a map is filled cell by cell as a
+# scan runs without any post-hoc slicing. Cells not measured yet are NaN,
+# so a partly filled map can be plotted, saved and later resumed.
+#
+# Example of reading back a saved map:
+# grid = GridMap.load('map.npz')
+# grid.mean[grid.filled]
+#
+
+import os
+import numpy as np
+from data_analysis import reduction
+
+## Names of the entries along the last axis of GridMap.values
+STATS = ('mean', 'err', 'count')
+
+
+class GridMap:
+
+    ## initialize an empty map over the given axes
+    #
+    # @param self the object pointer
+    # @param wavelengths 1D array-like of the wavelengths, the rows
+    # @param currents 1D array-like of the currents, the columns
+    #
+    def __init__(self, wavelengths, currents):
+        ## 1D numpy array, wavelength of every row
+        self.wavelengths = np.asarray(wavelengths, dtype = float)
+        ## 1D numpy array, current of every column
+        self.currents = np.asarray(currents, dtype = float)
+        ## 3D numpy array of shape (wavelengths, currents, 3) holding the
+        # mean, standard error and count of every cell, NaN where unfilled
+        self.values = np.full((self.wavelengths.size, self.currents.size,
+            len(STATS)), np.nan)
+        ## int, number of cells filled so far, counts up on every fill so
+        # readers on other threads can tell when the map changed
+        self.fills = 0
+
+    ## 2D numpy array, mean of every cell
+    @property
+    def mean(self):
+        return self.values[:, :, 0]
+
+    ## 2D numpy array, standard error of the mean of every cell
+    @property
+    def err(self):
+        return self.values[:, :, 1]
+
+    ## 2D numpy array, number of samples of every cell
+    @property
+    def count(self):
+        return self.values[:, :, 2]
+
+    ## 2D boolean numpy array, whether every cell holds at least one sample
+    @property
+    def filled(self):
+        return self.count > 0
+
+    ## method to reduce the samples of a time window into a cell
+    #
+    # @param self the object pointer
+    # @param row int; index of the wavelength
+    # @param column int; index of the current
+    # @param time_axis 1D numpy array of sample times
+    # @param data 1D numpy array of samples
+    # @param start float; start of the window in seconds, included
+    # @param stop float; end of the window in seconds, excluded
+    #
+    def fill(self, row, column, time_axis, data, start, stop):
+        mean, err, count = reduction.reduce_windows(time_axis, data, [start], [stop])
+        self.values[row, column] = (mean[0], err[0], count[0])
+        self.fills += 1
+
+    ## method to save the map to an .npz file. The file is replaced
+    # atomically so an interrupted save leaves the previous map readable
+    #
+    # @param self the object pointer
+    # @param path str; file to save to
+    #
+    def save(self, path):
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, wavelengths = self.wavelengths, currents = self.currents,
+                values = self.values)
+        os.replace(path + '.tmp', path)
+
+    ## method to load a map saved by save
+    #
+    # @param path str; file saved by GridMap.save
+    # @returns GridMap with the saved axes and values
+    #
+    @staticmethod
+    def load(path):
+        with np.load(path) as f:
+            grid = GridMap(f['wavelengths'], f['currents'])
+            grid.values[...] = f['values']
+        grid.fills = int(np.count_nonzero(grid.filled))
+        return grid
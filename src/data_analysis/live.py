@@ -0,0 +1,135 @@
+##
+# live contains the LiveDisplay class which plots the acquisition of a running
+# experiment. It only ever reads snapshots of a laser's LiveFeed on a capped
+# refresh timer, so drawing can never hold up data collection or the
+# experiment's control loop.
+
+import numpy as np
+import matplotlib.pyplot as plt
+from threading import Thread
+
+##
+# Reduce a trace to at most max_points points for plotting. The trace is
+# split into equal buckets and the minimum and maximum of every bucket are
+# kept, so spikes and dropouts stay visible however far the view is zoomed out.
+#
+# @param time_axis 1D numpy array of sample times
+# @param data 1D numpy array of samples, same length as time_axis
+# @param max_points int; maximum number of points returned
+# @returns tuple of decimated (time_axis, data)
+#
+def decimate(time_axis, data, max_points):
+    n = data.size
+    if n <= max_points:
+        return time_axis, data
+
+    buckets = max(max_points // 2, 1)
+    size = n // buckets
+    used = buckets * size
+    # the oldest samples that don't fill a whole bucket are dropped
+    t = time_axis[n - used:].reshape(buckets, size)
+    d = data[n - used:].reshape(buckets, size)
+    rows = np.arange(buckets)
+    lo = np.argmin(d, axis=1)
+    hi = np.argmax(d, axis=1)
+    first = np.minimum(lo, hi)
+    second = np.maximum(lo, hi)
+
+    time_out = np.empty(2*buckets)
+    data_out = np.empty(2*buckets)
+    time_out[0::2] = t[rows, first]
+    time_out[1::2] = t[rows, second]
+    data_out[0::2] = d[rows, first]
+    data_out[1::2] = d[rows, second]
+    return time_out, data_out
+
+## LiveDisplay class plots the latest samples of a LiveFeed, overlaid with
+# the setpoint markers recorded by set_field.
+#
+# Example of watching an experiment while it runs:
+# feed = laser.get().live_feed
+# LiveDisplay(feed).show(experiment)
+#
+class LiveDisplay:
+
+    ## initialize object by creating the figure and the refresh timer
+    #
+    # @param self the object pointer
+    # @param feed LiveFeed to read snapshots from
+    # @param max_fps maximum number of redraws per second
+    # @param max_points maximum number of points drawn per refresh
+    # @param span number of most recent samples shown, defaults to all
+    #   samples retained by the feed
+    #
+    def __init__(self, feed, max_fps = 10, max_points = 4000, span = None):
+        ## feed: LiveFeed the plot is drawn from
+        self.feed = feed
+        ## max_points: int, decimation target for each redraw
+        self.max_points = max_points
+        ## span: int or None, number of samples shown
+        self.span = span
+
+        self.fig, self.ax = plt.subplots(1,1, figsize = [14.0, 7.0])
+        self.fig.suptitle('Alira Laser Live Acquisition')
+        self.ax.set_xlabel('Time (s)')
+        ## line: matplotlib line holding the decimated trace
+        self.line, = self.ax.plot([], [], '-')
+
+        self._marker_artists = []
+        self._last_written = -1
+        self._last_markers = None
+
+        ## timer: matplotlib timer driving refresh, at most max_fps per second
+        self.timer = self.fig.canvas.new_timer(
+            interval = int(np.ceil(1000.0/max_fps)))
+        self.timer.add_callback(self.refresh)
+
+    ## method to redraw the plot from the latest feed snapshot. Does nothing
+    # if neither samples nor markers have arrived since the last redraw.
+    #
+    # @param self the object pointer
+    #
+    def refresh(self):
+        if (self.feed.written == self._last_written and
+            self.feed.markers is self._last_markers):
+            return
+
+        self._last_written = self.feed.written
+        time_axis, data, markers = self.feed.snapshot(self.span)
+        self._last_markers = markers
+        time_axis, data = decimate(time_axis, data, self.max_points)
+        self.line.set_data(time_axis, data)
+
+        for artist in self._marker_artists:
+            artist.remove()
+        self._marker_artists = []
+        if time_axis.size:
+            for t, field_name, value in markers:
+                if t >= time_axis[0]:
+                    self._marker_artists.append(
+                        self.ax.axvline(t, color = 'r', linestyle = '--'))
+                    self._marker_artists.append(
+                        self.ax.text(t, 1.0, ' {}={}'.format(field_name, value),
+                            transform = self.ax.get_xaxis_transform(),
+                            va = 'top', color = 'r'))
+
+        self.ax.relim()
+        self.ax.autoscale_view()
+        self.fig.canvas.draw_idle()
+
+    ## method to show the live plot. The plot has to own the main thread,
+    # so if an experiment is given it is run in a background thread.
+    #
+    # @param self the object pointer
+    # @param experiment optional built Experiment to run while plotting
+    # @returns the thread running the experiment, or None
+    #
+    def show(self, experiment = None):
+        runner = None
+        if experiment is not None:
+            runner = Thread(target = experiment.run, name = "experiment_thread",
+                daemon = True)
+            runner.start()
+        self.timer.start()
+        plt.show()
+        return runner
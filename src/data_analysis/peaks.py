@@ -0,0 +1,182 @@
+##
+# peaks contains the peak finder used to locate absorption lines and the
+# LineIndex it produces. Peaks are found in every row of a 2D array of scans
+# at once: the rows are laid end to end, separated by +inf so that no
+# prominence search can cross from one scan into the next, and the whole
+# batch goes through scipy's prominence and width routines in one call.
+#
+# Each peak is reported with
+#   - center: sub-sample position from a parabola through the top 3 samples
+#   - height: height of that parabola's vertex
+#   - prominence: height above the higher of its two surrounding minima
+#   - width: full width at half prominence
+#   - area: integral above the prominence base, out to where the signal
+#     falls back to it but no further than three half widths from the top,
+#     so that a neighbouring line on the same base is not included
+# in the units of the scan's x axis if one is given, else in samples.
+#
+# Example of tracking the drift of three reference lines over 200 scans:
+# lines = peaks.find_peaks_batch(scans, wavenumbers, min_prominence = 0.01)
+# drift = peaks.track_drift(lines, [1012.3, 1040.8, 1101.1], tolerance = 0.5)
+
+import warnings
+import numpy as np
+
+## Sorted index of spectral lines. Lines are ordered by center so that
+# ranges can be looked up by binary search.
+class LineIndex:
+
+    def __init__(self, center, width, area, height, prominence):
+        order = np.argsort(center, kind = 'stable')
+        ## line centers, ascending
+        self.center = np.asarray(center, dtype = float)[order]
+        ## full widths at half prominence
+        self.width = np.asarray(width, dtype = float)[order]
+        ## integrated areas above the base
+        self.area = np.asarray(area, dtype = float)[order]
+        ## peak heights
+        self.height = np.asarray(height, dtype = float)[order]
+        ## peak prominences
+        self.prominence = np.asarray(prominence, dtype = float)[order]
+
+    def __len__(self):
+        return self.center.size
+
+    ## @brief Lines whose center lies in [low, high], in O(log n).
+    #
+    #  @param low Lower bound of the range.
+    #  @param high Upper bound of the range.
+    #  @returns LineIndex of the lines in range, sharing memory with this one.
+    def query(self, low, high):
+        lo = np.searchsorted(self.center, low, side = 'left')
+        hi = np.searchsorted(self.center, high, side = 'right')
+        part = LineIndex.__new__(LineIndex)
+        for name in ('center', 'width', 'area', 'height', 'prominence'):
+            setattr(part, name, getattr(self, name)[lo:hi])
+        return part
+
+    ## @brief Match reference line centers to the nearest line of this index.
+    #
+    #  @param reference 1D array of reference centers, in any order.
+    #  @param tolerance Largest allowed distance between matched centers.
+    #  @returns Tuple of (index into this LineIndex per reference line or -1
+    #           where none lies within tolerance, center minus reference,
+    #           NaN where unmatched).
+    def match(self, reference, tolerance):
+        reference = np.asarray(reference, dtype = float)
+        if len(self) == 0:
+            return (np.full(reference.shape, -1),
+                    np.full(reference.shape, np.nan))
+        right = np.clip(np.searchsorted(self.center, reference), 1, len(self) - 1)
+        left = right - 1
+        if len(self) == 1:
+            left = right = np.zeros(reference.shape, dtype = int)
+        nearest = np.where(
+            np.abs(self.center[left] - reference) <= np.abs(self.center[right] - reference),
+            left, right)
+        offset = self.center[nearest] - reference
+        found = np.abs(offset) <= tolerance
+        return np.where(found, nearest, -1), np.where(found, offset, np.nan)
+
+## position along x of fractional sample indices
+def _to_x(positions, x, n):
+    if x is None:
+        return positions
+    return np.interp(positions, np.arange(n), x)
+
+##
+# Find the peaks of every scan in a batch
+#
+# @param scans numpy array (n scans, m samples), or 1D for a single scan
+# @param x optional 1D numpy array of m x values shared by all scans, for
+#   instance the wavenumbers of a wavelength scan. Must be monotonic
+# @param min_prominence float; peaks less prominent than this are dropped
+# @returns list of LineIndex, one per scan
+#
+def find_peaks_batch(scans, x = None, min_prominence = 0.0):
+    scans = np.atleast_2d(np.asarray(scans, dtype = float))
+    rows, n = scans.shape
+    stride = n + 1
+
+    # local maxima, the left edge of a flat top counts as the maximum
+    inner = ((scans[:, 1:-1] > scans[:, :-2]) & (scans[:, 1:-1] >= scans[:, 2:]))
+    row, col = np.nonzero(inner)
+    col = col + 1
+
+    padded = np.full((rows, stride), np.inf)
+    padded[:, :n] = scans
+    flat = padded.ravel()
+    position = row*stride + col
+
+    # scipy.signal is slow to import, so only when peaks are first searched
+    from scipy import signal
+    # candidates of zero prominence, e.g. on plateaus, are dropped below,
+    # so the warning scipy gives for them is not wanted
+    with warnings.catch_warnings():
+        # PeakPropertyWarning is not exported by every SciPy version
+        warnings.filterwarnings('ignore', message = '.*prominence of 0')
+        prominence, left_base, right_base = signal.peak_prominences(flat, position)
+    keep = (prominence > 0) & (prominence >= min_prominence)
+    row, col, position = row[keep], col[keep], position[keep]
+    bases = (prominence[keep], left_base[keep], right_base[keep])
+    prominence = bases[0]
+
+    width, _, left_half, right_half = signal.peak_widths(flat, position, 0.5, bases)
+    _, _, left_foot, right_foot = signal.peak_widths(flat, position, 1.0, bases)
+    offset = row*stride
+    left_half, right_half = left_half - offset, right_half - offset
+    left_foot, right_foot = left_foot - offset, right_foot - offset
+
+    # vertex of the parabola through the three samples around each maximum
+    a = scans[row, col - 1]
+    b = scans[row, col]
+    c = scans[row, col + 1]
+    curvature = a - 2*b + c
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        delta = np.where(curvature < 0, 0.5*(a - c)/curvature, 0.0)
+    height = b - 0.25*(a - c)*delta
+    center = _to_x(col + delta, x, n)
+
+    # area above the base from the cumulative integral of each scan
+    xs = np.arange(n, dtype = float) if x is None else np.asarray(x, dtype = float)
+    cumulative = np.zeros((rows, n))
+    cumulative[:, 1:] = np.cumsum(0.5*(scans[:, 1:] + scans[:, :-1])*np.diff(xs), axis = 1)
+    def integral(positions):
+        lo = np.clip(np.floor(positions).astype(int), 0, n - 2)
+        frac = positions - lo
+        return ((1 - frac)*cumulative[row, lo] + frac*cumulative[row, lo + 1])
+    base = scans[row, col] - prominence
+    top = col + delta
+    left_foot = np.maximum(left_foot, top - 3*(top - left_half))
+    right_foot = np.minimum(right_foot, top + 3*(right_half - top))
+    x_left, x_right = _to_x(left_foot, xs, n), _to_x(right_foot, xs, n)
+    area = np.abs(integral(right_foot) - integral(left_foot) - base*(x_right - x_left))
+    width = np.abs(_to_x(right_half, x, n) - _to_x(left_half, x, n))
+
+    bounds = np.searchsorted(row, np.arange(rows + 1))
+    return [LineIndex(center[lo:hi], width[lo:hi], area[lo:hi], height[lo:hi],
+                      prominence[lo:hi])
+            for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+##
+# Find the peaks of a single scan
+#
+# @param scan 1D numpy array
+# @param x optional 1D numpy array of x values of the scan
+# @param min_prominence float; peaks less prominent than this are dropped
+# @returns LineIndex
+#
+def find_peaks(scan, x = None, min_prominence = 0.0):
+    return find_peaks_batch(scan, x, min_prominence)[0]
+
+##
+# Offsets of reference lines in each of a series of scans
+#
+# @param indices list of LineIndex, one per scan
+# @param reference 1D array of reference line centers
+# @param tolerance float; largest distance at which a line is matched
+# @returns numpy array (scans, reference lines) of measured center minus
+#   reference center, NaN where the line was not found
+#
+def track_drift(indices, reference, tolerance):
+    return np.array([index.match(reference, tolerance)[1] for index in indices])
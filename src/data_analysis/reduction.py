@@ -0,0 +1,47 @@
+##
+# reduction contains routines that collapse acquired lock-in samples into one
+# value per experiment step. Steps are given as time windows on the lock-in
+# time axis, typically starting at the setpoint markers recorded by
+# Laser.set_field, and all windows are reduced together from cumulative sums
+# rather than one slice at a time.
+#
+# Example of the mean signal of every wavelength step:
+# starts = np.array([t for t, field, value in laser_obj.setpoints])
+# mean, err, count = reduction.reduce_windows(time_axis, data, starts + 1, starts + 10)
+
+import numpy as np
+
+##
+# Mean, standard error and sample count of data inside each time window.
+# Windows with no samples give NaN.
+#
+# @param time_axis 1D numpy array of sorted sample times
+# @param data 1D numpy array of samples, same length as time_axis
+# @param starts array of window start times, inclusive
+# @param stops array of window stop times, exclusive
+# @returns tuple of (mean, standard error of the mean, count) arrays shaped
+#   like starts
+#
+def reduce_windows(time_axis, data, starts, stops):
+    time_axis = np.asarray(time_axis, dtype = float)
+    data = np.asarray(data, dtype = float)
+    starts = np.asarray(starts, dtype = float)
+    stops = np.asarray(stops, dtype = float)
+
+    lo = np.searchsorted(time_axis, starts, side = 'left')
+    hi = np.maximum(np.searchsorted(time_axis, stops, side = 'left'), lo)
+    count = hi - lo
+
+    # sums are taken about the overall mean to keep the variance accurate
+    offset = data.mean() if data.size else 0.0
+    centered = data - offset
+    sums = np.concatenate(([0.0], np.cumsum(centered)))
+    squares = np.concatenate(([0.0], np.cumsum(centered**2)))
+
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        mean = (sums[hi] - sums[lo])/count
+        var = (squares[hi] - squares[lo])/count - mean**2
+        var = np.maximum(var, 0.0)*count/(count - 1)
+        err = np.sqrt(var/count)
+    err[count < 2] = np.nan
+    return mean + offset, err, count
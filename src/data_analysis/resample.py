@@ -0,0 +1,73 @@
+##
+# resample contains routines that bring traces sampled on non-uniform axes,
+# such as a lock-in time axis with lost samples or the wavenumbers of a
+# wavelength scan, onto uniform grids. The sample positions are looked up
+# once for the whole grid and the interpolation is done for all points, and
+# all stacked traces, at once.
+#
+# Example of ratioing two traces recorded on different time axes:
+# grid = resample.common_grid([t_sample, t_reference])
+# ratio = resample.resample(t_sample, sample, grid)/resample.resample(t_reference, reference, grid)
+
+import numpy as np
+
+## Interpolations resample can use.
+KINDS = ('linear', 'cubic')
+
+##
+# Evenly spaced grid spanning an axis.
+#
+# @param x 1D numpy array of sorted sample positions
+# @param num int; points of the grid, defaults to the number of samples
+# @returns 1D numpy array
+#
+def uniform_grid(x, num = None):
+    x = np.asarray(x, dtype = float)
+    return np.linspace(x[0], x[-1], x.size if num is None else num)
+
+##
+# Evenly spaced grid over the span that all the given axes cover, for
+# comparing traces sampled on different axes point by point.
+#
+# @param axes list of 1D numpy arrays of sorted sample positions
+# @param num int; points of the grid, defaults to the largest number of
+#   samples of the axes
+# @returns 1D numpy array, empty if the axes do not overlap
+#
+def common_grid(axes, num = None):
+    start = max(x[0] for x in axes)
+    stop = min(x[-1] for x in axes)
+    if stop < start:
+        return np.empty(0)
+    if num is None:
+        num = max(len(x) for x in axes)
+    return np.linspace(start, stop, num)
+
+##
+# Interpolate traces from their sample positions onto a grid. Grid points
+# outside the sampled span are NaN.
+#
+# @param x 1D numpy array of strictly increasing sample positions
+# @param y numpy array of samples along its last axis, so several traces
+#   on the same axis can be stacked
+# @param grid 1D numpy array of positions to interpolate at
+# @param kind str; one of KINDS
+# @returns numpy array of y's leading shape and grid's length
+#
+def resample(x, y, grid, kind = 'linear'):
+    if kind not in KINDS:
+        raise ValueError('Unknown interpolation {}, expected one of {}'.format(kind, KINDS))
+    x = np.asarray(x, dtype = float)
+    y = np.asarray(y, dtype = float)
+    grid = np.asarray(grid, dtype = float)
+    outside = (grid < x[0]) | (grid > x[-1])
+
+    if kind == 'cubic':
+        from scipy.interpolate import CubicSpline
+        out = CubicSpline(x, y, axis = -1, extrapolate = False)(grid)
+    else:
+        i = np.clip(np.searchsorted(x, grid, side = 'right') - 1, 0, x.size - 2)
+        weight = (grid - x[i])/(x[i + 1] - x[i])
+        out = y[..., i]*(1 - weight) + y[..., i + 1]*weight
+    out[..., outside] = np.nan
+    return out
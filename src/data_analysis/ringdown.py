@@ -0,0 +1,161 @@
+##
+# ringdown contains the fit behind the cavity loss experiment. A ring-down
+# transient decays as
+#   y(t) = A exp(-t/tau) + C
+# and the cavity loss follows from tau. Every routine works on a 2D array of
+# transients sharing one time axis, one transient per row, with no Python
+# loop over the transients:
+#   - fit_log_linear estimates (A, tau, C) in closed form, from a weighted
+#     straight line fit to log(y - C) with C taken from the tail.
+#   - refine polishes those estimates with a few batched Gauss-Newton steps
+#     on the exponential itself.
+#   - loss_spectrum averages tau per wavelength and converts it to loss.
+#
+# Example:
+# fit = ringdown.refine(t, transients, ringdown.fit_log_linear(t, transients))
+# wavenumbers, loss, loss_err, tau = ringdown.loss_spectrum(fit.tau, wavelengths)
+
+import numpy as np
+
+## Speed of light in cm/s
+SPEED_OF_LIGHT = 2.99792458e10
+
+## Result of a ring-down fit, one entry per transient in every array.
+class RingdownFit:
+
+    def __init__(self, amplitude, tau, baseline, tau_err):
+        ## amplitude A of the exponential
+        self.amplitude = amplitude
+        ## decay time tau, in the units of the time axis
+        self.tau = tau
+        ## constant offset C the transient decays to
+        self.baseline = baseline
+        ## one standard deviation uncertainty of tau
+        self.tau_err = tau_err
+
+##
+# Closed form fit of every transient. The baseline is the mean of the tail
+# of the transient, and the log of what lies above it is fitted with weights
+# proportional to its square, which undoes the amplification of noise by
+# the log. Samples after the first one that drops within noise_sigmas of the
+# baseline are ignored.
+#
+# @param t 1D numpy array of m sample times, starting at the trigger
+# @param transients numpy array (n, m) of transients
+# @param tail float; fraction of samples at the end used for the baseline
+# @param noise_sigmas float; cut-off above the baseline in tail deviations
+# @returns RingdownFit
+#
+def fit_log_linear(t, transients, tail = 0.2, noise_sigmas = 3.0):
+    t = np.asarray(t, dtype = float)
+    y = np.atleast_2d(np.asarray(transients, dtype = float))
+    m = y.shape[1]
+    tail_start = m - max(2, int(m*tail))
+
+    baseline = y[:, tail_start:].mean(axis = 1)
+    noise = y[:, tail_start:].std(axis = 1, ddof = 1)
+    noise = np.where(noise > 0, noise, np.finfo(float).tiny)
+    z = y - baseline[:, np.newaxis]
+
+    # keep samples up to the first one that is lost in the noise
+    above = z > noise_sigmas*noise[:, np.newaxis]
+    mask = np.logical_and.accumulate(above, axis = 1)
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        log_z = np.where(mask, np.log(np.where(mask, z, 1.0)), 0.0)
+        w = np.where(mask, (z/noise[:, np.newaxis])**2, 0.0)
+        s = w.sum(axis = 1)
+        st = w @ t
+        stt = w @ t**2
+        sl = (w*log_z).sum(axis = 1)
+        stl = (w*log_z) @ t
+        det = s*stt - st**2
+        slope = (s*stl - st*sl)/det
+        intercept = (stt*sl - st*stl)/det
+        tau = -1.0/slope
+        tau_err = np.sqrt(s/det)/slope**2
+
+    invalid = (mask.sum(axis = 1) < 3) | ~(slope < 0)
+    tau[invalid] = np.nan
+    tau_err[invalid] = np.nan
+    return RingdownFit(np.exp(intercept), tau, baseline, tau_err)
+
+##
+# Refine ring-down fits by damped Gauss-Newton least squares on the
+# exponential model, all transients together. Transients whose starting
+# estimate is invalid are left as NaN.
+#
+# @param t 1D numpy array of m sample times
+# @param transients numpy array (n, m) of transients
+# @param initial RingdownFit to start from, usually from fit_log_linear
+# @param iterations int; number of Gauss-Newton steps
+# @param damping float; Levenberg damping relative to the diagonal
+# @returns RingdownFit
+#
+def refine(t, transients, initial, iterations = 5, damping = 1e-3):
+    t = np.asarray(t, dtype = float)
+    y = np.atleast_2d(np.asarray(transients, dtype = float))
+    valid = np.isfinite(initial.tau)
+    amplitude = np.where(valid, initial.amplitude, 1.0)
+    rate = np.where(valid, 1.0/initial.tau, 1.0)
+    baseline = np.where(valid, initial.baseline, 0.0)
+
+    for _ in range(iterations):
+        decay = np.exp(-np.outer(rate, t))
+        resid = y - (amplitude[:, np.newaxis]*decay + baseline[:, np.newaxis])
+        # jacobian columns with respect to amplitude, rate and baseline
+        jac = np.stack([decay, -amplitude[:, np.newaxis]*t*decay,
+            np.ones_like(decay)], axis = 2)
+        normal = np.einsum('nmi,nmj->nij', jac, jac)
+        normal += damping*normal*np.eye(3)
+        step = np.linalg.solve(normal[valid],
+            np.einsum('nmi,nm->ni', jac, resid)[valid][..., np.newaxis])[..., 0]
+        amplitude[valid] += step[:, 0]
+        rate[valid] += step[:, 1]
+        baseline[valid] += step[:, 2]
+
+    decay = np.exp(-np.outer(rate, t))
+    resid = y - (amplitude[:, np.newaxis]*decay + baseline[:, np.newaxis])
+    jac = np.stack([decay, -amplitude[:, np.newaxis]*t*decay,
+        np.ones_like(decay)], axis = 2)
+    normal = np.einsum('nmi,nmj->nij', jac, jac)
+    sigma2 = np.sum(resid**2, axis = 1)/max(1, t.size - 3)
+
+    tau = np.full(rate.shape, np.nan)
+    tau_err = np.full(rate.shape, np.nan)
+    tau[valid] = 1.0/rate[valid]
+    rate_var = np.linalg.inv(normal[valid])[:, 1, 1]*sigma2[valid]
+    tau_err[valid] = np.sqrt(rate_var)/rate[valid]**2
+    amplitude[~valid] = np.nan
+    baseline[~valid] = np.nan
+    return RingdownFit(amplitude, tau, baseline, tau_err)
+
+##
+# Average decay times per wavelength and convert them to loss. Transients
+# with a NaN decay time are ignored.
+#
+# @param tau 1D numpy array of decay times in seconds, one per transient
+# @param wavelengths 1D numpy array of the wavelength of each transient
+# @param cavity_length float; cavity length in cm. If given the loss is
+#   also returned as a fraction per round trip
+# @returns tuple of (wavelengths, loss in 1/cm, standard error of loss,
+#   mean tau, and the round trip loss fraction if cavity_length was given)
+#
+def loss_spectrum(tau, wavelengths, cavity_length = None):
+    tau = np.asarray(tau, dtype = float)
+    good = np.isfinite(tau) & (tau > 0)
+    labels, index = np.unique(np.asarray(wavelengths)[good], return_inverse = True)
+    # loss is linear in 1/tau, so it is 1/tau that gets averaged
+    rate = 1.0/tau[good]
+    count = np.bincount(index, minlength = labels.size)
+    mean_rate = np.bincount(index, rate, labels.size)/count
+    spread = np.bincount(index, (rate - mean_rate[index])**2, labels.size)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        rate_err = np.sqrt(spread/(count - 1)/count)
+
+    loss = mean_rate/SPEED_OF_LIGHT
+    loss_err = rate_err/SPEED_OF_LIGHT
+    result = (labels, loss, loss_err, 1.0/mean_rate)
+    if cavity_length is not None:
+        result += (2*cavity_length*loss,)
+    return result
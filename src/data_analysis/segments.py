@@ -0,0 +1,218 @@
+##
+# segments contains the SegmentWriter and SegmentIndex classes, which
+# split the samples of a long run into time bounded segment files and read
+# any time window back from them.
+#
+# A SegmentWriter moves the samples and setpoints a laser has acquired out
+# of it, through Laser.take_acquired, into a new segment file every so many
+# seconds or samples, so the memory a run holds stays bounded however long
+# it lasts. Each segment is an .npz file of time, data, the setpoints made
+# and the changes of poll length and demod rate during it, and of the merged
+# channels in samples when the laser acquires several, and index.json in the same directory lists the time
+# span and size of every segment.
+#
+# Example of opening one hour of a multi-day run:
+# index = SegmentIndex('run')
+# time_axis, data = index.window(36000, 39600)
+#
+
+import json
+import os
+import numpy as np
+
+
+class SegmentWriter:
+
+    ## initialize a writer of the samples of one laser
+    #
+    # @param self the object pointer
+    # @param directory str; directory the segments and index.json go to,
+    #   created if needed
+    # @param laser_obj laser, or laser.remote.RemoteLaser, whose acquired
+    #   samples and setpoints are moved into segments with its
+    #   take_acquired, and counted with its since
+    # @param seconds float; experiment seconds after which a segment ends
+    # @param samples int; samples of data and time_axis after which a
+    #   segment ends, None for no limit
+    #
+    def __init__(self, directory, laser_obj, seconds = 3600, samples = None):
+        os.makedirs(directory, exist_ok = True)
+        ## str, directory of the segments
+        self.directory = directory
+        ## float, experiment seconds after which a segment ends
+        self.seconds = seconds
+        ## int, samples after which a segment ends, or None
+        self.samples = samples
+        ## list of dictionaries, the entries of index.json
+        self.segments = []
+        self._laser = laser_obj
+        self._start_tick = 0
+        self._data_cursor = 0
+        self._setpoints_cursor = 0
+        self._pending = 0
+
+    ## method to end the current segment if it is due
+    #
+    # @param self the object pointer
+    # @param current_time int; experiment second just completed
+    # @returns bool; whether a segment was written
+    #
+    def rotate_if_due(self, current_time):
+        if self.samples is not None:
+            # only the chunks acquired since the last call are read, and
+            # compact lasers give the samples of their compact log
+            acquired = self._laser.since(self._data_cursor, self._setpoints_cursor)
+            self._data_cursor = acquired['data_end']
+            self._setpoints_cursor = acquired['setpoints_end']
+            self._pending += sum(len(chunk) for chunk in acquired['time_axis'])
+        if current_time - self._start_tick >= self.seconds or \
+                (self.samples is not None and self._pending >= self.samples):
+            self.rotate(current_time)
+            return True
+        return False
+
+    ## method to write everything acquired so far as a segment and drop it
+    # from the laser
+    #
+    # @param self the object pointer
+    # @param current_time int; experiment second the segment ends at
+    #
+    def rotate(self, current_time):
+        self._write(self._laser.take_acquired(), current_time)
+
+    ## method to write what is left as a last segment
+    #
+    # @param self the object pointer
+    # @param current_time int; experiment second the run ended at
+    #
+    def close(self, current_time):
+        acquired = self._laser.take_acquired()
+        log = acquired['compact_log']
+        if acquired['time_axis'] or acquired['setpoints'] or acquired['events'] or \
+                (log is not None and log.count):
+            self._write(acquired, current_time)
+
+    def _write(self, acquired, current_time):
+        chunks = acquired['time_axis']
+        log = acquired['compact_log']
+        if log is not None and log.count:
+            # compact lasers keep their samples in the log, not the lists
+            time_axis, data = log.time_axis(), log.magnitude()
+        else:
+            time_axis = np.concatenate(chunks) if chunks else np.empty(0)
+            data = np.concatenate(acquired['data']) if chunks else np.empty(0)
+        setpoints = acquired['setpoints']
+        events = acquired['events']
+        extra = {}
+        if acquired['samples']:
+            extra['samples'] = np.concatenate(acquired['samples'])
+
+        name = 'segment_{:05d}.npz'.format(len(self.segments))
+        with open(os.path.join(self.directory, name), 'wb') as f:
+            np.savez(f, time = time_axis, data = data,
+                setpoint_time = np.array([s[0] for s in setpoints], dtype = float),
+                setpoint_field = np.array([s[1] for s in setpoints], dtype = str),
+                setpoint_value = np.array([s[2] for s in setpoints], dtype = float),
+                event_time = np.array([e[0] for e in events], dtype = float),
+                event_setting = np.array([e[1] for e in events], dtype = str),
+                event_old = np.array([e[2] for e in events], dtype = float),
+                event_new = np.array([e[3] for e in events], dtype = float),
+                **extra)
+        self.segments.append({
+            'file': name,
+            'first_tick': self._start_tick,
+            'last_tick': current_time,
+            'start': float(time_axis[0]) if time_axis.size else None,
+            'stop': float(time_axis[-1]) if time_axis.size else None,
+            'samples': int(time_axis.size),
+        })
+        self._write_index()
+        self._start_tick = current_time
+        self._pending = 0
+
+    def _write_index(self):
+        path = os.path.join(self.directory, 'index.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'segments': self.segments}, f)
+        os.replace(path + '.tmp', path)
+
+
+class SegmentIndex:
+
+    ## initialize by reading index.json of a directory of segments
+    #
+    # @param self the object pointer
+    # @param directory str; directory written by a SegmentWriter
+    #
+    def __init__(self, directory):
+        ## str, directory of the segments
+        self.directory = directory
+        with open(os.path.join(directory, 'index.json')) as f:
+            ## list of dictionaries, one per segment, of its file, first and
+            # last tick, start and stop time and number of samples
+            self.segments = json.load(f)['segments']
+
+    ## method to read the samples of a time window, loading only the
+    # segments that overlap it
+    #
+    # @param self the object pointer
+    # @param start float; start of the window in seconds, None for the
+    #   start of the run
+    # @param stop float; end of the window in seconds, None for the end
+    # @returns tuple of 1D arrays (time axis, data)
+    #
+    def window(self, start = None, stop = None):
+        start = -np.inf if start is None else start
+        stop = np.inf if stop is None else stop
+        times = []
+        data = []
+        for segment in self.segments:
+            if segment['samples'] == 0 or segment['stop'] < start or segment['start'] > stop:
+                continue
+            with np.load(os.path.join(self.directory, segment['file'])) as f:
+                t = f['time']
+                keep = (t >= start) & (t <= stop)
+                times.append(t[keep])
+                data.append(f['data'][keep])
+        if not times:
+            return np.empty(0), np.empty(0)
+        return np.concatenate(times), np.concatenate(data)
+
+    ## method to read the setpoints made during a time window
+    #
+    # @param self the object pointer
+    # @param start float; start of the window in seconds, None for the start
+    # @param stop float; end of the window in seconds, None for the end
+    # @returns list of (time, field_name, value) tuples
+    #
+    def setpoints(self, start = None, stop = None):
+        start = -np.inf if start is None else start
+        stop = np.inf if stop is None else stop
+        setpoints = []
+        for segment in self.segments:
+            with np.load(os.path.join(self.directory, segment['file'])) as f:
+                for when, field_name, value in zip(f['setpoint_time'],
+                        f['setpoint_field'], f['setpoint_value']):
+                    if start <= when <= stop:
+                        setpoints.append((float(when), str(field_name), float(value)))
+        return setpoints
+
+    ## method to read the changes of poll length and demod rate made during
+    # a time window
+    #
+    # @param self the object pointer
+    # @param start float; start of the window in seconds, None for the start
+    # @param stop float; end of the window in seconds, None for the end
+    # @returns list of (time, setting, old, new) tuples, as in Events.csv
+    #
+    def events(self, start = None, stop = None):
+        start = -np.inf if start is None else start
+        stop = np.inf if stop is None else stop
+        events = []
+        for segment in self.segments:
+            with np.load(os.path.join(self.directory, segment['file'])) as f:
+                for when, setting, old, new in zip(f['event_time'], f['event_setting'],
+                        f['event_old'], f['event_new']):
+                    if start <= when <= stop:
+                        events.append((float(when), str(setting), float(old), float(new)))
+        return events
@@ -0,0 +1,158 @@
+##
+# spectral contains the frequency domain routines used by Analysis: FFT,
+# Welch power spectral density and spectrograms. Every routine works along
+# the last axis of its input, so a 2D array (or a numpy memmap) of traces is
+# transformed in one vectorized call. Windows and frequency axes are cached
+# by length, and scipy.fft keeps its own plan cache, so repeated calls on
+# traces of the same length only pay for the transform itself.
+# SciPy is imported by the routines on first use, as it is slow to import.
+#
+# Example of the PSD of 500 stored traces of 2 kHz lock-in data:
+# traces = np.load('traces.npy', mmap_mode = 'r')
+# freqs, psd = spectral.welch(traces, 2e3, nperseg = 1024)
+
+import functools
+import numpy as np
+
+## Number of float64 elements worked on at once when traces are processed
+# in blocks of rows, keeps memory bounded for memory-mapped inputs
+BLOCK_ELEMENTS = 2**24
+
+##
+# Sampling rate implied by a time axis, robust against the occasional gap
+#
+# @param time_axis 1D numpy array of sample times in seconds
+# @returns float; samples per second
+#
+def sample_rate(time_axis):
+    time_axis = np.asarray(time_axis, dtype = float)
+    if time_axis.size < 2:
+        raise ValueError('At least two samples are needed for a sampling rate')
+    return 1.0/np.median(np.diff(time_axis))
+
+## cached window of a given name and length, read only so it can be shared
+@functools.lru_cache(maxsize = 64)
+def _window(window, n):
+    # scipy.signal is slow to import, so only when a window is first needed
+    from scipy import signal
+    w = signal.get_window(window, n)
+    w.setflags(write = False)
+    return w
+
+## cached one sided frequency axis for n samples at sampling rate fs
+@functools.lru_cache(maxsize = 64)
+def _rfftfreq(n, fs):
+    f = np.fft.rfftfreq(n, 1.0/fs)
+    f.setflags(write = False)
+    return f
+
+## yield (row slice) blocks of a 2D view so that each block has about
+# BLOCK_ELEMENTS * expansion elements once expanded
+def _row_blocks(rows, row_elements, expansion = 1):
+    step = max(1, BLOCK_ELEMENTS // max(1, row_elements * expansion))
+    for start in range(0, rows, step):
+        yield slice(start, min(rows, start + step))
+
+##
+# One sided FFT of one or many traces
+#
+# @param traces array like of shape (..., n)
+# @param fs float; sampling rate in Hz
+# @param window str; window name understood by scipy.signal.get_window,
+#   or None for no window
+# @returns tuple of (frequencies, complex spectra of shape (..., n//2 + 1))
+#
+def fft(traces, fs = 1.0, window = None):
+    from scipy import fft as sp_fft
+    traces = np.asarray(traces)
+    n = traces.shape[-1]
+    flat = traces.reshape(-1, n)
+    out = np.empty((flat.shape[0], n//2 + 1), dtype = complex)
+    for rows in _row_blocks(flat.shape[0], n):
+        block = np.asarray(flat[rows], dtype = float)
+        if window is not None:
+            block = block * _window(window, n)
+        out[rows] = sp_fft.rfft(block, axis = -1)
+    return _rfftfreq(n, float(fs)), out.reshape(traces.shape[:-1] + (n//2 + 1,))
+
+## segment the last axis into windowed, mean removed, overlapping segments
+def _segments(block, nperseg, step, window):
+    # strided view of the segments, without copying the trace
+    count = (block.shape[-1] - nperseg)//step + 1
+    stride = block.strides[-1]
+    segs = np.lib.stride_tricks.as_strided(block,
+        shape = block.shape[:-1] + (count, nperseg),
+        strides = block.strides[:-1] + (step*stride, stride),
+        writeable = False)
+    segs = segs - segs.mean(axis = -1, keepdims = True)
+    return segs * _window(window, nperseg)
+
+## power of one sided spectra scaled to a density in units**2/Hz
+def _density(spectra, fs, nperseg, window):
+    power = spectra.real**2 + spectra.imag**2
+    power *= 1.0/(fs * np.sum(_window(window, nperseg)**2))
+    if nperseg % 2:
+        power[..., 1:] *= 2
+    else:
+        power[..., 1:-1] *= 2
+    return power
+
+##
+# Welch power spectral density of one or many traces. Matches
+# scipy.signal.welch with constant detrending and density scaling.
+#
+# @param traces array like of shape (..., n)
+# @param fs float; sampling rate in Hz
+# @param nperseg int; samples per segment, clipped to n
+# @param noverlap int; overlapping samples, defaults to nperseg // 2
+# @param window str; window name understood by scipy.signal.get_window
+# @returns tuple of (frequencies, PSD of shape (..., nperseg//2 + 1))
+#
+def welch(traces, fs = 1.0, nperseg = 1024, noverlap = None, window = 'hann'):
+    from scipy import fft as sp_fft
+    traces = np.asarray(traces)
+    n = traces.shape[-1]
+    nperseg = min(nperseg, n)
+    noverlap = nperseg // 2 if noverlap is None else noverlap
+    step = nperseg - noverlap
+    nfreq = nperseg//2 + 1
+
+    flat = traces.reshape(-1, n)
+    out = np.empty((flat.shape[0], nfreq))
+    for rows in _row_blocks(flat.shape[0], n, max(1, nperseg // step)):
+        block = np.asarray(flat[rows], dtype = float)
+        spectra = sp_fft.rfft(_segments(block, nperseg, step, window), axis = -1)
+        out[rows] = _density(spectra, fs, nperseg, window).mean(axis = -2)
+    return _rfftfreq(nperseg, float(fs)), out.reshape(traces.shape[:-1] + (nfreq,))
+
+##
+# Spectrogram of one or many traces as a PSD per segment
+#
+# @param traces array like of shape (..., n)
+# @param fs float; sampling rate in Hz
+# @param nperseg int; samples per segment, clipped to n
+# @param noverlap int; overlapping samples, defaults to nperseg // 8
+# @param window str; window name understood by scipy.signal.get_window
+# @returns tuple of (frequencies, segment center times,
+#   PSD of shape (..., nperseg//2 + 1, number of segments))
+#
+def spectrogram(traces, fs = 1.0, nperseg = 256, noverlap = None,
+        window = 'hann'):
+    from scipy import fft as sp_fft
+    traces = np.asarray(traces)
+    n = traces.shape[-1]
+    nperseg = min(nperseg, n)
+    noverlap = nperseg // 8 if noverlap is None else noverlap
+    step = nperseg - noverlap
+    nseg = (n - nperseg)//step + 1
+    nfreq = nperseg//2 + 1
+
+    flat = traces.reshape(-1, n)
+    out = np.empty((flat.shape[0], nfreq, nseg))
+    for rows in _row_blocks(flat.shape[0], n, max(1, nperseg // step)):
+        block = np.asarray(flat[rows], dtype = float)
+        spectra = sp_fft.rfft(_segments(block, nperseg, step, window), axis = -1)
+        out[rows] = np.swapaxes(_density(spectra, fs, nperseg, window), -1, -2)
+    times = (np.arange(nseg)*step + nperseg/2.0)/fs
+    return (_rfftfreq(nperseg, float(fs)), times,
+        out.reshape(traces.shape[:-1] + (nfreq, nseg)))
@@ -1,4 +1,8 @@
 from action import PulseWidthAction, PulseRateAction, WavelengthAction, CurrentAction, EndAction
+from timeline import Timeline
+from journal import Journal
+from clock import SimulationReport, SystemClock, VirtualClock
+from data_analysis.segments import SegmentWriter
 
 ##
 # The Experiment class follows a builder design parameter. It
@@ -25,6 +29,25 @@ from action import PulseWidthAction, PulseRateAction, WavelengthAction, CurrentA
 #   .with_duration(5) \
 #   .build()
 # foobar_exp.run()
+#
+# From an asyncio event loop, await foobar_exp.run_async() instead.
+#
+# Adding .with_trace('trace.json') to the builder records a Timeline of the
+# run and saves it as a Chrome trace once the run ends.
+#
+# Adding .with_journal('run.journal') keeps a Journal of the samples,
+# setpoints and ticks as the run goes, from which python journal.py recover
+# rebuilds the run if it crashes.
+#
+# Experiments are limited to 2 hours unless built .with_segments('run'),
+# which moves the acquired samples into a new segment file under run every
+# hour (or as set), so runs of days hold a bounded amount in memory.
+# Analysis.from_segments('run', start, stop) then opens any time window.
+#
+# The one second ticks are waited on a clock, real time unless built
+# .with_clock(VirtualClock()). foobar_exp.simulate() dry-runs the experiment
+# on a VirtualClock against EmulatedLasers in milliseconds, and reports the
+# time it would take on the bench and the setpoints it would make.
 
 class Experiment:
 
@@ -34,6 +57,14 @@ class Experiment:
   class Builder:
     _actions = None
     _duration = None 
+    _trace = False
+    _trace_path = None
+    _journal_path = None
+    _journal_interval = 1.0
+    _segment_directory = None
+    _segment_seconds = 3600
+    _segment_samples = None
+    _clock = None
 
     ##
     # Gives the Builder the set of user defined Actions
@@ -49,6 +80,39 @@ class Experiment:
       self._duration = duration
       return self
 
+    ##
+    # Records a Timeline of the run, available as the experiment's
+    # timeline attribute, and saves it to path as a Chrome trace if given
+    def with_trace(self, path = None):
+      self._trace = True
+      self._trace_path = path
+      return self
+
+    ##
+    # Keeps a Journal of the run at path, forced to disk every
+    # flush_interval seconds
+    def with_journal(self, path, flush_interval = 1.0):
+      self._journal_path = path
+      self._journal_interval = flush_interval
+      return self
+
+    ##
+    # Runs the experiment in long-run mode: no limit on the duration, and
+    # the acquired samples moved into segment files under directory every
+    # minutes, or every samples samples if that comes first
+    def with_segments(self, directory, minutes = 60, samples = None):
+      self._segment_directory = directory
+      self._segment_seconds = minutes * 60
+      self._segment_samples = samples
+      return self
+
+    ##
+    # Waits the ticks on clock rather than in real time, e.g. a
+    # clock.VirtualClock
+    def with_clock(self, clock):
+      self._clock = clock
+      return self
+
     ##
     # Method to extract the current actions list of the Builder
     def get_actions(self):
@@ -59,11 +123,51 @@ class Experiment:
     def get_duration(self):
       return self._duration
 
+    ##
+    # Method to extract whether the Builder records a Timeline
+    def get_trace(self):
+      return self._trace
+
+    ##
+    # Method to extract the path the Timeline is saved to, if any
+    def get_trace_path(self):
+      return self._trace_path
+
+    ##
+    # Method to extract the path the Journal is kept at, if any
+    def get_journal_path(self):
+      return self._journal_path
+
+    ##
+    # Method to extract the seconds between forced writes of the Journal
+    def get_journal_interval(self):
+      return self._journal_interval
+
+    ##
+    # Method to extract the directory segments are written to, if any
+    def get_segment_directory(self):
+      return self._segment_directory
+
+    ##
+    # Method to extract the experiment seconds after which a segment ends
+    def get_segment_seconds(self):
+      return self._segment_seconds
+
+    ##
+    # Method to extract the samples after which a segment ends, if set
+    def get_segment_samples(self):
+      return self._segment_samples
+
+    ##
+    # Method to extract the clock the ticks are waited on, if set
+    def get_clock(self):
+      return self._clock
+
     ##
     # Method to build the Experiment class with the desired actions
     # and duration. Validates both of them. An experiment must have at
     # least one action. Duration must be specified, greater than 0, and
-    # less than 2 hours
+    # less than 2 hours unless the experiment is written in segments
     def build(self):
       # Validate that that the experiment is defined properly
 
@@ -71,14 +175,23 @@ class Experiment:
       assert not self._duration is None
       assert self._duration > 0
 
-      # Max 2 hour experiment
-      assert self._duration < 60*60*2
+      # Max 2 hour experiment, as all its samples are held in memory
+      if self._segment_directory is None:
+        assert self._duration < 60*60*2
 
       return Experiment(self)
 
   _actions = []
   _current_time = 0
   _duration = None
+  _trace_path = None
+  _journal_path = None
+  _journal_interval = 1.0
+  _segment_directory = None
+  _segment_seconds = 3600
+  _segment_samples = None
+  _clock = None
+  timeline = None
 
   @staticmethod
   ##
@@ -89,20 +202,179 @@ class Experiment:
   def __init__(self, builder):
     self._actions = builder.get_actions()
     self._duration = builder.get_duration()
+    self._clock = builder.get_clock()
+    if self._clock is None:
+      self._clock = SystemClock()
+    if builder.get_trace():
+      self.timeline = Timeline(self._duration * (len(self._actions) + 1), self._clock)
+      self._trace_path = builder.get_trace_path()
+    self._journal_path = builder.get_journal_path()
+    self._journal_interval = builder.get_journal_interval()
+    self._segment_directory = builder.get_segment_directory()
+    self._segment_seconds = builder.get_segment_seconds()
+    self._segment_samples = builder.get_segment_samples()
+
+  ##
+  # Names of the instruments the actions act on, in order of first use,
+  # with None standing for the default laser
+  def _instruments(self):
+    names = []
+    for action in self._actions:
+      name = getattr(action, '_instrument', None)
+      if name not in names:
+        names.append(name)
+    return names
+
+  ##
+  # Opens the Journal of the run, journaling every laser the actions act
+  # on, or returns None if the experiment keeps none
+  def _open_journal(self):
+    if self._journal_path is None:
+      return None
+    import laser
+    names = self._instruments()
+    journal = Journal(self._journal_path, self._journal_interval)
+    journal.start(self._duration, self._actions, [laser.get(name) for name in names], names)
+    return journal
+
+  ##
+  # Creates a SegmentWriter for every laser the actions act on, in a
+  # directory of its own if there are several, or returns an empty list if
+  # the experiment is not written in segments
+  def _open_segments(self):
+    if self._segment_directory is None:
+      return []
+    import os
+    import laser
+    names = self._instruments()
+    writers = []
+    for name in names:
+      directory = self._segment_directory
+      if names != [None]:
+        directory = os.path.join(directory, 'default' if name is None else str(name))
+      writers.append(SegmentWriter(directory, laser.get(name),
+                                   self._segment_seconds, self._segment_samples))
+    return writers
 
   ##
   # To be called when the user is ready to run the experiment
   # with the defined Actions and specified duration after
   # calling .build() on the Builder
   def run(self):
-    import time
-    # every loop is "one" second
-    for i in range(self._duration):
-      self._current_time += 1
-      time.sleep(1)
-      for action in self._actions:
-        action.run_wrapper(self._current_time)
+    timeline = self.timeline
+    if timeline is not None:
+      timeline.start(self._actions)
+    journal = self._open_journal()
+    writers = self._open_segments()
+    error = None
+    try:
+      # every loop is "one" second
+      for i in range(self._duration):
+        self._current_time += 1
+        self._clock.sleep(1)
+        if timeline is None:
+          for action in self._actions:
+            action.run_wrapper(self._current_time)
+        else:
+          timeline.run_tick(self._current_time, self._actions)
+        if journal is not None:
+          journal.checkpoint(self._current_time)
+        for writer in writers:
+          writer.rotate_if_due(self._current_time)
+    except BaseException as e:
+      error = e
+      raise
+    finally:
+      if journal is not None:
+        journal.close(error is None, error)
+      if error is not None:
+        # keep what was acquired, as the lasers are not turned off
+        for writer in writers:
+          writer.close(self._current_time)
+      if self._trace_path is not None:
+        timeline.save(self._trace_path)
 
-    EndAction().run()
+    # the samples are in the segments, so Data.csv of an earlier run is kept
+    for instrument in self._instruments():
+      EndAction(instrument, save_data = not writers).run()
+    # the last segment takes what came in until the lasers were turned off
+    for writer in writers:
+      writer.close(self._current_time)
 
     return True
+
+  ##
+  # Awaitable version of run. Ticks are awaited rather than slept and the
+  # actions set the laser without blocking, so other tasks on the event
+  # loop keep running throughout the experiment
+  async def run_async(self):
+    timeline = self.timeline
+    if timeline is not None:
+      timeline.start(self._actions)
+    journal = self._open_journal()
+    writers = self._open_segments()
+    error = None
+    try:
+      for i in range(self._duration):
+        self._current_time += 1
+        await self._clock.sleep_async(1)
+        if timeline is None:
+          for action in self._actions:
+            await action.run_wrapper_async(self._current_time)
+        else:
+          await timeline.run_tick_async(self._current_time, self._actions)
+        if journal is not None:
+          journal.checkpoint(self._current_time)
+        for writer in writers:
+          writer.rotate_if_due(self._current_time)
+    except BaseException as e:
+      error = e
+      raise
+    finally:
+      if journal is not None:
+        journal.close(error is None, error)
+      if error is not None:
+        # keep what was acquired, as the lasers are not turned off
+        for writer in writers:
+          writer.close(self._current_time)
+      if self._trace_path is not None:
+        timeline.save(self._trace_path)
+
+    # the samples are in the segments, so Data.csv of an earlier run is kept
+    for instrument in self._instruments():
+      await EndAction(instrument, save_data = not writers).run_async()
+    # the last segment takes what came in until the lasers were turned off
+    for writer in writers:
+      writer.close(self._current_time)
+
+    return True
+
+  ##
+  # Dry-runs the experiment on a VirtualClock, with every instrument the
+  # actions act on replaced by an EmulatedLaser taking tune_time seconds
+  # per wavelength change and params_time per other change. Nothing is
+  # journaled, traced or written in segments. The actions run as they
+  # would on the bench, on copies so that the state they keep, such as the
+  # fields a scan has set, is left as it was for the real run
+  #
+  # @returns SimulationReport of the predicted seconds, hardware time and
+  #   setpoints of every instrument
+  def simulate(self, tune_time = 5.0, params_time = 0.0):
+    import copy
+    import laser
+    from laser.emulator import EmulatedLaser
+    clock = VirtualClock()
+    names = self._instruments()
+    lasers = {name: EmulatedLaser(tune_time, params_time, clock) for name in names}
+    dry_run = copy.copy(self)
+    dry_run._actions = copy.deepcopy(self._actions)
+    dry_run._clock = clock
+    dry_run.timeline = None
+    dry_run._trace_path = None
+    dry_run._journal_path = None
+    dry_run._segment_directory = None
+    with laser.substitute(lasers):
+      dry_run.run()
+    return SimulationReport(dry_run._current_time - self._current_time, clock.now(),
+      {name: lasers[name].hardware_time for name in names},
+      {name: lasers[name].setpoints for name in names})
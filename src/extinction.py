@@ -0,0 +1,201 @@
+import laser
+import numpy as np
+from action import Action, ScheduledAction
+from experiment import Experiment
+from data_analysis import reduction, beer_lambert
+
+##
+# The SampleChangeAction class asks for the sample in the beam to be
+# changed at scheduled times. It does not touch the laser; the experiment
+# simply waits until change_sample returns.
+
+class SampleChangeAction(Action):
+  def __init__(self, schedule, change_sample):
+    super().__init__(None)
+    self._schedule = dict(schedule)
+    self._change_sample = change_sample
+
+  def run(self, current_time):
+    return self._schedule.get(current_time)
+
+  def run_wrapper(self, current_time):
+    label = self.run(current_time)
+    if label is not None:
+      self._change_sample(label)
+
+##
+# Default way of changing samples: ask the operator on the terminal.
+def prompt_sample_change(label):
+  input('Place {} in the beam and press enter.'.format(label))
+
+##
+# The ExtinctionExperiment class measures the extinction coefficient of a
+# sample over a set of wavelengths. It steps through every wavelength once
+# without a sample, once with each sample and once more without a sample;
+# the two reference passes bracket the sample passes so that linear drift
+# of the laser power cancels. The lock-in data of every step is reduced to
+# its mean, and absorbance against sample amount (concentration times path
+# length) is fitted for all wavelengths at once, see
+# data_analysis.beer_lambert.
+#
+# Example: The following measures two dilutions in a 1 cm cell at three
+# wavelengths, dwelling 10 seconds per step.
+#
+# extinction_exp = ExtinctionExperiment.builder() \
+#   .with_wavelengths([1000, 1050, 1100]) \
+#   .with_samples([0.5, 1.0]) \
+#   .with_dwell(10) \
+#   .build()
+# fit = extinction_exp.run()
+# fit.coefficient, fit.coefficient_err
+
+class ExtinctionExperiment:
+
+  ##
+  # Builder for the extinction experiment, validates the parameters
+  class Builder:
+    _wavelengths = None
+    _amounts = None
+    _dwell = 10
+    _settle = 2
+    _change_sample = staticmethod(prompt_sample_change)
+    _intercept = True
+
+    ##
+    # Wavelengths, in wavenumbers, stepped through in every pass
+    def with_wavelengths(self, wavelengths):
+      self._wavelengths = list(wavelengths)
+      return self
+
+    ##
+    # Amount (concentration times path length) of every sample, one pass
+    # is made per sample
+    def with_samples(self, amounts):
+      self._amounts = list(amounts)
+      return self
+
+    ##
+    # Seconds spent at every wavelength of a pass
+    def with_dwell(self, dwell):
+      self._dwell = dwell
+      return self
+
+    ##
+    # Seconds at the start of every step that are left out of the
+    # reduction while the signal settles
+    def with_settle(self, settle):
+      self._settle = settle
+      return self
+
+    ##
+    # Function called with a label ('reference' or 'sample <n>') whenever
+    # the sample in the beam has to change. It should return once done.
+    def with_sample_change(self, change_sample):
+      self._change_sample = change_sample
+      return self
+
+    ##
+    # Whether to fit an absorbance offset as well as the coefficient
+    def with_intercept(self, intercept):
+      self._intercept = intercept
+      return self
+
+    ##
+    # Validates the parameters and builds the experiment. Fitting an
+    # intercept needs at least two samples.
+    def build(self):
+      assert self._wavelengths
+      assert self._amounts
+      assert len(self._amounts) >= (2 if self._intercept else 1)
+      assert int(self._dwell) == self._dwell and self._dwell > 0
+      assert 0 <= self._settle < self._dwell
+      return ExtinctionExperiment(self)
+
+  @staticmethod
+  ##
+  # Should be called by the user to retrieve the class Builder
+  def builder():
+    return ExtinctionExperiment.Builder()
+
+  def __init__(self, builder):
+    self._wavelengths = np.array(builder._wavelengths, dtype = float)
+    self._amounts = np.array(builder._amounts, dtype = float)
+    self._dwell = int(builder._dwell)
+    self._settle = builder._settle
+    self._intercept = builder._intercept
+
+    ## Labels of the passes in the order they are run
+    self.passes = (['reference'] +
+      ['sample {}'.format(i) for i in range(len(self._amounts))] + ['reference'])
+    ## Absorbance (samples, wavelengths) of the last analysis
+    self.absorbance = None
+    ## Uncertainty of absorbance
+    self.absorbance_err = None
+
+    n = len(self._wavelengths)
+    pass_ticks = n*self._dwell
+    changes = {}
+    steps = {}
+    for p, label in enumerate(self.passes):
+      start = 1 + p*pass_ticks
+      changes[start] = label
+      for j, wavelength in enumerate(self._wavelengths):
+        steps[start + j*self._dwell] = float(wavelength)
+
+    # the sample change has to come before the first step of each pass
+    self._experiment = Experiment.builder() \
+      .with_actions([SampleChangeAction(changes, builder._change_sample),
+                     ScheduledAction('wavelength', steps)]) \
+      .with_duration(len(self.passes)*pass_ticks + 1) \
+      .build()
+
+  ##
+  # The underlying Experiment the passes are compiled into
+  def experiment(self):
+    return self._experiment
+
+  ##
+  # Runs all passes and analyzes the acquired data
+  def run(self):
+    self._experiment.run()
+    return self.analyze()
+
+  ##
+  # Reduces the data of every step and fits the extinction coefficient.
+  # Defaults to the data and setpoints of the running laser.
+  #
+  # @param time_axis 1D numpy array of lock-in sample times
+  # @param data 1D numpy array of lock-in samples
+  # @param setpoints list of (time, field_name, value) as recorded by
+  #   Laser.set_field, the last wavelength entries are taken as the steps
+  # @returns BeerLambertFit with one entry per wavelength
+  def analyze(self, time_axis = None, data = None, setpoints = None):
+    if time_axis is None or data is None or setpoints is None:
+      laser_obj = laser.get()
+      time_axis = np.concatenate(laser_obj.time_axis)
+      data = np.concatenate(laser_obj.data)
+      setpoints = laser_obj.setpoints
+
+    shape = (len(self.passes), len(self._wavelengths))
+    starts = np.array([t for t, field_name, _ in setpoints
+                       if field_name == 'wavelength'], dtype = float)
+    if starts.size < shape[0]*shape[1]:
+      raise ValueError('Expected {} wavelength steps, found {}'.format(
+        shape[0]*shape[1], starts.size))
+    starts = starts[-shape[0]*shape[1]:]
+
+    mean, err, _ = reduction.reduce_windows(time_axis, data,
+      starts + self._settle, starts + self._dwell)
+    mean = mean.reshape(shape)
+    err = err.reshape(shape)
+
+    reference = (mean[0] + mean[-1])/2
+    reference_err = np.hypot(err[0], err[-1])/2
+    self.absorbance = beer_lambert.absorbance(mean[1:-1], reference)
+    self.absorbance_err = beer_lambert.absorbance_err(
+      mean[1:-1], err[1:-1], reference, reference_err)
+
+    weights_known = np.all(np.isfinite(self.absorbance_err)) and \
+      np.all(self.absorbance_err > 0)
+    return beer_lambert.fit(self._amounts, self.absorbance,
+      self.absorbance_err if weights_known else None, self._intercept)
@@ -0,0 +1,294 @@
+import os
+import laser
+import numpy as np
+from laser import aio
+from action import Action
+from experiment import Experiment
+from scan import ScanEstimate, _plain, tuning_distance
+from journal import acquired_since
+from data_analysis.grid_map import GridMap
+
+## Axes the outer loop of a grid scan can run over.
+AXES = ('wavelength', 'current')
+
+##
+# Cells of a grid in serpentine order. The outer axis steps once per row
+# and the inner axis runs forward and backward on alternate rows, so every
+# step changes one field by one value. Cells in skip are left out and the
+# rest keep their order.
+#
+# @param shape (wavelengths, currents) of the grid
+# @param outer axis of the outer loop, one of AXES
+# @param skip 2D boolean array of the cells to leave out, or None
+# @returns list of (wavelength index, current index) in the order visited
+def serpentine_cells(shape, outer = 'wavelength', skip = None):
+  if outer not in AXES:
+    raise ValueError('Unknown outer axis {}, expected one of {}'.format(outer, AXES))
+  n_outer, n_inner = shape if outer == 'wavelength' else shape[::-1]
+  cells = []
+  for i in range(n_outer):
+    inner = range(n_inner) if i % 2 == 0 else range(n_inner - 1, -1, -1)
+    for j in inner:
+      cell = (i, j) if outer == 'wavelength' else (j, i)
+      if skip is None or not skip[cell]:
+        cells.append(cell)
+  return cells
+
+##
+# The GridCellAction class steps the laser through the cells of a grid
+# scan, dwell ticks per cell, and reduces the samples of every cell into
+# its GridMap as soon as they have been acquired. At the start of a cell
+# only the fields that change are set; the window reduced starts settle
+# seconds after the last setpoint and ends dwell seconds after it.
+
+class GridCellAction(Action):
+  def __init__(self, grid, cells, dwell, settle, instrument = None, path = None):
+    super().__init__(None, instrument)
+    self._grid = grid
+    self._cells = cells
+    self._dwell = dwell
+    self._settle = settle
+    self._path = path
+    self._set = {}
+    # (row, column, setpoint time, data cursor) of the cells not reduced yet
+    self._pending = []
+    # chunks acquired that pending cells may still need, as (data cursor
+    # after the chunk, time axis, data), and the cursors of what was read
+    self._chunks = []
+    self._data_cursor = 0
+    self._setpoints_cursor = 0
+
+  ##
+  # The (field, value) pairs set at current_time, None between cells
+  def run(self, current_time):
+    cell, offset = divmod(current_time - 1, self._dwell)
+    if offset != 0 or cell >= len(self._cells):
+      return None
+    row, column = self._cells[cell]
+    values = (('wavelength', _plain(self._grid.wavelengths[row])),
+              ('current', _plain(self._grid.currents[column])))
+    return [(field_name, value) for field_name, value in values
+            if self._set.get(field_name) != value]
+
+  def run_wrapper(self, current_time):
+    self.collect()
+    changes = self.run(current_time)
+    if changes is not None:
+      laser_obj = laser.get(self._instrument)
+      cursor = self._data_cursor
+      for field_name, value in changes:
+        laser_obj.set_field(field_name, value)
+      self._started(current_time, laser_obj, changes, cursor)
+    return changes
+
+  async def run_wrapper_async(self, current_time):
+    self.collect()
+    changes = self.run(current_time)
+    if changes is not None:
+      laser_obj = laser.get(self._instrument)
+      cursor = self._data_cursor
+      for field_name, value in changes:
+        await aio.get(self._instrument).set_field(field_name, value)
+      self._started(current_time, laser_obj, changes, cursor)
+    return changes
+
+  ##
+  # Reduces the cells whose window has been acquired into the map, saving
+  # it after every cell if a path was given. With final, the remaining
+  # cells are reduced with whatever samples they have.
+  def collect(self, final = False):
+    self._acquire(laser.get(self._instrument))
+    newest = self._chunks[-1][1][-1] if self._chunks else -np.inf
+    while self._pending:
+      row, column, start, cursor = self._pending[0]
+      if not final and newest < start + self._dwell:
+        break
+      # the chunk acquired last before the setpoint may still hold the
+      # first samples of the cell
+      chunks = [chunk for chunk in self._chunks if chunk[0] >= cursor]
+      time_axis = np.concatenate([chunk[1] for chunk in chunks]) if chunks else np.empty(0)
+      if not np.isfinite(start) and time_axis.size:
+        start = time_axis[0]
+      if not final and not newest >= start + self._dwell:
+        break
+      data = np.concatenate([chunk[2] for chunk in chunks]) if chunks else np.empty(0)
+      self._grid.fill(row, column, time_axis, data,
+        start + self._settle, start + self._dwell)
+      self._pending.pop(0)
+      if self._path is not None:
+        self._grid.save(self._path)
+    # later cells only need the chunks from the last one read on
+    keep = self._pending[0][3] if self._pending else self._data_cursor
+    self._chunks = [chunk for chunk in self._chunks if chunk[0] >= keep]
+
+  ##
+  # Reads the chunks and setpoints acquired since the last call, keeping
+  # the chunks, and returns the setpoints
+  def _acquire(self, laser_obj):
+    acquired = acquired_since(laser_obj, self._data_cursor, self._setpoints_cursor)
+    end = acquired['data_end']
+    count = len(acquired['time_axis'])
+    for i, (time_axis, data) in enumerate(zip(acquired['time_axis'], acquired['data'])):
+      if len(time_axis):
+        self._chunks.append((end - count + 1 + i, time_axis, data))
+    self._data_cursor = end
+    self._setpoints_cursor = acquired['setpoints_end']
+    return acquired['setpoints']
+
+  def _started(self, current_time, laser_obj, changes, cursor):
+    self._set.update(changes)
+    row, column = self._cells[(current_time - 1)//self._dwell]
+    made = self._acquire(laser_obj)
+    # the setpoint is marked on the lock-in time axis, NaN before any sample
+    start = made[-1][0] if changes and made else np.nan
+    self._pending.append((row, column, start, cursor))
+
+##
+# The GridScan class maps the lock-in signal over a grid of wavelengths and
+# currents. The cells are visited in serpentine order, dwelling at each,
+# and the samples of every cell are reduced to their mean, standard error
+# and count directly into a GridMap as the scan runs. With a file, the map
+# is saved after every cell and a scan built again with the same file and
+# axes resumes, visiting only the cells not filled yet.
+#
+# Example: The following maps three wavelengths by four currents, 10
+# seconds per cell, and can be rerun to finish an interrupted map.
+#
+# scan = GridScan.builder() \
+#   .with_wavelengths([1000, 1050, 1100]) \
+#   .with_currents([1300, 1400, 1500, 1600]) \
+#   .with_dwell(10) \
+#   .with_file('map.npz') \
+#   .build()
+# grid = scan.run()
+# grid.mean
+
+class GridScan:
+
+  ##
+  # Builder for grid scans, validates the parameters
+  class Builder:
+    _wavelengths = None
+    _currents = None
+    _dwell = 10
+    _settle = 2
+    _outer = 'wavelength'
+    _path = None
+    _instrument = None
+
+    ##
+    # Wavelengths of the rows of the map
+    def with_wavelengths(self, values):
+      self._wavelengths = sorted(values)
+      return self
+
+    ##
+    # Currents of the columns of the map
+    def with_currents(self, values):
+      self._currents = sorted(values)
+      return self
+
+    ##
+    # Seconds spent in every cell
+    def with_dwell(self, dwell):
+      self._dwell = dwell
+      return self
+
+    ##
+    # Seconds at the start of every cell that are left out of the
+    # reduction while the signal settles
+    def with_settle(self, settle):
+      self._settle = settle
+      return self
+
+    ##
+    # Axis stepped once per row, one of AXES. Defaults to the wavelength,
+    # as it is the slower to change
+    def with_outer(self, axis):
+      self._outer = axis
+      return self
+
+    ##
+    # File the map is saved to after every cell, and resumed from if it
+    # exists
+    def with_file(self, path):
+      self._path = path
+      return self
+
+    ##
+    # Name of the instrument scanned, the default laser if None
+    def with_instrument(self, instrument):
+      self._instrument = instrument
+      return self
+
+    ##
+    # Validates the parameters and builds the scan
+    def build(self):
+      assert self._wavelengths and self._currents
+      assert int(self._dwell) == self._dwell and self._dwell > 0
+      assert 0 <= self._settle < self._dwell
+      assert self._outer in AXES
+      return GridScan(self)
+
+  @staticmethod
+  ##
+  # Should be called by the user to retrieve the class Builder
+  def builder():
+    return GridScan.Builder()
+
+  def __init__(self, builder):
+    self._dwell = int(builder._dwell)
+    self._instrument = builder._instrument
+    self._path = builder._path
+
+    ## GridMap the scan fills
+    self.grid = GridMap(builder._wavelengths, builder._currents)
+    if self._path is not None and os.path.exists(self._path):
+      saved = GridMap.load(self._path)
+      if not (np.array_equal(saved.wavelengths, self.grid.wavelengths) and
+              np.array_equal(saved.currents, self.grid.currents)):
+        raise ValueError('{} holds a map over other wavelengths or currents'.format(self._path))
+      self.grid = saved
+
+    ## Cells visited, as (wavelength index, current index) in order
+    self.cells = serpentine_cells(self.grid.values.shape[:2], builder._outer,
+      self.grid.filled)
+    self._action = GridCellAction(self.grid, self.cells, self._dwell,
+      builder._settle, self._instrument, self._path)
+    self._experiment = None
+    if self.cells:
+      self._experiment = Experiment.builder() \
+        .with_actions([self._action]) \
+        .with_duration(len(self.cells)*self._dwell + 1) \
+        .build()
+
+  ##
+  # The underlying Experiment the cells are compiled into, None if every
+  # cell is filled already
+  def experiment(self):
+    return self._experiment
+
+  ##
+  # Estimate of the scan before running it, see ScanExperiment.estimate.
+  # Only the cells left to fill are counted
+  def estimate(self, tune_time = 5.0, params_time = 0.0):
+    if not self.cells:
+      return ScanEstimate(0, 0, 0.0, 0.0)
+    rows, columns = np.array(self.cells).T
+    wavelengths = self.grid.wavelengths[rows]
+    currents = self.grid.currents[columns]
+    tunes = int(np.count_nonzero(np.diff(wavelengths))) + 1
+    changes = int(np.count_nonzero(np.diff(currents))) + 1
+    ticks = self._experiment._duration
+    return ScanEstimate(len(self.cells), ticks, tuning_distance(wavelengths),
+      ticks + tunes*tune_time + changes*params_time)
+
+  ##
+  # Runs the scan, and reduces the last cells once the laser is off
+  def run(self):
+    if self._experiment is not None:
+      self._experiment.run()
+    self._action.collect(final = True)
+    if self._path is not None:
+      self.grid.save(self._path)
+    return self.grid
@@ -0,0 +1,282 @@
+import argparse
+import io
+import json
+import os
+import struct
+import sys
+import time
+import zlib
+import numpy as np
+
+##
+# Every journal record is a header of the record kind, the payload length
+# and the CRC-32 of the payload, followed by the payload. A record cut short
+# or damaged by a crash fails its CRC, and it and everything after it is
+# ignored on recovery.
+HEADER = struct.Struct('<4sBII')
+MAGIC = b'ALJ1'
+
+## Record kind of the start of a run: JSON of the duration, action names,
+#  instruments and wall clock start time.
+START = 0
+## Record kind of acquired samples: instrument index as uint16, then the
+#  float64 times and the float64 data of the samples.
+SAMPLES = 1
+## Record kind of a completed tick: JSON of the tick, the setpoints made
+#  since the last one, as [instrument index, time, field, value], and the
+#  acquisition events, as [instrument index, time, setting, old, new].
+TICK = 2
+## Record kind of the end of a run: JSON of whether it completed and the
+#  error that stopped it, if any.
+END = 3
+## Record kind of merged channel samples: instrument index as uint16, then
+#  the structured array of the samples in .npy format.
+CHANNELS = 4
+
+##
+# The Journal class appends what an experiment has done so far to a file,
+# so a run can be rebuilt after a crash: the samples each laser acquired,
+# compact or merged from several channels as well, the setpoints made, the
+# changes of poll length and demod rate and the last tick completed.
+#
+# Records are written at every checkpoint, i.e. every tick, but only forced
+# to disk with fsync once every flush_interval seconds and when the journal
+# is closed, which bounds the cost of journaling to one fsync per interval.
+# At most flush_interval seconds of the run are lost in a crash.
+#
+# Experiments keep a journal when built with .with_journal(path).
+#
+# Example: Recovering a run from the command line
+#
+# python journal.py recover run.journal
+#
+# which reports where the experiment stopped and writes the recovered
+# samples next to the journal as .csv files, in the layout of Data.csv, and
+# merged channel samples as _samples.npy files.
+
+class Journal:
+
+  def __init__(self, path, flush_interval = 1.0):
+    self.path = path
+    self.flush_interval = flush_interval
+    self._file = open(path, 'wb')
+    self._lasers = []
+    self._cursors = []
+    self._last_sync = time.monotonic()
+    self.syncs = 0
+
+  ##
+  # Records the start of a run and the lasers whose data and setpoints
+  # are journaled from then on. instruments are their names
+  def start(self, duration, actions, lasers, instruments):
+    self._lasers = list(lasers)
+    # what was acquired before the start is not journaled
+    self._cursors = []
+    for laser_obj in self._lasers:
+      acquired = acquired_since(laser_obj, 0, 0)
+      self._cursors.append((acquired['data_end'], acquired['setpoints_end'],
+                            acquired['events_end']))
+    self._write(START, json.dumps({
+      'duration': duration,
+      'actions': ['{} {}'.format(type(action).__name__, getattr(action, '_field_name', ''))
+                  for action in actions],
+      'instruments': instruments,
+      'started': time.time(),
+    }).encode())
+    self._sync()
+
+  ##
+  # Appends the samples and setpoints acquired since the last checkpoint
+  # and the tick just completed, forcing them to disk if flush_interval
+  # has passed since the last time
+  def checkpoint(self, current_time):
+    setpoints, events = self._collect()
+    self._write(TICK, json.dumps({'tick': current_time, 'setpoints': setpoints,
+                                  'events': events}, default = float).encode())
+    if time.monotonic() - self._last_sync >= self.flush_interval:
+      self._sync()
+
+  ##
+  # Appends what is left and the end of the run, and closes the file
+  def close(self, completed, error = None):
+    setpoints, events = self._collect()
+    if setpoints or events:
+      self._write(TICK, json.dumps({'tick': None, 'setpoints': setpoints,
+                                    'events': events}, default = float).encode())
+    self._write(END, json.dumps({
+      'completed': completed,
+      'error': None if error is None else repr(error),
+    }).encode())
+    self._sync()
+    self._file.close()
+
+  def _collect(self):
+    setpoints = []
+    events = []
+    for index, laser_obj in enumerate(self._lasers):
+      acquired = acquired_since(laser_obj, *self._cursors[index])
+      for t, d in zip(acquired['time_axis'], acquired['data']):
+        t = np.asarray(t, dtype = np.float64)
+        d = np.asarray(d, dtype = np.float64)
+        self._write(SAMPLES, struct.pack('<H', index) + t.tobytes() + d.tobytes())
+      for merged in acquired['samples']:
+        payload = io.BytesIO()
+        np.save(payload, merged)
+        self._write(CHANNELS, struct.pack('<H', index) + payload.getvalue())
+      for when, field_name, value in acquired['setpoints']:
+        setpoints.append([index, when, field_name, value])
+      for event in acquired['events']:
+        events.append([index] + list(event))
+      self._cursors[index] = (acquired['data_end'], acquired['setpoints_end'],
+                              acquired['events_end'])
+    return setpoints, events
+
+  def _write(self, kind, payload):
+    self._file.write(HEADER.pack(MAGIC, kind, len(payload), zlib.crc32(payload)))
+    self._file.write(payload)
+
+  def _sync(self):
+    self._file.flush()
+    os.fsync(self._file.fileno())
+    self._last_sync = time.monotonic()
+    self.syncs += 1
+
+##
+# What laser_obj acquired after the cursors, as Laser.since gives it, also
+# for instruments without since. Used by the journal and the grid scan to
+# read only what is new at every tick
+def acquired_since(laser_obj, data_cursor, setpoints_cursor, events_cursor = 0):
+  since = getattr(laser_obj, 'since', None)
+  if since is None:
+    return _since(laser_obj, data_cursor, setpoints_cursor, events_cursor)
+  return since(data_cursor, setpoints_cursor, events_cursor)
+
+##
+# Laser.since for instruments without it, read from their data, time_axis
+# and setpoints lists. Cursors count from the start of the run, the lists
+# only hold what was not moved out into segments
+def _since(laser_obj, data_cursor, setpoints_cursor, events_cursor):
+  # the poll thread appends data before time_axis, so every chunk counted
+  # in time_axis is complete
+  offset = getattr(laser_obj, 'data_offset', 0)
+  first = max(data_cursor - offset, 0)
+  time_axis = getattr(laser_obj, 'time_axis', [])[first:]
+  data = getattr(laser_obj, 'data', [])[first:first + len(time_axis)]
+  made_offset = getattr(laser_obj, 'setpoints_offset', 0)
+  made = getattr(laser_obj, 'setpoints', [])[max(setpoints_cursor - made_offset, 0):]
+  return {'time_axis': time_axis, 'data': data, 'samples': [],
+          'data_end': offset + first + len(time_axis), 'setpoints': made,
+          'setpoints_end': max(setpoints_cursor, made_offset) + len(made),
+          'events': [], 'events_end': events_cursor}
+
+##
+# What recover could rebuild of a run. data holds, per instrument name, a
+# tuple of (time axis, data) arrays and samples the merged channel samples
+# of the instruments that acquire several; events holds the acquisition
+# events as [instrument index, time, setting, old, new]; last_tick is the last tick completed,
+# None if none was; completed is whether the run reached its end and
+# truncated the number of bytes of damaged records ignored at the end
+class Recovery:
+
+  def __init__(self):
+    self.duration = None
+    self.actions = []
+    self.instruments = []
+    self.started = None
+    self.last_tick = None
+    self.completed = False
+    self.error = None
+    self.setpoints = []
+    self.events = []
+    self.data = {}
+    self.samples = {}
+    self.truncated = 0
+
+  ##
+  # One line description of where the run stopped
+  def report(self):
+    if self.completed:
+      return 'Run completed all {} ticks.'.format(self.duration)
+    stopped = 'Run stopped after tick {} of {}'.format(self.last_tick or 0, self.duration)
+    if self.error is not None:
+      stopped += ' with {}'.format(self.error)
+    elif self.truncated:
+      stopped += ', {} damaged bytes at the end of the journal were ignored'.format(self.truncated)
+    return stopped + '.'
+
+##
+# Rebuilds a run from its journal, up to the first damaged record
+def recover(path):
+  with open(path, 'rb') as f:
+    content = f.read()
+  recovery = Recovery()
+  chunks = {}
+  merged = {}
+  offset = 0
+  while offset + HEADER.size <= len(content):
+    magic, kind, length, crc = HEADER.unpack_from(content, offset)
+    payload = content[offset + HEADER.size:offset + HEADER.size + length]
+    if magic != MAGIC or len(payload) != length or zlib.crc32(payload) != crc:
+      break
+    offset += HEADER.size + length
+
+    if kind == SAMPLES:
+      index, = struct.unpack_from('<H', payload)
+      samples = np.frombuffer(payload, dtype = np.float64, offset = 2)
+      chunks.setdefault(index, []).append(samples.reshape(2, -1))
+      continue
+    if kind == CHANNELS:
+      index, = struct.unpack_from('<H', payload)
+      merged.setdefault(index, []).append(np.load(io.BytesIO(payload[2:])))
+      continue
+    record = json.loads(payload)
+    if kind == START:
+      recovery.duration = record['duration']
+      recovery.actions = record['actions']
+      recovery.instruments = record['instruments']
+      recovery.started = record['started']
+    elif kind == TICK:
+      if record['tick'] is not None:
+        recovery.last_tick = record['tick']
+      recovery.setpoints.extend(record['setpoints'])
+      recovery.events.extend(record.get('events', []))
+    elif kind == END:
+      recovery.completed = record['completed']
+      recovery.error = record['error']
+  recovery.truncated = len(content) - offset
+
+  for index, name in enumerate(recovery.instruments):
+    samples = chunks.get(index)
+    if samples:
+      recovery.data[name] = tuple(np.concatenate(samples, axis = 1))
+    else:
+      recovery.data[name] = (np.empty(0), np.empty(0))
+    if index in merged:
+      recovery.samples[name] = np.concatenate(merged[index])
+  return recovery
+
+##
+# Command line entry point: python journal.py recover run.journal
+def main(argv = None):
+  parser = argparse.ArgumentParser(prog = 'python journal.py')
+  commands = parser.add_subparsers(dest = 'command')
+  commands.required = True
+  rec = commands.add_parser('recover', help = 'rebuild a run from its journal')
+  rec.add_argument('journal', help = 'journal file of the run')
+  args = parser.parse_args(argv)
+
+  recovery = recover(args.journal)
+  print(recovery.report())
+  base = os.path.splitext(args.journal)[0]
+  for name, (time_axis, data) in recovery.data.items():
+    path = base + ('' if name is None else '_' + str(name)) + '.csv'
+    np.savetxt(path, np.stack([data, time_axis]), delimiter = ',')
+    print('{} samples written to {}'.format(data.size, path))
+  for name, samples in recovery.samples.items():
+    path = base + ('' if name is None else '_' + str(name)) + '_samples.npy'
+    np.save(path, samples)
+    print('{} channel samples written to {}'.format(samples.size, path))
+  return 0 if recovery.completed else 1
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -1,14 +1,21 @@
+import asyncio
 import time
 import os
 import sys
 import platform
 from ctypes import CDLL, pointer, c_uint32, c_uint16, c_uint8, c_bool, c_float, c_char
-from threading import Thread
-import numpy as np
-import zhinst
-import zhinst.ziPython
-import zhinst.utils
+from threading import Thread, Event, Lock
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import numpy as np
+from clock import SystemClock
+from laser.live_feed import LiveFeed
+from laser.instrumentation import CallRecorder, InstrumentedProxy, sidekick_failed
+from laser.acquisition import AcquisitionProcess, demod_raw, demod_sample
+from laser.sidekick import QclParams, bind
+from laser.shadow import ShadowState
+from laser.adaptive import AcquisitionController
+from laser.channels import magnitude
 
 ## Exception class indicating an issue with laser-centric systems.
 class Laser_Exception(Exception):
@@ -22,33 +29,134 @@ class QCL_Exception(Exception):
 class SDK_Exception(Exception):
     pass
 
+## QCL fields settable through set_field, mapped to the Laser attribute
+#  holding the requested value and the key of its pointer in qcl_params.
+QCL_FIELDS = {
+    'pulse_width': ('qcl_pulse_width_ns', 'pulse_width_ns_ptr'),
+    'pulse_rate': ('qcl_pulse_rate_hz', 'pulse_rate_hz_ptr'),
+    'current': ('qcl_current_ma', 'current_ma_ptr'),
+}
+
 ## Driver for controlling the Daylight solutions laser through the SideKick SDK,
 #  as well as retrieving data from a reciever set up with the corresponding laser.
 #  Singleton class to prevent program from having to drivers running simultaneously
+#
+#  Further laser/lock-in pairs are registered by name and created on first
+#  use, each with its own acquisition thread, or in its own process when
+#  registered with remote=True. get() without a name returns the default
+#  instrument.
+#
+#  Example: Two benches, the second hosted in its own process
+#
+#  laser.register('bench_a', lockin_ip='192.168.48.102', lockin_device='dev1234')
+#  laser.register('bench_b', remote=True, lockin_ip='192.168.48.103', usb_device=1)
+#  actions = [ScheduledAction('wavelength', {1: 1000}, instrument='bench_a'),
+#             ScheduledAction('wavelength', {1: 1100}, instrument='bench_b')]
 
 __global_laser_do_not_touch = {
   '__instance': None,
   '__get_called': False,
+  '__instruments': {},
+  '__configs': {},
+  '__default': None,
 }
 
-def get():
+## @brief The laser registered under name, created on first use.
+#
+#  @param name Name given to register, or None for the default instrument.
+#  @exception Laser_Exception Thrown if no instrument is registered under name.
+def get(name=None):
   global __global_laser_do_not_touch
   __global_laser_do_not_touch['__get_called'] = True
-  if __global_laser_do_not_touch['__instance'] is None:
-    __global_laser_do_not_touch['__instance'] = Laser()
-  return __global_laser_do_not_touch['__instance']
-
-def set_for_test(laser_instance):
+  if name is None:
+    name = __global_laser_do_not_touch['__default']
+  if name is None:
+    if __global_laser_do_not_touch['__instance'] is None:
+      __global_laser_do_not_touch['__instance'] = Laser()
+    return __global_laser_do_not_touch['__instance']
+
+  instruments = __global_laser_do_not_touch['__instruments']
+  if name not in instruments:
+    if name not in __global_laser_do_not_touch['__configs']:
+      raise Laser_Exception("No instrument registered as {}.".format(name))
+    factory, params = __global_laser_do_not_touch['__configs'][name]
+    instruments[name] = factory(**params)
+  return instruments[name]
+
+## @brief Register a laser/lock-in pair under a name, see get.
+#
+#  @param name Name the instrument is retrieved and routed to by.
+#  @param factory Class constructing the instrument, Laser by default.
+#  @param remote Whether to host the instrument in its own process.
+#  @param default Whether get() without a name returns this instrument.
+#  @param params Keyword arguments of factory, e.g. lockin_ip, lockin_device
+#         and usb_device for Laser.
+def register(name, factory=None, remote=False, default=False, **params):
+  global __global_laser_do_not_touch
+  factory = Laser if factory is None else factory
+  if remote:
+    from laser.remote import RemoteLaser
+    params = dict(params, factory=factory)
+    factory = RemoteLaser
+  __global_laser_do_not_touch['__configs'][name] = (factory, params)
+  if default:
+    __global_laser_do_not_touch['__default'] = name
+
+## @brief Names of all registered instruments.
+def instruments():
+  return list(__global_laser_do_not_touch['__configs'])
+
+def set_for_test(laser_instance, name=None):
   global __global_laser_do_not_touch
   if __global_laser_do_not_touch['__get_called']:
     raise RuntimeError("Can not call set() after get()")
-  __global_laser_do_not_touch['__instance'] = laser_instance
+  if name is None:
+    __global_laser_do_not_touch['__instance'] = laser_instance
+  else:
+    __global_laser_do_not_touch['__instruments'][name] = laser_instance
+
+## @brief Route get() to the given instruments for the duration of a with
+#         block, e.g. to dry-run an experiment on EmulatedLasers, and
+#         restore the registry afterwards.
+#
+#  @param instances Dictionary of instrument name, None for the default,
+#         to the object get() returns for it.
+@contextmanager
+def substitute(instances):
+  global __global_laser_do_not_touch
+  saved = __global_laser_do_not_touch
+  named = {name: obj for name, obj in instances.items() if name is not None}
+  __global_laser_do_not_touch = dict(saved,
+    __instance=instances.get(None, saved['__instance']),
+    __instruments=dict(saved['__instruments'], **named),
+    __default=None)
+  try:
+    yield
+  finally:
+    __global_laser_do_not_touch = saved
+
+## @brief Context manager that does nothing, as contextlib.nullcontext,
+#         which needs Python 3.7.
+@contextmanager
+def _untimed():
+  yield
+
+## @brief Write rows to a .csv file, or remove the file if there are none,
+#         so that no file of an earlier run is left next to the new data.
+def _save_rows(path, rows):
+  if rows:
+    np.savetxt(path, np.array(rows, dtype=object), fmt="%s", delimiter=",")
+  elif os.path.exists(path):
+    os.remove(path)
 
 def reset_for_testing():
   global __global_laser_do_not_touch
   __global_laser_do_not_touch = {
     '__instance': None,
     '__get_called': False,
+    '__instruments': {},
+    '__configs': {},
+    '__default': None,
   }
 
 class Laser:
@@ -62,8 +170,24 @@ class Laser:
     # @param testing_sdk SideKickSDK library if None, else class with equivalent methods for testing.
     # @param testing_zisdk ZI library if None, else class with equivalent methods for testing.
     # @param sdk_version 86 or 64 (which version of Sidekick sdk to load).
+    # @param instrument Whether to time every SDK and lock-in call, see call_stats.
+    #        If None, enabled when the ALIRA_INSTRUMENT environment variable is 1.
+    # @param lockin_ip IP of the lock-in data server, the bench default if None.
+    # @param lockin_device Serial of the lock-in (e.g. 'dev1234'), autodetected if None.
+    # @param usb_device Index of the laser among the USB devices, the last one if None.
+    # @param acquisition_process Whether to poll the lock-in from a dedicated
+    #        process, see laser.acquisition, rather than from a thread.
+    # @param channels laser.channels.Channels of the demods and aux inputs to
+    #        acquire into samples, only the magnitude of lockin_demod_c if None.
+    # @param compact Whether to record lockin_demod_c into a
+    #        data_analysis.compact.CompactLog, saved as Data.npz, instead of
+    #        data and time_axis. Ignored with channels or acquisition_process.
+    # @param clock Clock every wait on the hardware goes through, a
+    #        clock.SystemClock if None.
     # @exception SDK_Exception if SDK cannot be initialized.
-    def __init__(self, testing_sdk=None, testing_zi_sdk=None, sdk_version=None):
+    def __init__(self, testing_sdk=None, testing_zi_sdk=None, sdk_version=None,
+                 instrument=None, lockin_ip=None, lockin_device=None, usb_device=None,
+                 acquisition_process=False, channels=None, compact=False, clock=None):
 
         if sdk_version == 64:
             self.sdk_location = os.path.join(os.path.dirname(__file__), 'SidekickSDKx64.dll')
@@ -94,6 +218,10 @@ class Laser:
         self.laser_on_attempts = 3
         ## Time to wait after the laser has been turned on for normalization of operation.
         self.laser_on_wait = 5
+        ## Time allowed for the lock-in to capture each requested transient.
+        self.transient_timeout = 10
+        ## Clock the waits and timeouts above are measured on.
+        self.clock = SystemClock() if clock is None else clock
         # @}
 
 
@@ -124,13 +252,15 @@ class Laser:
         #@{
 
         ## IP of the device
-        self.lockin_ip = '192.168.48.102'
+        self.lockin_ip = '192.168.48.102' if lockin_ip is None else lockin_ip
+        ## Serial of the lock-in to use, autodetected if None.
+        self.lockin_device = lockin_device
         ## Port to use for communication
         self.lockin_port = 8004
         ## Amplitude modulation factor.
         self.lockin_amplitude = 1.0
-        ## Poll sample length for the lock in.
-        self.lockin_poll_length = 30
+        ## Length in seconds of each poll slice taken by the acquisition thread.
+        self.lockin_poll_length = 0.1
         ## Demod channel, for paths on the device.
         self.lockin_demod_c = '0'
         ## Signal input channel
@@ -147,6 +277,14 @@ class Laser:
         self.poll_timeout = 500
         ## Demod rate of 80 # 300 [samples / s]
         self.demod_rate = 2e3
+        ## laser.channels.Channels acquired into samples, None for only the
+        #  magnitude of lockin_demod_c.
+        self.lockin_channels = channels
+        ## Whether samples are recorded into compact_log.
+        self.compact = compact
+        ## data_analysis.compact.CompactLog of raw ticks and float32 x, y,
+        #  created when acquisition starts if compact is set.
+        self.compact_log = None
 
         #@}
 
@@ -156,13 +294,29 @@ class Laser:
 
         ## Used to see if the SDK is indeed retrieved.
         self.sidekick_sdk_ret_success = 0
-        ## SDK object used to access all laser operation functions.
-        self.sdk = CDLL(self.sdk_location) if testing_sdk is None else testing_sdk
-        ## Zurich Instrumentes SDK for lockin actions.
-        self.zi_sdk = zhinst if testing_zi_sdk is None else testing_zi_sdk
+        if instrument is None:
+            instrument = os.environ.get('ALIRA_INSTRUMENT') == '1'
+        ## CallRecorder timing every SDK and lock-in call, None when not instrumented.
+        self.call_recorder = CallRecorder() if instrument else None
+        ## SDK object used to access all laser operation functions, with the
+        #  signatures declared by laser.sidekick.
+        self.sdk = bind(CDLL(self.sdk_location) if testing_sdk is None else testing_sdk)
+        if self.call_recorder is not None:
+            self.sdk = InstrumentedProxy(self.sdk, self.call_recorder,
+                                         'sidekick.', sidekick_failed)
+        ## Zurich Instrumentes SDK for lockin actions, imported only when a
+        #  real laser is created so that the rest of the package works
+        #  without it.
+        if testing_zi_sdk is None:
+            import zhinst.ziPython
+            import zhinst.utils
+            testing_zi_sdk = zhinst
+        self.zi_sdk = testing_zi_sdk
 
         self.__call_sdk_bool(self.sdk.SidekickSDK_Initialize,
                             'SDK initialization successful', 'Unable to initialize SDK')
+        ## Index of the laser among the connected USB devices, the last if None.
+        self.usb_device = usb_device
         ## Daylight SDK Object pointer to pass to laser functions.
         self.handle = None
         ## ZI sdk object pointer for lock-in function.
@@ -213,18 +367,74 @@ class Laser:
         self.keep_on = c_uint8(1)
         ## Dummy parameter for function which is meant for non SideKick Projects.
         self.pref_qcl = c_uint8(0)
+        ## QCL parameters, read into and written from in place.
+        self.qcl_params = QclParams()
+        ## Status flag filled in by the SDK status checks.
+        self.status_ptr = pointer(c_bool(False))
+        ## Parameter values confirmed by the controller, see laser.shadow.
+        #  Confirmed values are trusted for five minutes.
+        self.shadow = ShadowState(max_age=300)
 
         #@}
 
         ## Thread object for collecting data when the laser is in operation.
+        #  With acquisition_process it drains the shared ring instead of polling.
         self.poll_thread = None
 
-        ## Array into which data observed from the sensor is written.
+        ## Whether the lock-in is polled from a dedicated process.
+        self.acquisition_process = acquisition_process
+        ## The AcquisitionProcess when acquisition_process is set.
+        self.acquisition = None
+        ## Samples the shared ring holds, about 35 minutes at 2 kHz.
+        self.acquisition_capacity = 2**22
+        ## Seconds between drains of the shared ring.
+        self.acquisition_drain_interval = 0.2
+        ## Number of drains that found samples overwritten before being read.
+        self.acquisition_overruns = 0
+        ## Lowest demod rate the acquisition thread may step down to when
+        #  samples are lost, None to keep demod_rate fixed.
+        self.min_demod_rate = 250
+        ## AcquisitionController adapting the polls of the acquisition thread,
+        #  created when it starts. Its gaps and events record lost samples and
+        #  every change of poll length or demod rate.
+        self.acquisition_controller = None
+
+        ## Single worker executor running the SDK calls of the async methods,
+        #  created on first use. One worker keeps SDK calls serialized.
+        self.sdk_executor = None
+        # asyncio.Lock serializing set_field_async, created on first use.
+        self.__set_lock = None
+
+        ## Set to ask the acquisition thread to finish its current slice and exit.
+        self.poll_stop = Event()
+
+        ## Latest acquired samples and setpoint markers, for live viewers.
+        self.live_feed = LiveFeed()
+
+        ## Every (time, field_name, value) set during operation, with times on
+        #  the same axis as self.time_axis. Used to reduce data per step.
+        self.setpoints = []
+
+        ## List of arrays, one per poll slice, of data observed from the sensor.
         self.data = []
 
-        ## Array into which time data corresponding to observation data is stored.
+        ## List of arrays, one per poll slice, of times corresponding to self.data.
         self.time_axis = []
 
+        ## Number of chunks moved out of data and time_axis, e.g. into segments
+        #  by data_analysis.segments.SegmentWriter, or of samples out of
+        #  compact_log for compact lasers, and of entries out of setpoints.
+        self.data_offset = 0
+        self.setpoints_offset = 0
+        # Held while acquired entries are moved out, see take_acquired.
+        self.__acquired_lock = Lock()
+        # Events of acquisition_controller already handed out by take_acquired.
+        self.__events_taken = 0
+
+        ## List of structured arrays, one per poll slice, of every channel of
+        #  lockin_channels. Empty when lockin_channels is None.
+        self.samples = []
+
         self.__startup()
 
     ## @brief Begins laser operation within the context of an experiment.
@@ -236,7 +446,7 @@ class Laser:
     #  @exception QCL_Exception Thrown if errors arrise in this portion of the process.
     #  @exception Laser_Exception Thrown if errors arrise in this portion of the process.
     #  @exception SDK_Exception Thrown if errors arrise in this portion of the process.
-    def __startup():
+    def __startup(self):
 
         # Begin firing the physical system with the initial parameter conditions.
         try:
@@ -247,17 +457,30 @@ class Laser:
             self.__turn_on_laser()
             self.__connect_to_lockin()
             self.__initialize_lockin()
-            self.poll_thread = Thread(target=self.__collect_data, args=(self.data, self.time_axis), name="poll_thread")
+            if self.acquisition_process:
+                self.acquisition = AcquisitionProcess(
+                    self.device, self.lockin_demod_c, self.lockin_ip, self.lockin_port,
+                    self.lockin_poll_length, self.poll_timeout, self.acquisition_capacity)
+                self.acquisition.start()
+                collect = self.__drain_acquisition
+            else:
+                collect = self.__collect_data
+            self.poll_thread = Thread(target=collect, args=(self.data, self.time_axis), name="poll_thread")
             self.poll_thread.start()
         except:
-            e = sys.exc_info()[0]
-            self.turn_off_laser()
-            raise e
+            # Shut down whatever was started, without letting a failure to
+            # do so hide the error that stopped the startup.
+            try:
+                self.turn_off_laser()
+            except Exception as e:
+                sys.stderr.write('warning: Shutdown after failed startup failed: %r\n' % (e,))
+            raise
 
     ## @Brief Connect to laser using USB port.
     #
     #  @exception SDK_Exception Thrown if __connect_laser does not establish connection.
     def __connect_laser(self):
+        self.shadow.invalidate()
         num_devices_ptr = pointer(c_uint16())
         handle_ptr = pointer(c_uint32())
         self.__call_sdk_bool(self.sdk.SidekickSDK_SearchForUsbDevices,
@@ -266,7 +489,8 @@ class Laser:
                             'Got device count.', 'Error when getting device count.', num_devices_ptr)
         self.__call_sdk_bool(self.sdk.SidekickSDK_ConnectToDeviceNumber,
                             'Connected to laser.', 'Unable to connect to laser.',
-                            handle_ptr, c_uint16(num_devices_ptr.contents.value - 1))
+                            handle_ptr, c_uint16(num_devices_ptr.contents.value - 1
+                                                 if self.usb_device is None else self.usb_device))
         self.handle = handle_ptr.contents
         self.sdk.SidekickSDK_ReadAdminQclParams(self.handle, 0)
         self.__call_sdk_bool_ptr(self.sdk.SidekickSDK_AdminQclIsAvailable,
@@ -285,12 +509,12 @@ class Laser:
         self.sdk.SidekickSDK_ExecLaserArmDisarm(self.handle)
         self.sdk.SidekickSDK_ReadInfoStatusMask(self.handle)
         self.sdk.SidekickSDK_isLaserArmed(self.handle, is_armed_ptr)
-        old_t = time.time()
+        old_t = self.clock.now()
         while not is_armed_ptr.contents.value:
-            time.sleep(1)
+            self.clock.sleep(1)
             self.sdk.SidekickSDK_ReadInfoStatusMask(self.handle)
             self.sdk.SidekickSDK_isLaserArmed(self.handle, is_armed_ptr)
-            curr_t = time.time()
+            curr_t = self.clock.now()
             if curr_t - old_t > self.arm_laser_timeout:
                 raise Laser_Exception("Laser not armed.")
         sys.stderr.write("Laser is armed.\n")
@@ -299,22 +523,31 @@ class Laser:
     #
     #  @exception QCL_Exception Thrown if __set_qcl_params unable to set the parameters within the given time.
     def __set_qcl_params(self):
+        self.__drive(self.__set_qcl_params_steps())
+
+    ## @brief Steps of __set_qcl_params, see __drive.
+    def __set_qcl_params_steps(self):
         qcl_params = self.__read_qcl_params()
-        qcl_params['pulse_rate_hz_ptr'].contents = c_uint32(self.qcl_pulse_rate_hz)
-        qcl_params['temp_c_ptr'].contents = c_float(self.qcl_temp)
-        qcl_params['current_ma_ptr'].contents = c_uint16(self.qcl_current_ma)
-        qcl_params['pulse_width_ns_ptr'].contents = c_uint32(self.qcl_pulse_width_ns)
+        qcl_params['pulse_rate_hz_ptr'].contents.value = self.qcl_pulse_rate_hz
+        qcl_params['temp_c_ptr'].contents.value = self.qcl_temp
+        qcl_params['current_ma_ptr'].contents.value = self.qcl_current_ma
+        qcl_params['pulse_width_ns_ptr'].contents.value = self.qcl_pulse_width_ns
         self.__update_qcl_params(qcl_params)
-        old_t = time.time()
-        while (qcl_params['pulse_rate_hz_ptr'].contents.value != self.qcl_pulse_rate_hz or
-               qcl_params['temp_c_ptr'].contents.value != self.qcl_temp or
-               qcl_params['current_ma_ptr'].contents.value != self.qcl_current_ma or
-               qcl_params['pulse_width_ns_ptr'].contents.value != self.qcl_pulse_width_ns):
+        old_t = self.clock.now()
+        with self.__timed('laser.verify_qcl_params'):
+            # verify against what the controller reads back, not what was written
             qcl_params = self.__read_qcl_params()
-            curr_t = time.time()
-            if curr_t - old_t > self.qcl_set_params_timeout:
-                raise QCL_Exception("Laser parameters not set.")
-            time.sleep(1)
+            while (qcl_params['pulse_rate_hz_ptr'].contents.value != self.qcl_pulse_rate_hz or
+                   qcl_params['temp_c_ptr'].contents.value != self.qcl_temp or
+                   qcl_params['current_ma_ptr'].contents.value != self.qcl_current_ma or
+                   qcl_params['pulse_width_ns_ptr'].contents.value != self.qcl_pulse_width_ns):
+                qcl_params = self.__read_qcl_params()
+                curr_t = self.clock.now()
+                if curr_t - old_t > self.qcl_set_params_timeout:
+                    raise QCL_Exception("Laser parameters not set.")
+                yield 1
+        for field_name, (_, ptr) in QCL_FIELDS.items():
+            self.shadow.confirm(field_name, qcl_params[ptr].contents.value)
         sys.stderr.write("Laser parameters have been set successfully.\n")
 
     ## @brief Set the given parameter, which is  defined to be one of  four strings.
@@ -323,7 +556,9 @@ class Laser:
     #         sanity checks on the value's input. Units of set fields MUST be
     #         those taken by the QCL. Current values should be in mA, pulse pulse
     #         width should be in ns, pulse rate should be in Hz, and wavelength
-    #         should be in wave numbers.
+    #         should be in wave numbers. Every successful set is recorded
+    #         in setpoints and as a marker on live_feed. Values the controller
+    #         has already confirmed (see shadow) are not written again.
     #
     #  @param value Wavelength value to which the laser will be tuned.
     #
@@ -335,41 +570,139 @@ class Laser:
     #         laser_obj.set_field("current", 1250)
     #
     def set_field(self, field_name, value):
+        self.__drive(self.__set_field_steps(field_name, value))
+
+    ## @brief Awaitable version of set_field.
+    #
+    #         The SDK calls run on sdk_executor and the waits in between are
+    #         asyncio sleeps, so the event loop stays free while the laser
+    #         tunes or settles. Calls on the same laser are serialized.
+    #
+    #         Example: Tune two lasers at once
+    #
+    #         await asyncio.gather(laser_a.set_field_async("wavelength", 1000),
+    #                              laser_b.set_field_async("wavelength", 1100))
+    #
+    #  @exception Laser_Exception Thrown for unknown fields or unsafe values.
+    async def set_field_async(self, field_name, value):
+        if self.__set_lock is None:
+            self.__set_lock = asyncio.Lock()
+        async with self.__set_lock:
+            await self.__drive_async(self.__set_field_steps(field_name, value))
+
+    ## @brief Steps of set_field, see __drive.
+    #
+    #         Values matching the confirmed shadow state are not written
+    #         again, but are still recorded as setpoints. Any error while
+    #         writing invalidates the shadow state.
+    def __set_field_steps(self, field_name, value):
+        self.__check_field(field_name, value)
+
+        if not self.shadow.matches(field_name, value):
+            try:
+                if field_name == "wavelength":
+                    yield from self.__set_wavelength_steps(value)
+                else:
+                    setattr(self, QCL_FIELDS[field_name][0], value)
+                    yield from self.__set_qcl_params_steps()
+            except BaseException:
+                self.shadow.invalidate()
+                raise
+
+        self.setpoints.append(self.live_feed.mark(field_name, value))
+
+    ## @brief Check that a field exists and that value is within its safe bounds.
+    #
+    #  @exception Laser_Exception Thrown for unknown fields or unsafe values.
+    def __check_field(self, field_name, value):
         if(field_name == "pulse_width" and
             value <= self.max_pulse_width and value >= self.min_pulse_width):
-            self.qcl_pulse_width_ns = value
-            self.__set_qcl_params()
+            return
 
         elif(field_name == "pulse_rate" and
             value <= self.max_pulse_rate and value >= self.min_pulse_rate):
-            self.qcl_pulse_rate_hz = value
-            self.__set_qcl_params()
+            return
 
         elif(field_name == "wavelength" and
             value <= self.max_wavelength and value >= self.min_wavelength):
-            self.__set_wavelength(value)
+            return
 
         elif(field_name == "current" and
             value <= self.max_current and value >= self.min_current):
-            self.qcl_current_ma = value
-            self.__set_qcl_params()
+            return
 
-        else:
-            raise Laser_Exception("This is not a valid parameter set.")
+        raise Laser_Exception("This is not a valid parameter set.")
 
-    ## @brief Set wavelength for the laser emission in units stored by the object.
+    ## @brief Current value of a field.
+    #
+    #         Answered from the shadow state when it holds a confirmed value,
+    #         otherwise, or when fresh is set, read from the controller and
+    #         confirmed. The wavelength cannot be read back from the
+    #         controller, so it is only known once tuned.
+    #
+    #  @param field_name One of pulse_width, pulse_rate, current or wavelength.
+    #  @param fresh Whether to read from the controller even if confirmed.
+    #  @returns The value, None for a wavelength that is not confirmed.
+    #  @exception Laser_Exception Thrown for unknown fields.
+    def read_field(self, field_name, fresh=False):
+        if field_name == "wavelength":
+            return self.shadow.get(field_name)
+        if field_name not in QCL_FIELDS:
+            raise Laser_Exception("This is not a valid parameter.")
+        value = None if fresh else self.shadow.get(field_name)
+        if value is None:
+            params = self.__read_qcl_params()
+            for name, (_, key) in QCL_FIELDS.items():
+                self.shadow.confirm(name, params[key].contents.value)
+            value = params[QCL_FIELDS[field_name][1]].contents.value
+        return value
+
+    ## @brief Steps setting the wavelength for the laser emission in units
+    #         stored by the object, see __drive.
     #
     #  @param value Wavelength value to which the laser will be tuned.
-    def __set_wavelength(self, value):
+    def __set_wavelength_steps(self, value):
         units = self.qcl_wvlen_units
         self.wavelength = value
         set_ptr = pointer(c_bool(True))
         self.sdk.SidekickSDK_SetTuneToWW(self.handle, c_uint8(units),
                                         c_float(value), self.pref_qcl)
         self.sdk.SidekickSDK_ExecTuneToWW(self.handle)
-        time.sleep(5)
+        with self.__timed('laser.tune_wait'):
+            yield 5
+        self.shadow.confirm("wavelength", value)
         sys.stderr.write("Laser wavelength tuning to desired value.\n")
 
+    ## @brief Run an operation written as steps, sleeping between them.
+    #
+    #         Operations that wait on the hardware are generators that make
+    #         their SDK calls and yield the number of seconds to wait before
+    #         they continue. This drives them from the calling thread, and
+    #         __drive_async from an event loop.
+    #
+    #  @param steps Generator yielding wait durations in seconds.
+    def __drive(self, steps):
+        for wait in steps:
+            self.clock.sleep(wait)
+
+    ## @brief Run an operation written as steps from an event loop, making
+    #         the SDK calls on sdk_executor and awaiting the waits.
+    #
+    #  @param steps Generator yielding wait durations in seconds.
+    async def __drive_async(self, steps):
+        loop = asyncio.get_event_loop()
+        while True:
+            wait = await loop.run_in_executor(self.__executor(), next, steps, None)
+            if wait is None:
+                return
+            await self.clock.sleep_async(wait)
+
+    ## @brief The executor for SDK calls, created on first use.
+    def __executor(self):
+        if self.sdk_executor is None:
+            self.sdk_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sdk')
+        return self.sdk_executor
+
     ## @brief Wait for TECs to cool to correct temp.
     #
     #  @exception Laser_Exception Thrown if the TECs are unable to cool to the desired temperature.
@@ -377,15 +710,15 @@ class Laser:
         is_temp_set_ptr = pointer(c_bool(False))
         self.sdk.SidekickSDK_ReadInfoStatusMask(self.handle)
         self.sdk.SidekickSDK_isTempStatusSet(self.handle, is_temp_set_ptr)
-        old_t = time.time()
+        old_t = self.clock.now()
         while not is_temp_set_ptr.contents.value:
-            time.sleep(1)
+            self.clock.sleep(1)
             self.sdk.SidekickSDK_ReadInfoStatusMask(self.handle)
             self.sdk.SidekickSDK_isTempStatusSet(self.handle, is_temp_set_ptr)
-            curr_t = time.time()
+            curr_t = self.clock.now()
             if curr_t - old_t > self.cool_tecs_timeout:
                 raise Laser_Exception("TECs are not cooled.")
-        time.sleep(self.cool_tecs_additional)
+        self.clock.sleep(self.cool_tecs_additional)
         sys.stderr.write('TECs are at the desired temperature.\n')
 
     ## @brief Turn on the actual laser and begin emitting.
@@ -408,12 +741,12 @@ class Laser:
             self.sdk.SidekickSDK_isLaserFiring(self.handle, is_emitting_ptr)
             sys.stderr.write("Turn on attempts: {}.\n".format(attempts))
 
-            old_t = time.time()
+            old_t = self.clock.now()
             curr_t = 0
             while not is_emitting_ptr.contents.value:
-                time.sleep(self.laser_on_wait)
+                self.clock.sleep(self.laser_on_wait)
                 self.sdk.SidekickSDK_isLaserFiring(self.handle, is_emitting_ptr)
-                curr_t = time.time()
+                curr_t = self.clock.now()
                 if curr_t - old_t > self.turn_on_laser_timeout:
                     trial_fail = True
                     break
@@ -437,7 +770,12 @@ class Laser:
     ## @brief Connect to lock-in amplifier.
     def __connect_to_lockin(self):
         self.daq = self.zi_sdk.ziPython.ziDAQServer(self.lockin_ip, self.lockin_port)
-        self.device = self.zi_sdk.utils.autoDetect(self.daq)
+        if self.call_recorder is not None:
+            self.daq = InstrumentedProxy(self.daq, self.call_recorder, 'daq.')
+        if self.lockin_device is None:
+            self.device = self.zi_sdk.utils.autoDetect(self.daq)
+        else:
+            self.device = self.lockin_device
         sys.stderr.write('Connected to lock-In device {}.\n'.format(self.device))
 
     ## @brief Initialize lock-in amplifier.
@@ -471,6 +809,12 @@ class Laser:
         self.daq.setInt('/' + self.device + '/demods/' + self.lockin_demod_c + '/harmonic', 1)
         if 'UHF' in devtype:
             self.daq.setInt('/' + self.device + '/demods/' + self.lockin_demod_c + '/enable', 1)
+        for demod_c in self.__demods():
+            if demod_c == self.lockin_demod_c:
+                continue
+            self.daq.setDouble('/' + self.device + '/demods/' + demod_c + '/rate', self.demod_rate)
+            if 'UHF' in devtype:
+                self.daq.setInt('/' + self.device + '/demods/' + demod_c + '/enable', 1)
         if 'MF' in options:
             self.daq.setInt('/' + self.device + '/demods/*/oscselect', float(self.lockin_osc_c))
             self.daq.setInt('/' + self.device + '/demods/*/adcselect', float(self.lockin_in_c))
@@ -486,21 +830,98 @@ class Laser:
 
         self.daq.unsubscribe('*')
         self.daq.sync()
-        time.sleep(10 * self.lockin_time_constant)
+        self.clock.sleep(10 * self.lockin_time_constant)
+
+    ## @brief Capture decay transients triggered on the lock-in trigger input.
+    #
+    #         Uses the lock-in's data acquisition module, triggered by the
+    #         falling edge of trigger input 1 (the level is set in
+    #         __initialize_lockin), to record count transients of the demod
+    #         magnitude, each duration seconds long from the trigger. Runs
+    #         alongside the continuous acquisition thread.
+    #
+    #  @param count Number of transients to capture.
+    #  @param duration Length of each transient in seconds.
+    #  @returns Tuple of (time axis in seconds from the trigger, array of shape
+    #           (count, samples) with one transient per row).
+    #  @exception Laser_Exception Thrown if the transients are not captured in time.
+    def capture_transients(self, count, duration):
+        samples = int(round(duration * self.demod_rate))
+        signal_path = '/' + self.device + '/demods/' + self.lockin_demod_c + '/sample.r'
+        module = self.daq.dataAcquisitionModule()
+        module.set('device', self.device)
+        # Hardware trigger on the trigger input bits of the demod samples.
+        module.set('type', 6)
+        module.set('triggernode', '/' + self.device + '/demods/' + self.lockin_demod_c + '/sample.TrigIn1')
+        module.set('edge', 2)
+        module.set('count', count)
+        module.set('duration', duration)
+        module.set('holdoff/time', 0.0)
+        module.set('grid/mode', 4)
+        module.set('grid/cols', samples)
+        module.subscribe(signal_path)
+        module.execute()
+
+        old_t = self.clock.now()
+        try:
+            while not module.finished():
+                self.clock.sleep(0.1)
+                if self.clock.now() - old_t > self.transient_timeout * count:
+                    raise Laser_Exception("Transients not captured.")
+            result = module.read(True)
+        finally:
+            module.finish()
+            module.unsubscribe('*')
+            module.clear()
+
+        rows = [np.ravel(chunk['value']) for chunk in result[signal_path.lower()]]
+        transients = np.stack([row[:samples] for row in rows])
+        sys.stderr.write("Captured {} transients.\n".format(transients.shape[0]))
+        return np.arange(samples) / self.demod_rate, transients
 
     ## @brief Perform all necessary action for the turning off of the laser.
     #
     #         As the laser has ceased operation, it no longer needs to be collecting
     #         data. So, cease the parallel collection thread and output all data
-    #         to a .csv file for processing. This is all done before the laser is
+    #         to a .csv file for processing, with the gaps in it in Gaps.csv and
+    #         the changes of poll length and demod rate in Events.csv. With
+    #         lockin_channels set, every channel goes to Samples.npy. This is all done before the laser is
     #         turned off to ensure uninterrupted data. Finally, turn off and
     #         disconnect from laser and the SDK.
-    def turn_off_laser(self):
+    #
+    #  @param save_data Whether to write the samples to Data.csv, or Data.npz,
+    #         and Samples.npy. False when they were written into segments, so
+    #         the files of an earlier run are not replaced by the last segment.
+    def turn_off_laser(self, save_data=True):
         # As the laser is not firing, stop collecting data.
-        self.poll_thread.join()
-        data = np.stack([np.array(self.data[0]), np.array(self.time_axis[0])])
-        np.savetxt("Data.csv", data, delimiter = ",")
-
+        if self.acquisition is not None:
+            self.acquisition.stop()
+        self.poll_stop.set()
+        if self.poll_thread is not None:
+            self.poll_thread.join()
+        if self.acquisition is not None:
+            self.acquisition.close()
+        # Without a collection started, as after a failed startup, there is
+        # nothing to save and the files of the previous run are kept.
+        if self.poll_thread is not None or self.acquisition is not None:
+            if save_data and self.compact_log is not None:
+                self.compact_log.save("Data.npz")
+            elif save_data:
+                data = np.stack([np.concatenate(self.data) if self.data else np.empty(0),
+                                 np.concatenate(self.time_axis) if self.time_axis else np.empty(0)])
+                np.savetxt("Data.csv", data, delimiter = ",")
+            if save_data and self.lockin_channels is not None:
+                np.save("Samples.npy", np.concatenate(self.samples) if self.samples
+                        else np.empty(0, self.lockin_channels.dtype))
+            # The gaps and the poll length and demod rate changes of this run.
+            controller = self.acquisition_controller
+            _save_rows("Gaps.csv", [] if controller is None else controller.gaps)
+            _save_rows("Events.csv", [] if controller is None else controller.events)
+
+        # Nothing to shut down if the laser was never connected.
+        if self.handle is None:
+            sys.stderr.write("Laser was not connected.\n")
+            return
         turn_on = False
         arm = False
         self.sdk.SidekickSDK_SetLaserOnOff(self.handle, 0, turn_on)
@@ -508,17 +929,124 @@ class Laser:
         self.sdk.SidekickSDK_SetLaserArmDisarm(self.handle, arm)
         self.sdk.SidekickSDK_ExecLaserArmDisarm(self.handle)
         self.sdk.SidekickSDK_Disconnect(self.handle)
+        self.shadow.invalidate()
         sys.stderr.write("Laser has been turned off.\n")
+        if self.call_recorder is not None:
+            sys.stderr.write(self.call_recorder.format())
 
+    ## @brief Awaitable version of turn_off_laser, run on sdk_executor.
+    async def turn_off_laser_async(self, save_data=True):
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(self.__executor(), self.turn_off_laser, save_data)
+        self.sdk_executor.shutdown(wait=False)
+        self.sdk_executor = None
 
-    ## @brief Read QCL parameters into dictionary.
+    ## @brief Data, setpoints and acquisition events since the given cursors.
+    #
+    #         Lets a caller polling the laser, e.g. through a RemoteLaser,
+    #         receive only what is new rather than copies of the whole lists.
+    #
+    #  @param data_cursor Chunks of time_axis already seen, or samples of
+    #         compact_log for compact lasers, counted from the start of
+    #         operation as data_offset is.
+    #  @param setpoints_cursor Setpoints already seen, counted likewise.
+    #  @param events_cursor Events of acquisition_controller already seen.
+    #  @returns Dictionary of the lists time_axis, data and samples of the
+    #           chunks after data_cursor, with compact lasers giving the samples
+    #           of compact_log as one chunk of times and magnitudes, data_end,
+    #           the data cursor to continue from, the lists setpoints and events
+    #           after their cursors, and setpoints_end and events_end. Chunks
+    #           moved out before they were seen are skipped.
+    def since(self, data_cursor, setpoints_cursor, events_cursor=0):
+        with self.__acquired_lock:
+            offset = self.data_offset
+            first = max(data_cursor - offset, 0)
+            samples = []
+            if self.compact_log is not None:
+                log = self.compact_log
+                ticks, x, y = log.tail(first)
+                time_axis = [ticks / log.clockbase] if ticks.size else []
+                data = [np.hypot(x.astype(np.float64), y.astype(np.float64))] if ticks.size else []
+                data_end = offset + max(first, log.count)
+            else:
+                # the poll thread appends samples and data before time_axis,
+                # so every chunk counted in time_axis is complete
+                time_axis = self.time_axis[first:]
+                data = self.data[first:first + len(time_axis)]
+                samples = self.samples[first:first + len(time_axis)]
+                data_end = offset + first + len(time_axis)
+            made = self.setpoints[max(setpoints_cursor - self.setpoints_offset, 0):]
+            events = [] if self.acquisition_controller is None else \
+                self.acquisition_controller.events[events_cursor:]
+            return {'time_axis': time_axis, 'data': data, 'samples': samples,
+                    'data_end': data_end, 'setpoints': made,
+                    'setpoints_end': max(setpoints_cursor, self.setpoints_offset) + len(made),
+                    'events': events, 'events_end': events_cursor + len(events)}
+
+    ## @brief Move everything acquired so far out of the laser.
+    #
+    #         Pops the complete chunks of data, time_axis and samples, the
+    #         setpoints and the samples of compact_log at once, and counts the
+    #         chunks, or compact samples, and setpoints popped in data_offset
+    #         and setpoints_offset.
+    #         Used by data_analysis.segments.SegmentWriter to bound the memory
+    #         of long runs, also through a RemoteLaser.
+    #
+    #  @returns Dictionary of the lists data, time_axis, samples and setpoints
+    #           popped, compact_log, the CompactLog popped or None, and events,
+    #           the events of acquisition_controller since the last call.
+    #           Events are not popped, as Events.csv is saved from them.
+    def take_acquired(self):
+        with self.__acquired_lock:
+            # the poll thread appends samples, then data, then time_axis, so
+            # the first len(time_axis) chunks are complete in all three
+            chunks = len(self.time_axis)
+            made = len(self.setpoints)
+            events = [] if self.acquisition_controller is None else \
+                self.acquisition_controller.events[self.__events_taken:]
+            self.__events_taken += len(events)
+            acquired = {'time_axis': self.time_axis[:chunks], 'data': self.data[:chunks],
+                        'samples': self.samples[:chunks],
+                        'setpoints': self.setpoints[:made], 'compact_log': self.compact_log,
+                        'events': events}
+            del self.time_axis[:chunks]
+            del self.data[:chunks]
+            del self.samples[:chunks]
+            del self.setpoints[:made]
+            if self.compact_log is not None:
+                from data_analysis.compact import CompactLog
+                chunks = self.compact_log.count
+                self.compact_log = CompactLog(self.compact_log.clockbase)
+            self.data_offset += chunks
+            self.setpoints_offset += made
+            return acquired
+
+    ## @brief Statistics of the SDK and lock-in calls made so far.
     #
-    #  @returns Dictionary of QCL parameter pointer.
+    #  @returns Dictionary keyed by call name (e.g. 'sidekick.SidekickSDK_ExecTuneToWW',
+    #           'daq.poll', 'laser.verify_qcl_params') of count, errors, total,
+    #           mean, min, max, p50 and p95 in seconds, and the latency histogram
+    #           over laser.instrumentation.BUCKET_EDGES. Empty when the laser
+    #           was not created with instrument enabled.
+    def call_stats(self):
+        if self.call_recorder is None:
+            return {}
+        return self.call_recorder.summary()
+
+    ## @brief Context manager timing a block into call_recorder, if instrumented.
+    def __timed(self, name):
+        if self.call_recorder is None:
+            return _untimed()
+        return self.call_recorder.timed(name)
+
+
+    ## @brief Read QCL parameters into qcl_params.
+    #
+    #  @returns Dictionary of QCL parameter pointers into qcl_params. The same
+    #           pointers are returned by every call, so their contents change
+    #           with the next read.
     def __read_qcl_params(self):
-        params = {'qcl_slot_ptr': pointer(c_uint8()), 'pulse_rate_hz_ptr': pointer(c_uint32()),
-                  'pulse_width_ns_ptr': pointer(c_uint32()), 'current_ma_ptr': pointer(c_uint16()),
-                  'temp_c_ptr': pointer(c_float()), 'laser_mode_ptr': pointer(c_uint8()),
-                  'pulse_mode_ptr': pointer(c_uint8()), 'vsrc_ptr': pointer(c_float())}
+        params = self.qcl_params.pointers()
         self.sdk.SidekickSDK_ReadWriteLaserQclParams(self.handle, self.qcl_read, 0)
         self.sdk.SidekickSDK_GetLaserQclParams(
             self.handle, params['qcl_slot_ptr'], params['pulse_rate_hz_ptr'],
@@ -540,35 +1068,112 @@ class Laser:
 
     ## @brief Collects observed laser emission data.
     #
-    #         Function for gathering data from detector via lock-in amp. Appends
-    #         data collected (1D list), time axis (1D list), standard
-    #         deviation (1D list) to arguments
+    #         Function for gathering data from detector via lock-in amp. Polls
+    #         until poll_stop is set, appending the data collected (1D array)
+    #         and time axis (1D array) of every slice to the arguments and
+    #         publishing it to live_feed. The slice length, and the demod rate
+    #         down to min_demod_rate, are adapted by acquisition_controller
+    #         when the host does not keep up, and gaps are recorded in its gaps.
+    #         With lockin_channels set, every channel is subscribed to at once
+    #         and the merged samples of each slice are appended to samples.
+    #         With compact set, slices go to compact_log instead of the arguments.
     #
     #  @param data_list List object to which the data is appended.
     #  @param time_list List object to which the time series for the data is appended.
-    #  @returns 2 numpy arrays, first the observed data and second the corresponding time series.
     def __collect_data(self, data_list, time_list):
+        controller = self.acquisition_controller = AcquisitionController(
+            self.demod_rate, self.lockin_poll_length, self.poll_timeout,
+            min_demod_rate=self.min_demod_rate)
+        channels = self.lockin_channels
         self.daq.sync()
-        self.daq.subscribe('/' + self.device + '/demods/' + self.lockin_demod_c + '/sample')
-        poll_data = self.daq.poll(self.lockin_poll_length, self.poll_timeout)
-
-        if self.device in poll_data and 'demods' in poll_data[self.device]:
-            if len(poll_data[self.device]['demods']) >= int(self.lockin_demod_c):
-                if 'sample' in poll_data[self.device]['demods'][self.lockin_demod_c]:
-                    sample = poll_data[self.device]['demods'][self.lockin_demod_c]['sample']
-                    x = sample['x']
-                    y = sample['y']
-                    data = np.hypot(x, y)
-                    clockbase = float(self.daq.getInt('/' + self.device + '/clockbase'))
-                    time_axis = sample['timestamp'] / clockbase
-                    if sample['time']['dataloss']:
-                        sys.stderr.write('warning: Sample loss detected.\n')
+        clockbase = float(self.daq.getInt('/' + self.device + '/clockbase'))
+        if self.compact and channels is None:
+            from data_analysis.compact import CompactLog
+            self.compact_log = CompactLog(clockbase)
+        if channels is None:
+            self.daq.subscribe('/' + self.device + '/demods/' + self.lockin_demod_c + '/sample')
         else:
-            data = []
-            time_axis = []
+            self.daq.subscribe(channels.paths(self.device))
+        while not self.poll_stop.is_set():
+            started = time.perf_counter()
+            poll_data = self.daq.poll(controller.poll_length, controller.poll_timeout)
+            elapsed = time.perf_counter() - started
+            if self.compact_log is not None:
+                sample = self.__compact_sample(poll_data, clockbase)
+            elif channels is None:
+                sample = demod_sample(poll_data, self.device, self.lockin_demod_c, clockbase)
+            else:
+                sample = self.__channel_sample(poll_data, clockbase)
+            if sample is None:
+                controller.update(np.empty(0), False, elapsed)
+                continue
+            time_axis, data, lost = sample
+            if lost:
+                sys.stderr.write('warning: Sample loss detected.\n')
+            if self.compact_log is None:
+                data_list.append(data)
+                time_list.append(time_axis)
+            self.live_feed.publish(time_axis, data)
+            new_rate = controller.update(time_axis, lost, elapsed)
+            if new_rate is not None:
+                for demod_c in self.__demods():
+                    self.daq.setDouble('/' + self.device + '/demods/' + demod_c + '/rate', new_rate)
+                self.demod_rate = new_rate
+                sys.stderr.write('warning: Demod rate lowered to %g samples/s.\n' % new_rate)
         self.daq.unsubscribe('*')
-        data_list.append(data)
-        time_list.append(time_axis)
+
+    ## @brief Merge the samples of lockin_channels in a poll result, append
+    #         them to samples and return the time axis and magnitude of the
+    #         primary demod where it has samples, as demod_sample does.
+    def __channel_sample(self, poll_data, clockbase):
+        merged, lost = self.lockin_channels.merge(poll_data, self.device, clockbase)
+        if merged is None:
+            return None
+        self.samples.append(merged)
+        data = magnitude(merged)[:, 0]
+        present = ~np.isnan(data)
+        return merged['time'][present], data[present], lost
+
+    ## @brief Record the sample of lockin_demod_c in a poll result into
+    #         compact_log and return it as demod_sample does.
+    def __compact_sample(self, poll_data, clockbase):
+        sample = demod_raw(poll_data, self.device, self.lockin_demod_c)
+        if sample is None:
+            return None
+        with self.__acquired_lock:
+            self.compact_log.append(sample['timestamp'], sample['x'], sample['y'])
+        return (sample['timestamp'] / clockbase, np.hypot(sample['x'], sample['y']),
+                bool(sample['time']['dataloss']))
+
+    ## @brief Demod channels acquired.
+    def __demods(self):
+        if self.lockin_channels is None:
+            return [self.lockin_demod_c]
+        return list(self.lockin_channels.demods)
+
+    ## @brief Collects the samples published by the acquisition process.
+    #
+    #         Copies new samples out of the shared ring every
+    #         acquisition_drain_interval seconds, and once more when asked to
+    #         stop, which turn_off_laser does only after the acquisition
+    #         process has finished. Warns and counts acquisition_overruns if
+    #         samples were overwritten before being copied.
+    #
+    #  @param data_list List to append the magnitude arrays to.
+    #  @param time_list List to append the time arrays to.
+    def __drain_acquisition(self, data_list, time_list):
+        cursor = 0
+        stopping = False
+        while not stopping:
+            stopping = self.poll_stop.wait(self.acquisition_drain_interval)
+            time_axis, data, cursor, overrun = self.acquisition.ring.copy(cursor)
+            if overrun:
+                self.acquisition_overruns += 1
+                sys.stderr.write('warning: Acquisition ring overrun, samples lost.\n')
+            if data.size:
+                data_list.append(data)
+                time_list.append(time_axis)
+                self.live_feed.publish(time_axis, data)
 
     ## @brief Call SDK function with optional arguments and check return value.
     #
@@ -591,7 +1196,8 @@ class Laser:
     #  @param error_msg string message to print if function fails
     #  @exception SDK_Exception Thrown if SDK function fails
     def __call_sdk_bool_ptr(self, sdk_fn, success_msg, error_msg):
-        ret_ptr = pointer(c_bool(False))
+        ret_ptr = self.status_ptr
+        ret_ptr.contents.value = False
         sdk_fn(self.handle, ret_ptr)
         if ret_ptr.contents.value:
             sys.stderr.write(success_msg + "\n")
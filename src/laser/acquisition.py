@@ -0,0 +1,293 @@
+## @package laser.acquisition
+#  Lock-in acquisition in a dedicated process, handing samples over through
+#  a shared memory ring.
+#
+#  The acquisition process opens its own session with the lock-in data
+#  server and does nothing but poll the demod and publish the magnitude into
+#  a SharedRing, so plotting, analysis or the experiment loop in the main
+#  process can no longer hold the GIL while daq.poll is due. The main process
+#  reads the ring through zero-copy views, or copies, and learns through an
+#  explicit overrun flag when it fell so far behind that samples were
+#  overwritten before it read them.
+#
+#  Example:
+#
+#  acquisition = AcquisitionProcess('dev1234')
+#  acquisition.start()
+#  cursor = 0
+#  ...
+#  time_axis, data, cursor, overrun = acquisition.ring.copy(cursor)
+#  ...
+#  acquisition.close()
+
+import mmap
+import multiprocessing
+import os
+import sys
+import tempfile
+import uuid
+import numpy as np
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8, rings are kept in memory mapped files instead
+    shared_memory = None
+
+# Header slots of the ring, int64 each.
+_WRITE_TARGET, _WRITTEN, _DATALOSS = range(3)
+_HEADER = 3
+
+## Named block of memory shared between processes through a memory mapped
+#  file, standing in for shared_memory.SharedMemory before Python 3.8.
+class _MappedFile:
+
+    ## @brief Create a block, or attach to an existing one by name.
+    #
+    #  @param name Name of an existing block to attach to, None to create one.
+    #  @param create Whether to create the block.
+    #  @param size Size of the block in bytes.
+    def __init__(self, name=None, create=False, size=0):
+        ## Name other processes attach to the block by.
+        self.name = name if name is not None else 'ring-' + uuid.uuid4().hex
+        self.__path = os.path.join(tempfile.gettempdir(), self.name)
+        self.__file = open(self.__path, 'w+b' if create else 'r+b')
+        if create:
+            self.__file.truncate(size)
+        self.__map = mmap.mmap(self.__file.fileno(), size)
+        ## Memoryview of the block.
+        self.buf = memoryview(self.__map)
+
+    ## @brief Detach from the block.
+    def close(self):
+        self.buf.release()
+        self.__map.close()
+        self.__file.close()
+
+    ## @brief Free the block.
+    def unlink(self):
+        os.remove(self.__path)
+
+## Single writer, many reader ring of (time, data) samples in shared memory.
+#
+#  The writer bumps a target sequence number before overwriting slots and the
+#  written sequence number once done, as LiveFeed does, so readers in any
+#  process can tell whether the samples they read were overwritten meanwhile.
+class SharedRing:
+
+    ## @brief Create a ring, or attach to an existing one by name.
+    #
+    #  @param capacity Number of samples held.
+    #  @param name Name of an existing ring to attach to, None to create one.
+    def __init__(self, capacity=2**22, name=None):
+        ## Number of samples held.
+        self.capacity = int(capacity)
+        self._owner = name is None
+        size = 8 * (_HEADER + 2 * self.capacity)
+        memory = _MappedFile if shared_memory is None else shared_memory.SharedMemory
+        self._shm = memory(name=name, create=self._owner, size=size)
+        buf = self._shm.buf
+        self._header = np.ndarray(_HEADER, np.int64, buf, 0)
+        self._time = np.ndarray(self.capacity, np.float64, buf, 8 * _HEADER)
+        self._data = np.ndarray(self.capacity, np.float64, buf, 8 * (_HEADER + self.capacity))
+        if self._owner:
+            self._header[:] = 0
+
+    ## Name other processes attach to the ring by.
+    @property
+    def name(self):
+        return self._shm.name
+
+    ## Sequence number of the next sample, i.e. total samples published.
+    @property
+    def written(self):
+        return int(self._header[_WRITTEN])
+
+    ## Number of polls in which the lock-in reported lost samples.
+    @property
+    def dataloss(self):
+        return int(self._header[_DATALOSS])
+
+    ## @brief Append a chunk of samples. Must only be called by one writer.
+    #
+    #  @param time_chunk 1D array of sample times in seconds.
+    #  @param data_chunk 1D array of samples, same length as time_chunk.
+    def publish(self, time_chunk, data_chunk):
+        time_chunk = np.asarray(time_chunk, dtype=float)
+        data_chunk = np.asarray(data_chunk, dtype=float)
+        total = time_chunk.size
+        if total == 0:
+            return
+        # samples that would be overwritten within this chunk are skipped,
+        # but still counted so readers see them as lost
+        skip = max(total - self.capacity, 0)
+        time_chunk = time_chunk[skip:]
+        data_chunk = data_chunk[skip:]
+        n = time_chunk.size
+        start = int(self._header[_WRITTEN]) + skip
+        self._header[_WRITE_TARGET] = start + n
+        first = start % self.capacity
+        split = min(n, self.capacity - first)
+        self._time[first:first + split] = time_chunk[:split]
+        self._data[first:first + split] = data_chunk[:split]
+        self._time[:n - split] = time_chunk[split:]
+        self._data[:n - split] = data_chunk[split:]
+        self._header[_WRITTEN] = start + n
+
+    ## @brief Count a poll in which the lock-in reported lost samples.
+    def note_dataloss(self):
+        self._header[_DATALOSS] += 1
+
+    ## @brief Zero-copy views of the samples from a sequence number on.
+    #
+    #         The views alias the ring, so they are only good until the
+    #         writer comes round again; check with valid once done with them.
+    #
+    #  @param cursor Sequence number of the first sample wanted.
+    #  @returns Tuple of (list of up to two (time, data) view pairs in order,
+    #           sequence number to continue from, overrun). overrun is True if
+    #           samples from cursor on had already been overwritten, in which
+    #           case the views start at the oldest sample held.
+    def read(self, cursor):
+        written = int(self._header[_WRITTEN])
+        oldest = max(written - self.capacity, 0)
+        overrun = cursor < oldest
+        start = max(cursor, oldest)
+        chunks = []
+        while start < written:
+            first = start % self.capacity
+            stop = min(first + written - start, self.capacity)
+            chunks.append((self._time[first:stop], self._data[first:stop]))
+            start += stop - first
+        return chunks, written, overrun
+
+    ## @brief Whether samples from the sequence number cursor on are still
+    #         intact, i.e. views read from there may be trusted.
+    def valid(self, cursor):
+        return cursor >= int(self._header[_WRITE_TARGET]) - self.capacity
+
+    ## @brief Copy out the samples from a sequence number on.
+    #
+    #  @param cursor Sequence number of the first sample wanted.
+    #  @returns Tuple of (time, data, sequence number to continue from,
+    #           overrun), with samples overwritten during the copy dropped and
+    #           reported as an overrun.
+    def copy(self, cursor):
+        chunks, written, overrun = self.read(cursor)
+        start = written - sum(t.size for t, _ in chunks)
+        if not chunks:
+            return np.empty(0), np.empty(0), written, overrun
+        time_axis = np.concatenate([t for t, _ in chunks])
+        data = np.concatenate([d for _, d in chunks])
+        lost = int(self._header[_WRITE_TARGET]) - self.capacity - start
+        if lost > 0:
+            time_axis = time_axis[lost:]
+            data = data[lost:]
+            overrun = True
+        return time_axis, data, written, overrun
+
+    ## @brief Detach from the ring, and free it if this handle created it.
+    #         Views from read must not be used afterwards.
+    def close(self):
+        self._header = self._time = self._data = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+## @brief Raw sample of a demod in a poll result.
+#
+#  @param poll_data Dictionary returned by daq.poll.
+#  @param device Lock-in serial.
+#  @param demod_c Demod channel as a string.
+#  @returns Dictionary of the sample's timestamp, x, y and time arrays, or
+#           None if the poll holds no sample of the demod.
+def demod_raw(poll_data, device, demod_c):
+    if device in poll_data and 'demods' in poll_data[device]:
+        if len(poll_data[device]['demods']) >= int(demod_c):
+            if 'sample' in poll_data[device]['demods'][demod_c]:
+                return poll_data[device]['demods'][demod_c]['sample']
+    return None
+
+## @brief Magnitude and time axis of a demod sample in a poll result.
+#
+#  @param poll_data Dictionary returned by daq.poll.
+#  @param device Lock-in serial.
+#  @param demod_c Demod channel as a string.
+#  @param clockbase Lock-in clock rate, to turn timestamps into seconds.
+#  @returns Tuple of (time axis, magnitude, whether samples were lost), or
+#           None if the poll holds no sample of the demod.
+def demod_sample(poll_data, device, demod_c, clockbase):
+    sample = demod_raw(poll_data, device, demod_c)
+    if sample is None:
+        return None
+    return (sample['timestamp'] / clockbase, np.hypot(sample['x'], sample['y']),
+            bool(sample['time']['dataloss']))
+
+## @brief Open a session with the lock-in data server.
+def _zi_connect(ip, port):
+    import zhinst.ziPython
+    return zhinst.ziPython.ziDAQServer(ip, port)
+
+## @brief Body of the acquisition process: poll the demod into the ring until
+#         stop is set.
+def _acquire(ring_name, capacity, stop, params, daq_factory):
+    ring = SharedRing(capacity, name=ring_name)
+    try:
+        daq = daq_factory(params['lockin_ip'], params['lockin_port'])
+        device = params['device']
+        demod_c = params['demod_c']
+        daq.sync()
+        clockbase = float(daq.getInt('/' + device + '/clockbase'))
+        daq.subscribe('/' + device + '/demods/' + demod_c + '/sample')
+        while not stop.is_set():
+            poll_data = daq.poll(params['poll_length'], params['poll_timeout'])
+            sample = demod_sample(poll_data, device, demod_c, clockbase)
+            if sample is not None:
+                time_axis, data, lost = sample
+                if lost:
+                    ring.note_dataloss()
+                    sys.stderr.write('warning: Sample loss detected.\n')
+                ring.publish(time_axis, data)
+        daq.unsubscribe('*')
+    finally:
+        ring.close()
+
+## Acquisition process polling one demod of a lock-in into a SharedRing.
+class AcquisitionProcess:
+    ## @param device Lock-in serial, e.g. 'dev1234'.
+    #  @param demod_c Demod channel as a string.
+    #  @param lockin_ip IP of the lock-in data server.
+    #  @param lockin_port Port of the lock-in data server.
+    #  @param poll_length Length in seconds of each poll.
+    #  @param poll_timeout Poll timeout in ms.
+    #  @param capacity Number of samples the ring holds.
+    #  @param daq_factory Function of (ip, port) returning a ziDAQServer, or an
+    #         equivalent for testing. Must be importable by the process.
+    def __init__(self, device, demod_c='0', lockin_ip='192.168.48.102', lockin_port=8004,
+                 poll_length=0.1, poll_timeout=500, capacity=2**22, daq_factory=None):
+        ## SharedRing the samples are published into.
+        self.ring = SharedRing(capacity)
+        params = {'device': device, 'demod_c': demod_c, 'lockin_ip': lockin_ip,
+                  'lockin_port': lockin_port, 'poll_length': poll_length,
+                  'poll_timeout': poll_timeout}
+        context = multiprocessing.get_context('spawn')
+        self.__stop = context.Event()
+        ## The acquisition process.
+        self.process = context.Process(
+            target=_acquire, name='acquisition', daemon=True,
+            args=(self.ring.name, self.ring.capacity, self.__stop, params,
+                  _zi_connect if daq_factory is None else daq_factory))
+
+    ## @brief Start acquiring.
+    def start(self):
+        self.process.start()
+
+    ## @brief Ask the process to finish its current poll and wait for it.
+    def stop(self):
+        self.__stop.set()
+        if self.process.pid is not None:
+            self.process.join()
+
+    ## @brief Stop acquiring and free the ring.
+    def close(self):
+        self.stop()
+        self.ring.close()
@@ -0,0 +1,139 @@
+## @package laser.adaptive
+#  Adapting the acquisition to what the host keeps up with.
+#
+#  The AcquisitionController is fed every poll the acquisition thread makes:
+#  the time axis returned, whether the lock-in flagged lost samples and how
+#  long the poll took. From that it
+#  - lengthens the poll slice when polls overrun, return a backlog of
+#    samples or lose samples, so the per-poll overhead is paid less often,
+#    and shortens it back once polls have been clean for a while;
+#  - steps the demod rate down when samples are still lost at the longest
+#    slice, down to a floor;
+#  - records every gap in the time axis as an explicit (start, stop)
+#    interval, so that data either side of a gap is never mistaken for
+#    contiguous.
+#  Every change of slice length or demod rate is kept in events.
+#
+#  Example:
+#
+#  controller = AcquisitionController(demod_rate=2e3, poll_length=0.1)
+#  while acquiring:
+#      poll_data = daq.poll(controller.poll_length, controller.poll_timeout)
+#      ...
+#      new_rate = controller.update(time_axis, lost, elapsed)
+#      if new_rate is not None:
+#          daq.setDouble(rate_path, new_rate)
+
+import numpy as np
+
+class AcquisitionController:
+    ## @param demod_rate Demod rate in samples per second.
+    #  @param poll_length Preferred length of each poll slice in seconds.
+    #  @param poll_timeout Preferred poll timeout in ms.
+    #  @param max_poll_length Longest poll slice in seconds.
+    #  @param min_demod_rate Lowest demod rate stepped down to.
+    #  @param rate_step Factor the demod rate is multiplied by on each step down.
+    #  @param recover_after Clean polls after which the slice is shortened again.
+    #  @param gap_factor Spacing, in sample periods, above which samples are
+    #         considered to have a gap between them.
+    def __init__(self, demod_rate, poll_length=0.1, poll_timeout=500, max_poll_length=1.0,
+                 min_demod_rate=None, rate_step=0.5, recover_after=100, gap_factor=1.5):
+        ## Current demod rate in samples per second.
+        self.demod_rate = demod_rate
+        ## Current length of each poll slice in seconds.
+        self.poll_length = poll_length
+        ## Preferred length of each poll slice in seconds.
+        self.base_poll_length = poll_length
+        ## Longest poll slice in seconds.
+        self.max_poll_length = max_poll_length
+        ## Lowest demod rate stepped down to, never stepped if None.
+        self.min_demod_rate = min_demod_rate
+        ## Factor the demod rate is multiplied by on each step down.
+        self.rate_step = rate_step
+        ## Clean polls after which the slice is shortened again.
+        self.recover_after = recover_after
+        ## Spacing in sample periods above which samples are a gap apart.
+        self.gap_factor = gap_factor
+        ## List of (start, stop) times in seconds between which samples are missing.
+        self.gaps = []
+        ## List of (time, setting, old, new) for every change of poll_length or
+        #  demod_rate, time being that of the last sample before the change.
+        self.events = []
+        ## Number of polls in which the lock-in flagged lost samples.
+        self.lost_polls = 0
+        self.__base_timeout = poll_timeout
+        self.__clean = 0
+        self.__last_time = None
+
+    ## Poll timeout in ms, long enough for the current slice.
+    @property
+    def poll_timeout(self):
+        return max(self.__base_timeout, int(2000 * self.poll_length))
+
+    ## @brief Account for one poll.
+    #
+    #  @param time_axis 1D array of the sample times returned, in seconds.
+    #  @param lost Whether the lock-in flagged lost samples.
+    #  @param elapsed Seconds the poll took.
+    #  @returns The new demod rate if it is to be stepped down, else None.
+    def update(self, time_axis, lost, elapsed):
+        time_axis = np.asarray(time_axis, dtype=float)
+        self.__find_gaps(time_axis)
+        if lost:
+            self.lost_polls += 1
+
+        backlog = time_axis.size > 1.5 * self.poll_length * self.demod_rate
+        overrun = elapsed > 1.5 * self.poll_length
+        if not (lost or backlog or overrun):
+            self.__clean += 1
+            if self.__clean >= self.recover_after and self.poll_length > self.base_poll_length:
+                self.__set('poll_length', max(self.poll_length / 2, self.base_poll_length))
+                self.__clean = 0
+            return None
+
+        self.__clean = 0
+        if self.poll_length < self.max_poll_length:
+            self.__set('poll_length', min(self.poll_length * 2, self.max_poll_length))
+        elif (lost and self.min_demod_rate is not None and
+              self.demod_rate * self.rate_step >= self.min_demod_rate):
+            self.__set('demod_rate', self.demod_rate * self.rate_step)
+            return self.demod_rate
+        return None
+
+    def __find_gaps(self, time_axis):
+        if time_axis.size == 0:
+            return
+        limit = self.gap_factor / self.demod_rate
+        if self.__last_time is not None and time_axis[0] - self.__last_time > limit:
+            self.gaps.append((self.__last_time, float(time_axis[0])))
+        inside = np.nonzero(np.diff(time_axis) > limit)[0]
+        self.gaps.extend(zip(time_axis[inside].tolist(), time_axis[inside + 1].tolist()))
+        self.__last_time = float(time_axis[-1])
+
+    def __set(self, setting, value):
+        self.events.append((self.__last_time, setting, getattr(self, setting), value))
+        setattr(self, setting, value)
+
+## @brief Data with every gap made explicit, for plotting or analysis that
+#         must not join samples across a gap.
+#
+#  A masked sample is inserted in the middle of each gap, so lines drawn
+#  through the result break at the gaps.
+#
+#  @param time_axis 1D array of sample times in seconds, increasing.
+#  @param data 1D array of samples.
+#  @param gaps List of (start, stop) times of the gaps.
+#  @returns Tuple of (time axis, numpy.ma.MaskedArray of data) with one
+#           masked sample per gap.
+def with_gaps(time_axis, data, gaps):
+    time_axis = np.asarray(time_axis, dtype=float)
+    data = np.asarray(data, dtype=float)
+    if not gaps:
+        return time_axis, np.ma.MaskedArray(data, mask=np.zeros(data.shape, dtype=bool))
+    middles = np.array([(start + stop) / 2 for start, stop in gaps])
+    at = np.searchsorted(time_axis, middles)
+    time_out = np.insert(time_axis, at, middles)
+    data_out = np.insert(data, at, np.nan)
+    mask = np.zeros(data_out.shape, dtype=bool)
+    mask[at + np.arange(at.size)] = True
+    return time_out, np.ma.MaskedArray(data_out, mask=mask)
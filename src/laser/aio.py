@@ -0,0 +1,64 @@
+## @package laser.aio
+#  Awaitable access to the laser for use from an asyncio event loop.
+#
+#  AsyncLaser wraps a Laser, or anything standing in for one, and offers
+#  the blocking operations as coroutines. A Laser provides set_field_async
+#  and turn_off_laser_async itself, which make the SDK calls on its own
+#  executor and await the waits in between. For stand-ins without them the
+#  blocking method is run on the loop's default executor instead. Either
+#  way the loop stays free, so acquisition, live plotting and several
+#  instruments can share it and their waits overlap.
+#
+#  Example:
+#
+#  async def main():
+#      await aio.get().set_field("wavelength", 1100)
+#      await experiment.run_async()
+#
+#  asyncio.get_event_loop().run_until_complete(main())
+
+import asyncio
+import laser
+
+## Coroutine facade over a laser object.
+class AsyncLaser:
+    ## @param laser_obj Laser, EmulatedLaser or other stand-in to wrap.
+    def __init__(self, laser_obj):
+        ## The wrapped laser object.
+        self.laser = laser_obj
+
+    ## @brief Set a field without blocking the event loop, see Laser.set_field.
+    async def set_field(self, field_name, value):
+        native = getattr(self.laser, 'set_field_async', None)
+        if native is not None:
+            await native(field_name, value)
+        else:
+            await self.__in_executor(self.laser.set_field, field_name, value)
+
+    ## @brief Turn the laser off without blocking the event loop, see
+    #         Laser.turn_off_laser.
+    async def turn_off_laser(self, save_data=True):
+        # save_data is only passed when False, for lasers without it
+        args = () if save_data else (False,)
+        native = getattr(self.laser, 'turn_off_laser_async', None)
+        if native is not None:
+            await native(*args)
+        else:
+            await self.__in_executor(self.laser.turn_off_laser, *args)
+
+    ## @brief Capture transients without blocking the event loop, see
+    #         Laser.capture_transients.
+    async def capture_transients(self, count, duration):
+        return await self.__in_executor(self.laser.capture_transients, count, duration)
+
+    ## Attributes other than the coroutines come from the wrapped laser.
+    def __getattr__(self, name):
+        return getattr(self.laser, name)
+
+    async def __in_executor(self, fn, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, fn, *args)
+
+## @brief AsyncLaser over the laser returned by laser.get(name).
+def get(name=None):
+    return AsyncLaser(laser.get(name))
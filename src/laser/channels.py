@@ -0,0 +1,85 @@
+## @package laser.channels
+#  Acquiring several demods, and aux inputs, of the lock-in at once.
+#
+#  Channels names the demods to subscribe to, all in one subscription, and
+#  the aux inputs to keep from the first demod's samples. Each poll is merged
+#  by timestamp into one structured array of SAMPLE fields, with x and y
+#  holding one column per demod and aux one column per aux input. Merging is
+#  done on whole arrays, never per sample. Magnitude and phase are not
+#  stored but derived on request with magnitude() and phase().
+#
+#  Example:
+#
+#  channels = Channels(demods=('0', '1'), aux=('auxin0',))
+#  daq.subscribe(channels.paths('dev1234'))
+#  samples, lost = channels.merge(daq.poll(0.1, 500), 'dev1234', clockbase)
+#  r = magnitude(samples)[:, 0]
+
+import numpy as np
+
+class Channels:
+    ## @param demods Demod channels as strings. The first is the primary one,
+    #         whose magnitude is the data of the experiment.
+    #  @param aux Names of the aux inputs kept from the first demod's samples,
+    #         e.g. 'auxin0'.
+    def __init__(self, demods=('0',), aux=()):
+        ## Demod channels as strings.
+        self.demods = tuple(demods)
+        ## Names of the aux inputs kept.
+        self.aux = tuple(aux)
+        ## Structured dtype of the merged samples: time in seconds, x and y
+        #  with one column per demod, aux with one column per aux input.
+        self.dtype = np.dtype([('time', np.float64),
+                               ('x', np.float64, (len(self.demods),)),
+                               ('y', np.float64, (len(self.demods),)),
+                               ('aux', np.float64, (len(self.aux),))])
+
+    ## @brief Sample node paths of every demod, to subscribe to at once.
+    def paths(self, device):
+        return ['/' + device + '/demods/' + demod_c + '/sample' for demod_c in self.demods]
+
+    ## @brief Merge the demod samples of a poll result by timestamp.
+    #
+    #  @param poll_data Dictionary returned by daq.poll.
+    #  @param device Lock-in serial.
+    #  @param clockbase Lock-in clock rate, to turn timestamps into seconds.
+    #  @returns Tuple of (structured array of dtype, one row per distinct
+    #           timestamp, whether samples were lost), or (None, False) if the
+    #           poll holds no sample of any demod. Columns of demods without a
+    #           sample at a row's timestamp are NaN.
+    def merge(self, poll_data, device, clockbase):
+        demods = poll_data.get(device, {}).get('demods', {})
+        samples = [demods[demod_c].get('sample') if demod_c in demods else None
+                   for demod_c in self.demods]
+        present = [sample for sample in samples if sample is not None]
+        if not present:
+            return None, False
+        if len(present) == 1:
+            stamps = np.asarray(present[0]['timestamp'])
+        else:
+            stamps = np.unique(np.concatenate([sample['timestamp'] for sample in present]))
+
+        merged = np.empty(stamps.size, self.dtype)
+        merged['time'] = stamps / clockbase
+        merged['x'] = np.nan
+        merged['y'] = np.nan
+        merged['aux'] = np.nan
+        for column, sample in enumerate(samples):
+            if sample is None:
+                continue
+            rows = np.searchsorted(stamps, sample['timestamp'])
+            merged['x'][rows, column] = sample['x']
+            merged['y'][rows, column] = sample['y']
+            if column == 0:
+                for aux_column, name in enumerate(self.aux):
+                    merged['aux'][rows, aux_column] = sample[name]
+        lost = any(bool(sample['time']['dataloss']) for sample in present)
+        return merged, lost
+
+## @brief Magnitude of merged samples, one column per demod.
+def magnitude(samples):
+    return np.hypot(samples['x'], samples['y'])
+
+## @brief Phase in radians of merged samples, one column per demod.
+def phase(samples):
+    return np.arctan2(samples['y'], samples['x'])
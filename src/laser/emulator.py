@@ -0,0 +1,146 @@
+## @package laser.emulator
+#  Stand-in for Laser that needs neither the Sidekick SDK nor a lock-in.
+#
+#  EmulatedLaser has the same public surface as Laser for driving
+#  experiments: set_field with the same bounds checks, turn_off_laser, since,
+#  take_acquired, and the setpoints, live_feed, data and time_axis
+#  attributes. Hardware delays are modelled by configurable waits, which
+#  default to none, so experiment scheduling can be exercised and
+#  benchmarked without a bench. The waits go through a clock, so on a
+#  clock.VirtualClock they take no real time and setpoints are stamped with
+#  the clock's time, see Experiment.simulate.
+#
+#  Example:
+#
+#  laser.set_for_test(EmulatedLaser())
+#  experiment.run()
+
+from clock import SystemClock
+from laser import Laser_Exception
+from laser.live_feed import LiveFeed
+
+class EmulatedLaser:
+    ## @brief Set up the emulated state with the defaults of Laser.
+    #
+    #  @param tune_time Seconds a wavelength change is modelled to take.
+    #  @param params_time Seconds a QCL parameter change is modelled to take.
+    #  @param clock Clock the waits go through, a clock.SystemClock if None.
+    def __init__(self, tune_time=0.0, params_time=0.0, clock=None):
+        ## Seconds a wavelength change takes.
+        self.tune_time = tune_time
+        ## Seconds a current, pulse rate or pulse width change takes.
+        self.params_time = params_time
+        ## Clock the hardware delays are waited on.
+        self.clock = SystemClock() if clock is None else clock
+
+        ## Whether or not the laser is on.
+        self.laser_on = True
+        ## Current from the QCL in MilliAmps.
+        self.qcl_current_ma = 1500
+        ## Pulse rate of the laser in Hertz according to the QCL.
+        self.qcl_pulse_rate_hz = 15000
+        ## Pulse width of the laser in nanoseconds according to the QCL.
+        self.qcl_pulse_width_ns = 500
+        ## Laser wavelength in wavenumbers.
+        self.wavelength = 1020
+
+        ## Maximum safe current in mA for operation of this laser.
+        self.max_current = 1600
+        ## Minimum safe current in mA for operation of this laser.
+        self.min_current = 1200
+        ## Maximum wavelength (in wavenumbers) able to be reached by this laser.
+        self.max_wavelength = 1250
+        ## Minimum wavelength (in wavenumbers) able to be reached by this laser.
+        self.min_wavelength = 950
+        ## Maximum pulse rate in Hz that this laser can safely operate at.
+        self.max_pulse_rate = 15000
+        ## Minimum pulse rate in Hz that this laser can safely operate at.
+        self.min_pulse_rate = 5000
+        ## Maximum pulse width in ns for safe operation of the laser.
+        self.max_pulse_width = 2500
+        ## Minimum pulse width in ns for safe operation of the laser.
+        self.min_pulse_width = 500
+
+        ## Latest samples and setpoint markers, as on Laser.
+        self.live_feed = LiveFeed()
+        ## Every (time, field_name, value) set, as on Laser.
+        self.setpoints = []
+        ## List of data arrays, empty as nothing is acquired.
+        self.data = []
+        ## List of time arrays, empty as nothing is acquired.
+        self.time_axis = []
+        ## Number of chunks moved out of data and time_axis, e.g. into segments
+        #  by data_analysis.segments.SegmentWriter, and of entries out of setpoints.
+        self.data_offset = 0
+        self.setpoints_offset = 0
+        ## Total seconds of modelled hardware delay so far.
+        self.hardware_time = 0.0
+
+    ## @brief Set the given parameter with the same checks as Laser.set_field.
+    #
+    #  @param field_name One of pulse_width, pulse_rate, wavelength or current.
+    #  @param value Value in the units taken by the QCL.
+    #  @exception Laser_Exception Thrown for unknown fields or unsafe values.
+    def set_field(self, field_name, value):
+        if(field_name == "pulse_width" and
+            value <= self.max_pulse_width and value >= self.min_pulse_width):
+            self.qcl_pulse_width_ns = value
+            self.__wait(self.params_time)
+
+        elif(field_name == "pulse_rate" and
+            value <= self.max_pulse_rate and value >= self.min_pulse_rate):
+            self.qcl_pulse_rate_hz = value
+            self.__wait(self.params_time)
+
+        elif(field_name == "wavelength" and
+            value <= self.max_wavelength and value >= self.min_wavelength):
+            self.wavelength = value
+            self.__wait(self.tune_time)
+
+        elif(field_name == "current" and
+            value <= self.max_current and value >= self.min_current):
+            self.qcl_current_ma = value
+            self.__wait(self.params_time)
+
+        else:
+            raise Laser_Exception("This is not a valid parameter set.")
+
+        marker = self.live_feed.mark(field_name, value)
+        # with no samples to mark the setpoint against, the clock times it
+        self.setpoints.append((self.clock.now(),) + marker[1:])
+
+    ## @brief Data and setpoints acquired since the given cursors, see Laser.since.
+    #         There are no channel samples or acquisition events.
+    def since(self, data_cursor, setpoints_cursor, events_cursor=0):
+        first = max(data_cursor - self.data_offset, 0)
+        time_axis = self.time_axis[first:]
+        made = self.setpoints[max(setpoints_cursor - self.setpoints_offset, 0):]
+        return {'time_axis': time_axis, 'data': self.data[first:first + len(time_axis)],
+                'samples': [], 'data_end': self.data_offset + first + len(time_axis),
+                'setpoints': made,
+                'setpoints_end': max(setpoints_cursor, self.setpoints_offset) + len(made),
+                'events': [], 'events_end': events_cursor}
+
+    ## @brief Move everything acquired so far out, see Laser.take_acquired.
+    def take_acquired(self):
+        chunks = len(self.time_axis)
+        made = len(self.setpoints)
+        acquired = {'time_axis': self.time_axis[:chunks], 'data': self.data[:chunks],
+                    'samples': [], 'setpoints': self.setpoints[:made], 'compact_log': None,
+                    'events': []}
+        del self.time_axis[:chunks]
+        del self.data[:chunks]
+        del self.setpoints[:made]
+        self.data_offset += chunks
+        self.setpoints_offset += made
+        return acquired
+
+    ## @brief Turn the emulated laser off. Nothing is saved.
+    def turn_off_laser(self, save_data=True):
+        self.laser_on = False
+
+    ## @brief Model a hardware delay.
+    def __wait(self, seconds):
+        self.hardware_time += seconds
+        if seconds:
+            self.clock.sleep(seconds)
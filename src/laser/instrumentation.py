@@ -0,0 +1,177 @@
+## @package laser.instrumentation
+#  Opt-in timing of every call made to the Sidekick SDK and the lock-in.
+#
+#  An InstrumentedProxy stands in front of an SDK object and times each
+#  call made through it into a shared CallRecorder, which keeps per function
+#  call counts, error counts and a log-spaced latency histogram. Wrappers are
+#  created once per function name and cached on the proxy. When
+#  instrumentation is off the proxy is simply not installed, so it costs
+#  nothing.
+#
+#  Example:
+#
+#  recorder = CallRecorder()
+#  sdk = InstrumentedProxy(CDLL(path), recorder, 'sidekick.', sidekick_failed)
+#  ...
+#  sys.stderr.write(recorder.format())
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+## Upper edges in seconds of the latency histogram buckets, from 1 us to
+#  100 s in half decades. A last bucket catches anything slower.
+BUCKET_EDGES = [10.0 ** (k / 2.0) for k in range(-12, 5)]
+
+## @brief Whether a Sidekick SDK return value signals failure.
+#
+#  Sidekick functions return 0 on success. Anything that is not an integer
+#  status (for instance from a test double) is not counted as an error.
+def sidekick_failed(ret):
+    return isinstance(ret, int) and not isinstance(ret, bool) and ret != 0
+
+## Statistics of the calls made to one function.
+class CallStats:
+    def __init__(self):
+        ## Number of calls.
+        self.count = 0
+        ## Calls that raised or returned a failure status.
+        self.errors = 0
+        ## Total seconds spent in the function.
+        self.total = 0.0
+        ## Fastest call in seconds.
+        self.min = math.inf
+        ## Slowest call in seconds.
+        self.max = 0.0
+        ## Calls per latency bucket, see BUCKET_EDGES.
+        self.histogram = [0] * (len(BUCKET_EDGES) + 1)
+
+    ## @brief Add one call.
+    #
+    #  @param seconds Duration of the call.
+    #  @param failed Whether the call failed.
+    def add(self, seconds, failed):
+        self.count += 1
+        self.errors += failed
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.histogram[bisect.bisect_left(BUCKET_EDGES, seconds)] += 1
+
+    ## @brief Latency below which the given fraction of calls fall, to the
+    #         resolution of the histogram buckets.
+    def quantile(self, q):
+        target = q * self.count
+        seen = 0
+        for edge, calls in zip(BUCKET_EDGES + [self.max], self.histogram):
+            seen += calls
+            if seen >= target:
+                return min(edge, self.max)
+        return self.max
+
+    ## @brief Statistics as a dictionary of plain values.
+    def summary(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'min': self.min if self.count else 0.0,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'histogram': list(self.histogram),
+        }
+
+## Collects CallStats by function name. Safe to share between the control
+#  and acquisition threads.
+class CallRecorder:
+    def __init__(self):
+        ## Dictionary of function name to CallStats.
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    ## @brief Record a call.
+    def add(self, name, seconds, failed=False):
+        with self._lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = CallStats()
+            stats.add(seconds, failed)
+
+    ## @brief Wrap a function so that its calls are recorded under name.
+    #
+    #  @param name Name the calls are recorded under.
+    #  @param fn Function to wrap.
+    #  @param failed Optional function of the return value, True on failure.
+    #  @returns The wrapping function.
+    def wrap(self, name, fn, failed=None):
+        clock = time.perf_counter
+        def call(*args, **kwargs):
+            start = clock()
+            try:
+                ret = fn(*args, **kwargs)
+            except BaseException:
+                self.add(name, clock() - start, True)
+                raise
+            self.add(name, clock() - start, failed is not None and failed(ret))
+            return ret
+        call.__name__ = getattr(fn, '__name__', name)
+        return call
+
+    ## @brief Context manager recording the time spent in a block of code,
+    #         counted as an error if the block raises.
+    @contextmanager
+    def timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.add(name, time.perf_counter() - start, True)
+            raise
+        self.add(name, time.perf_counter() - start)
+
+    ## @brief Summary of every function as a dictionary keyed by name.
+    def summary(self):
+        with self._lock:
+            return {name: stats.summary() for name, stats in self.stats.items()}
+
+    ## @brief Summary as a text table, slowest total time first.
+    def format(self):
+        rows = sorted(self.summary().items(), key=lambda item: -item[1]['total'])
+        lines = ['{:<48} {:>8} {:>6} {:>10} {:>10} {:>10} {:>10}'.format(
+            'call', 'count', 'errors', 'total s', 'mean ms', 'p95 ms', 'max ms')]
+        for name, s in rows:
+            lines.append('{:<48} {:>8} {:>6} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f}'.format(
+                name, s['count'], s['errors'], s['total'], s['mean'] * 1e3,
+                s['p95'] * 1e3, s['max'] * 1e3))
+        return '\n'.join(lines) + '\n'
+
+## Stand-in for an SDK object that records every call made through it.
+#  Attributes that are not callable are passed through untouched.
+class InstrumentedProxy:
+    ## @param target SDK object to forward to.
+    #  @param recorder CallRecorder the calls are recorded into.
+    #  @param prefix Prefix of the recorded names, e.g. 'sidekick.'.
+    #  @param failed Optional function of a return value, True on failure.
+    def __init__(self, target, recorder, prefix='', failed=None):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_recorder', recorder)
+        object.__setattr__(self, '_prefix', prefix)
+        object.__setattr__(self, '_failed', failed)
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+        wrapped = self._recorder.wrap(self._prefix + name, attr, self._failed)
+        # cache so the wrapper is only built on first use
+        object.__setattr__(self, name, wrapped)
+        return wrapped
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
@@ -0,0 +1,97 @@
+## @package laser.live_feed
+#  Lock-free hand-off of the most recent acquisition data to live viewers.
+#
+#  The acquisition thread is the only writer of the sample ring and the
+#  control thread (the one calling set_field) is the only writer of the
+#  setpoint markers, so neither side ever has to take a lock. Readers copy
+#  out of the ring and discard whatever the writer may have overwritten
+#  while they were copying.
+
+import math
+import numpy as np
+
+## Driver side of the live view. Owned by a Laser and fed by its acquisition
+#  thread; any number of viewers may take snapshots concurrently.
+class LiveFeed:
+
+    ## @brief Preallocate the sample ring.
+    #
+    #  @param capacity Number of most recent samples retained for viewers.
+    #  @param max_markers Number of most recent setpoint markers retained.
+    def __init__(self, capacity=200000, max_markers=256):
+        ## Size of the sample ring.
+        self.capacity = int(capacity)
+        ## Maximum number of setpoint markers kept.
+        self.max_markers = max_markers
+        self._time = np.zeros(self.capacity)
+        self._data = np.zeros(self.capacity)
+        # Total number of samples whose write has been started.
+        self._write_target = 0
+        # Total number of samples completely written.
+        self._written = 0
+        # Tuple of (time, field_name, value), replaced wholesale on update.
+        self._markers = ()
+
+    ## Total number of samples published so far. Viewers can compare this
+    #  against the previous value to skip redraws when nothing arrived.
+    @property
+    def written(self):
+        return self._written
+
+    ## Tuple of (time, field_name, value) for the most recent setpoint changes.
+    @property
+    def markers(self):
+        return self._markers
+
+    ## @brief Append a chunk of samples. Must only be called by one thread.
+    #
+    #  @param time_chunk 1D array of sample times in seconds.
+    #  @param data_chunk 1D array of samples, same length as time_chunk.
+    def publish(self, time_chunk, data_chunk):
+        time_chunk = np.asarray(time_chunk, dtype=float)[-self.capacity:]
+        data_chunk = np.asarray(data_chunk, dtype=float)[-self.capacity:]
+        n = time_chunk.size
+        if n == 0:
+            return
+        start = self._written
+        self._write_target = start + n
+        first = start % self.capacity
+        split = min(n, self.capacity - first)
+        self._time[first:first + split] = time_chunk[:split]
+        self._data[first:first + split] = data_chunk[:split]
+        self._time[:n - split] = time_chunk[split:]
+        self._data[:n - split] = data_chunk[split:]
+        self._written = start + n
+
+    ## @brief Record a setpoint change at the time of the latest sample.
+    #
+    #  @param field_name Name of the field passed to set_field.
+    #  @param value Value the field was set to.
+    #  @returns The (time, field_name, value) marker recorded.
+    def mark(self, field_name, value):
+        written = self._written
+        if written:
+            t = float(self._time[(written - 1) % self.capacity])
+        else:
+            t = math.nan
+        marker = (t, field_name, value)
+        self._markers = (self._markers + (marker,))[-self.max_markers:]
+        return marker
+
+    ## @brief Copy out the most recent samples.
+    #
+    #  @param span Maximum number of samples to return, defaults to the whole ring.
+    #  @returns Tuple of (time array, data array, markers tuple).
+    def snapshot(self, span=None):
+        end = self._written
+        span = self.capacity if span is None else min(span, self.capacity)
+        start = max(0, end - span)
+        idx = np.arange(start, end) % self.capacity
+        time_axis = self._time[idx]
+        data = self._data[idx]
+        # Anything older than this may have been overwritten during the copy.
+        valid_start = self._write_target - self.capacity
+        if valid_start > start:
+            time_axis = time_axis[valid_start - start:]
+            data = data[valid_start - start:]
+        return time_axis, data, self._markers
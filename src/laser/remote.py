@@ -0,0 +1,128 @@
+## @package laser.remote
+#  Hosting a laser in a process of its own.
+#
+#  Each RemoteLaser starts a child process that constructs the instrument
+#  (a Laser by default) and serves method calls and attribute reads sent
+#  over a pipe. The instrument's acquisition thread then competes for the
+#  GIL only with its own process, not with the controller driving several
+#  benches, the GUI or the analysis. Exceptions raised in the child are
+#  re-raised in the caller.
+#
+#  Example:
+#
+#  bench_b = RemoteLaser(lockin_ip='192.168.48.103', usb_device=1)
+#  bench_b.set_field('wavelength', 1100)
+#  bench_b.turn_off_laser()
+#  data = bench_b.data
+#  bench_b.close()
+
+import multiprocessing
+import threading
+
+## @brief Body of the child process: build the instrument and serve requests
+#         until the pipe is closed or a close request arrives.
+#
+#  @param conn Child end of the pipe.
+#  @param factory Class constructing the instrument.
+#  @param params Keyword arguments of factory.
+def _serve(conn, factory, params):
+    try:
+        instrument = factory(**params)
+    except Exception as e:
+        conn.send(('error', e))
+        conn.close()
+        return
+    conn.send(('ok', None))
+
+    while True:
+        try:
+            kind, name, args = conn.recv()
+        except EOFError:
+            break
+        if kind == 'close':
+            conn.send(('ok', None))
+            break
+        try:
+            result = getattr(instrument, name)
+            if kind == 'call':
+                result = result(*args)
+        except Exception as e:
+            conn.send(('error', e))
+        else:
+            conn.send(('ok', result))
+    conn.close()
+
+## Proxy for an instrument running in a child process. Safe to share between
+#  threads, requests are sent one at a time.
+class RemoteLaser:
+    ## @brief Start the child process and wait for the instrument to be built.
+    #
+    #  @param factory Class constructing the instrument, Laser by default. Must
+    #         be importable by the child process.
+    #  @param start_method multiprocessing start method, 'spawn' by default so
+    #         that the child never inherits the parent's threads or SDK handles.
+    #  @param params Keyword arguments of factory.
+    #  @exception Whatever factory raised in the child.
+    def __init__(self, factory=None, start_method='spawn', **params):
+        if factory is None:
+            from laser import Laser
+            factory = Laser
+        context = multiprocessing.get_context(start_method)
+        self.__conn, child = context.Pipe()
+        self.__lock = threading.Lock()
+        ## The child process hosting the instrument.
+        self.process = context.Process(target=_serve, args=(child, factory, params),
+                                       name='remote_laser', daemon=True)
+        self.process.start()
+        child.close()
+        self.__receive()
+
+    ## @brief Set a field of the instrument, see Laser.set_field.
+    def set_field(self, field_name, value):
+        return self.__request('call', 'set_field', (field_name, value))
+
+    ## @brief Turn the instrument off, see Laser.turn_off_laser. The child keeps
+    #         serving so that data, time_axis and setpoints can still be read.
+    def turn_off_laser(self, save_data=True):
+        return self.__request('call', 'turn_off_laser', (save_data,))
+
+    ## @brief Capture transients, see Laser.capture_transients.
+    def capture_transients(self, count, duration):
+        return self.__request('call', 'capture_transients', (count, duration))
+
+    ## @brief Data and setpoints acquired since the given cursors, see
+    #         Laser.since. Only what is new crosses the pipe.
+    def since(self, data_cursor, setpoints_cursor, events_cursor=0):
+        return self.__request('call', 'since', (data_cursor, setpoints_cursor, events_cursor))
+
+    ## @brief Move everything acquired so far out of the instrument, see
+    #         Laser.take_acquired. The instrument's own lists are emptied.
+    def take_acquired(self):
+        return self.__request('call', 'take_acquired')
+
+    ## @brief Statistics of the instrument's SDK calls, see Laser.call_stats.
+    def call_stats(self):
+        return self.__request('call', 'call_stats')
+
+    ## @brief Stop the child process.
+    def close(self):
+        if self.process.is_alive():
+            self.__request('close', None)
+        self.process.join()
+
+    ## Other attributes are read from the instrument, as a copy.
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self.__request('get', name)
+
+    def __request(self, kind, name, args=()):
+        with self.__lock:
+            self.__conn.send((kind, name, args))
+            return self.__receive()
+
+    def __receive(self):
+        status, value = self.__conn.recv()
+        if status == 'error':
+            raise value
+        return value
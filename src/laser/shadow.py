@@ -0,0 +1,56 @@
+## @package laser.shadow
+#  Shadow copy of the laser parameters confirmed by the hardware.
+#
+#  A value enters the shadow state only once the controller has confirmed
+#  it: QCL parameters after they read back correctly, the wavelength after
+#  tuning has finished. While a field's confirmed value is current, writing
+#  that same value again can be skipped, and reading the field can be
+#  answered without a round trip to the controller.
+#
+#  Invalidation policy:
+#  - Any error or interruption while setting a field invalidates everything,
+#    as the state of the controller is then unknown.
+#  - Connecting to the laser, and disconnecting from it, invalidates
+#    everything.
+#  - Every confirmed value expires max_age seconds after confirmation, after
+#    which the next write or read goes to the hardware and re-confirms it.
+
+import time
+
+class ShadowState:
+    ## @param max_age Seconds a confirmed value is trusted for, None for ever.
+    #  @param clock Function returning the current time in seconds.
+    def __init__(self, max_age=None, clock=time.monotonic):
+        ## Seconds a confirmed value is trusted for, None for ever.
+        self.max_age = max_age
+        self.__clock = clock
+        # Dictionary of field name to (value, time confirmed).
+        self.__confirmed = {}
+
+    ## @brief Record that the hardware confirmed a field's value.
+    def confirm(self, field_name, value):
+        self.__confirmed[field_name] = (value, self.__clock())
+
+    ## @brief The confirmed value of a field, or None if unknown or expired.
+    def get(self, field_name):
+        entry = self.__confirmed.get(field_name)
+        if entry is None:
+            return None
+        value, confirmed_at = entry
+        if self.max_age is not None and self.__clock() - confirmed_at > self.max_age:
+            del self.__confirmed[field_name]
+            return None
+        return value
+
+    ## @brief Whether value is the current confirmed value of a field, i.e.
+    #         whether writing it can be skipped.
+    def matches(self, field_name, value):
+        confirmed = self.get(field_name)
+        return confirmed is not None and confirmed == value
+
+    ## @brief Forget one field, or every field if field_name is None.
+    def invalidate(self, field_name=None):
+        if field_name is None:
+            self.__confirmed.clear()
+        else:
+            self.__confirmed.pop(field_name, None)
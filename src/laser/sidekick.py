@@ -0,0 +1,100 @@
+## @package laser.sidekick
+#  Typed binding of the Daylight Sidekick SDK.
+#
+#  The C signature of every SDK function the driver uses is declared once,
+#  so that ctypes converts and checks each argument: passing the wrong type
+#  raises ctypes.ArgumentError instead of handing the SDK a bad value. The
+#  function pointers are looked up once and kept as attributes, so calls
+#  skip the library's attribute lookup. QclParams holds the QCL parameters
+#  in one preallocated structure that is read into and written from
+#  in place.
+#
+#  Example:
+#
+#  sdk = bind(CDLL(path))
+#  params = QclParams()
+#  sdk.SidekickSDK_GetLaserQclParams(handle, *params.pointers().values())
+
+from ctypes import (CDLL, POINTER, Structure, pointer, c_bool, c_float, c_int32,
+                    c_uint8, c_uint16, c_uint32)
+
+## Type of the laser handle, as returned through ConnectToDeviceNumber.
+HANDLE = c_uint32
+
+## Argument types of every SDK function used, all of which return an int32
+#  status that is 0 on success.
+SIGNATURES = {
+    'SidekickSDK_Initialize': [],
+    'SidekickSDK_SearchForUsbDevices': [],
+    'SidekickSDK_GetNumOfDevices': [POINTER(c_uint16)],
+    'SidekickSDK_ConnectToDeviceNumber': [POINTER(HANDLE), c_uint16],
+    'SidekickSDK_Disconnect': [HANDLE],
+    'SidekickSDK_ReadAdminQclParams': [HANDLE, c_uint8],
+    'SidekickSDK_AdminQclIsAvailable': [HANDLE, POINTER(c_bool)],
+    'SidekickSDK_isInterlockedStatusSet': [HANDLE, POINTER(c_bool)],
+    'SidekickSDK_isKeySwitchStatusSet': [HANDLE, POINTER(c_bool)],
+    'SidekickSDK_SetLaserArmDisarm': [HANDLE, c_bool],
+    'SidekickSDK_ExecLaserArmDisarm': [HANDLE],
+    'SidekickSDK_ReadInfoStatusMask': [HANDLE],
+    'SidekickSDK_isLaserArmed': [HANDLE, POINTER(c_bool)],
+    'SidekickSDK_isTempStatusSet': [HANDLE, POINTER(c_bool)],
+    'SidekickSDK_isLaserFiring': [HANDLE, POINTER(c_bool)],
+    'SidekickSDK_ReadStatusMask': [HANDLE, POINTER(c_uint32), POINTER(c_uint16),
+                                   POINTER(c_uint16)],
+    'SidekickSDK_SetLaserOnOff': [HANDLE, c_uint8, c_bool],
+    'SidekickSDK_ExecLaserOnOff': [HANDLE],
+    'SidekickSDK_ReadWriteLaserQclParams': [HANDLE, c_bool, c_uint8],
+    'SidekickSDK_GetLaserQclParams': [HANDLE, POINTER(c_uint8), POINTER(c_uint32),
+                                      POINTER(c_uint32), POINTER(c_uint16), POINTER(c_float),
+                                      POINTER(c_uint8), POINTER(c_uint8), POINTER(c_float)],
+    'SidekickSDK_SetLaserQclParams': [HANDLE, c_uint8, c_uint32, c_uint32, c_uint16,
+                                      c_float, c_uint8, c_uint8, c_float],
+    'SidekickSDK_SetTuneToWW': [HANDLE, c_uint8, c_float, c_uint8],
+    'SidekickSDK_ExecTuneToWW': [HANDLE],
+}
+
+## The SDK with the signatures declared and function pointers cached.
+class SidekickSDK:
+    ## @param library The loaded CDLL.
+    def __init__(self, library):
+        ## The underlying library, for functions not in SIGNATURES.
+        self.library = library
+        for name, argtypes in SIGNATURES.items():
+            fn = getattr(library, name)
+            fn.argtypes = argtypes
+            fn.restype = c_int32
+            setattr(self, name, fn)
+
+    ## Functions without a declared signature come untyped from the library.
+    def __getattr__(self, name):
+        return getattr(self.library, name)
+
+## @brief Bind a loaded SDK library.
+#
+#  @param library A CDLL of the SDK, or a test double with the same methods,
+#         which is returned unchanged.
+#  @returns The SidekickSDK binding, or the test double.
+def bind(library):
+    if isinstance(library, CDLL):
+        return SidekickSDK(library)
+    return library
+
+## QCL parameters as read and written by the Get/SetLaserQclParams functions.
+class QclParams(Structure):
+    _fields_ = [('qcl_slot', c_uint8), ('pulse_rate_hz', c_uint32),
+                ('pulse_width_ns', c_uint32), ('current_ma', c_uint16),
+                ('temp_c', c_float), ('laser_mode', c_uint8),
+                ('pulse_mode', c_uint8), ('vsrc', c_float)]
+
+    ## @brief Pointers into the structure, one per field in argument order,
+    #         keyed by field name with a '_ptr' suffix. Built once per
+    #         structure; writing a pointer's contents.value updates the field.
+    def pointers(self):
+        ptrs = self.__dict__.get('_pointers')
+        if ptrs is None:
+            ptrs = {}
+            for name, ctype in self._fields_:
+                field = ctype.from_buffer(self, getattr(QclParams, name).offset)
+                ptrs[name + '_ptr'] = pointer(field)
+            self.__dict__['_pointers'] = ptrs
+        return ptrs
@@ -0,0 +1,394 @@
+import laser
+import numpy as np
+from action import ScheduledAction
+from experiment import Experiment
+from data_analysis import reduction
+
+## Orders a scan can step through its values in.
+ORDERS = ('monotonic', 'serpentine', 'given')
+
+##
+# Orders the steps of a scan.
+#
+# monotonic sorts the values and runs every pass in the same direction,
+# serpentine sorts them and reverses direction every pass, so no pass
+# starts with a long tune back, and given keeps the values as given. Sorted
+# passes start from the end nearest start, if given, to shorten the first
+# tune. With interleave, repeats are whole passes, so slow drift spreads
+# over all values alike and, for serpentine, linear drift cancels in the
+# average of a forward and a backward pass; without, every value is
+# repeated in place before moving on.
+#
+# @param values setpoints of the scan
+# @param repeats number of times every value is visited
+# @param order one of ORDERS
+# @param interleave whether repeats are whole passes
+# @param start value the laser is at before the scan, if known
+# @returns list of the setpoints in the order they are set
+def step_order(values, repeats = 1, order = 'serpentine', interleave = True, start = None):
+  if order not in ORDERS:
+    raise ValueError('Unknown scan order {}, expected one of {}'.format(order, ORDERS))
+  values = list(values)
+  if order != 'given':
+    values.sort()
+    if start is not None and abs(values[-1] - start) < abs(values[0] - start):
+      values.reverse()
+
+  if not interleave:
+    return [value for value in values for _ in range(repeats)]
+  sequence = []
+  for p in range(repeats):
+    if order == 'serpentine' and p % 2 == 1:
+      sequence.extend(reversed(values))
+    else:
+      sequence.extend(values)
+  return sequence
+
+##
+# A setpoint as a Python number, as the SDK takes no NumPy scalars
+def _plain(value):
+  return value.item() if isinstance(value, np.generic) else value
+
+##
+# Total distance tuned through when setting the steps in order, starting
+# from start if given
+def tuning_distance(sequence, start = None):
+  path = np.asarray(([] if start is None else [start]) + list(sequence), dtype = float)
+  return float(np.abs(np.diff(path)).sum())
+
+##
+# The ScanEstimate class holds the pre-run estimate of a scan: the number
+# of steps, the experiment ticks, the distance tuned through and the total
+# seconds including the time the laser takes to apply the changes
+
+class ScanEstimate:
+
+  def __init__(self, steps, ticks, tuning_distance, seconds):
+    self.steps = steps
+    self.ticks = ticks
+    self.tuning_distance = tuning_distance
+    self.seconds = seconds
+
+##
+# The ScanExperiment class steps one laser field through a set of values,
+# dwelling at each, and reduces the lock-in data of every step to its
+# mean. The steps are ordered by step_order and compiled into a single
+# ScheduledAction. WavelengthScan and CurrentScan are the scans of the
+# README.
+#
+# Example: The following scans five wavelengths twice, once up and once
+# down, dwelling 10 seconds per step, 4 of which are left to settle.
+#
+# scan = WavelengthScan.builder() \
+#   .with_range(1000, 1100, 25) \
+#   .with_dwell(10) \
+#   .with_settle(4) \
+#   .with_repeats(2) \
+#   .build()
+# scan.estimate().seconds
+# wavelengths, mean, err = scan.run()
+
+class ScanExperiment:
+
+  ##
+  # Builder for scan experiments, validates the parameters
+  class Builder:
+    _values = None
+    _dwell = 10
+    _settle = 2
+    _order = 'serpentine'
+    _repeats = 1
+    _interleave = True
+    _start = None
+    _instrument = None
+
+    def __init__(self, field, experiment_class):
+      self._field = field
+      self._experiment_class = experiment_class
+
+    ##
+    # Values the field is set to
+    def with_values(self, values):
+      self._values = list(values)
+      return self
+
+    ##
+    # Values from start to stop, both included, step apart
+    def with_range(self, start, stop, step):
+      count = int(round((stop - start)/step)) + 1
+      self._values = list(start + step*np.arange(count))
+      return self
+
+    ##
+    # Seconds spent at every step, either one for all or one per value in
+    # the order of with_values
+    def with_dwell(self, dwell):
+      self._dwell = dwell
+      return self
+
+    ##
+    # Seconds at the start of every step that are left out of the
+    # reduction while the signal settles
+    def with_settle(self, settle):
+      self._settle = settle
+      return self
+
+    ##
+    # Order of the steps, one of ORDERS
+    def with_order(self, order):
+      self._order = order
+      return self
+
+    ##
+    # Number of visits to every value, as whole passes if interleave
+    def with_repeats(self, repeats, interleave = True):
+      self._repeats = repeats
+      self._interleave = interleave
+      return self
+
+    ##
+    # Value the field is at before the scan, so sorted scans start at the
+    # nearer end
+    def with_start(self, start):
+      self._start = start
+      return self
+
+    ##
+    # Name of the instrument scanned, the default laser if None
+    def with_instrument(self, instrument):
+      self._instrument = instrument
+      return self
+
+    ##
+    # Validates the parameters and builds the scan
+    def build(self):
+      assert self._values
+      dwells = np.broadcast_to(self._dwell, (len(self._values),))
+      assert all(int(d) == d and d > 0 for d in dwells)
+      assert 0 <= self._settle < min(dwells)
+      assert self._order in ORDERS
+      assert int(self._repeats) == self._repeats and self._repeats > 0
+      return self._experiment_class(self)
+
+  @staticmethod
+  ##
+  # Should be called by the user to retrieve the class Builder of a scan
+  # of the given field
+  def builder(field):
+    return ScanExperiment.Builder(field, ScanExperiment)
+
+  def __init__(self, builder):
+    self._field = builder._field
+    self._settle = builder._settle
+    self._instrument = builder._instrument
+    dwells = np.broadcast_to(builder._dwell, (len(builder._values),))
+    dwell_of = {value: int(d) for value, d in zip(builder._values, dwells)}
+
+    ## Setpoints in the order they are set
+    self.sequence = step_order(builder._values, builder._repeats, builder._order,
+      builder._interleave, builder._start)
+    ## Seconds dwelt at every step of sequence
+    self.dwells = np.array([dwell_of[value] for value in self.sequence])
+    self._start = builder._start
+
+    ticks = 1 + np.concatenate([[0], np.cumsum(self.dwells)[:-1]])
+    self._experiment = Experiment.builder() \
+      .with_actions([ScheduledAction(self._field,
+        {int(tick): _plain(value) for tick, value in zip(ticks, self.sequence)},
+        self._instrument)]) \
+      .with_duration(int(ticks[-1] + self.dwells[-1])) \
+      .build()
+
+  ##
+  # The underlying Experiment the steps are compiled into
+  def experiment(self):
+    return self._experiment
+
+  ##
+  # Estimate of the scan before running it. Every change of value is
+  # taken to add tune_time seconds for wavelengths, params_time otherwise,
+  # to the experiment ticks
+  def estimate(self, tune_time = 5.0, params_time = 0.0):
+    sequence = np.asarray(self.sequence, dtype = float)
+    changes = int(np.count_nonzero(np.diff(sequence))) + 1
+    if self._start is not None and sequence[0] == self._start:
+      changes -= 1
+    ticks = self._experiment._duration
+    overhead = tune_time if self._field == 'wavelength' else params_time
+    return ScanEstimate(len(self.sequence), ticks,
+      tuning_distance(self.sequence, self._start), ticks + changes*overhead)
+
+  ##
+  # Runs the scan and reduces the acquired data
+  def run(self):
+    self._experiment.run()
+    return self.analyze()
+
+  ##
+  # Reduces the data of every step to its mean and averages the visits of
+  # every value. Defaults to the data and setpoints of the scanned laser.
+  #
+  # @param time_axis 1D numpy array of lock-in sample times
+  # @param data 1D numpy array of lock-in samples
+  # @param setpoints list of (time, field_name, value) as recorded by
+  #   Laser.set_field, the last entries of the field are taken as the steps
+  # @returns tuple of (sorted values, mean, standard error) arrays
+  def analyze(self, time_axis = None, data = None, setpoints = None):
+    if time_axis is None or data is None or setpoints is None:
+      laser_obj = laser.get(self._instrument)
+      time_axis = np.concatenate(laser_obj.time_axis)
+      data = np.concatenate(laser_obj.data)
+      setpoints = laser_obj.setpoints
+
+    n = len(self.sequence)
+    starts = np.array([t for t, field_name, _ in setpoints
+                       if field_name == self._field], dtype = float)
+    if starts.size < n:
+      raise ValueError('Expected {} {} steps, found {}'.format(n, self._field, starts.size))
+    starts = starts[-n:]
+
+    ## Mean and standard error of every step, in the order of sequence
+    self.step_mean, self.step_err, _ = reduction.reduce_windows(time_axis, data,
+      starts + self._settle, starts + self.dwells)
+
+    values, which = np.unique(np.asarray(self.sequence, dtype = float), return_inverse = True)
+    visits = np.bincount(which, minlength = values.size)
+    mean = np.bincount(which, self.step_mean, values.size)/visits
+    err = np.sqrt(np.bincount(which, self.step_err**2, values.size))/visits
+    return values, mean, err
+
+##
+# The WavelengthScan class is a ScanExperiment of the wavelength, see
+# ScanExperiment for the builder
+
+class WavelengthScan(ScanExperiment):
+
+  @staticmethod
+  def builder():
+    return ScanExperiment.Builder('wavelength', WavelengthScan)
+
+##
+# The CurrentScan class is a ScanExperiment of the current, see
+# ScanExperiment for the builder
+
+class CurrentScan(ScanExperiment):
+
+  @staticmethod
+  def builder():
+    return ScanExperiment.Builder('current', CurrentScan)
+
+##
+# The TimeScan class records the lock-in for a set duration with the laser
+# held at fixed settings, and reduces the data into bins of equal length.
+#
+# Example: The following holds 1050 wavenumbers for 10 minutes, 1 second
+# bins.
+#
+# scan = TimeScan.builder() \
+#   .with_settings({'wavelength': 1050}) \
+#   .with_duration(600) \
+#   .build()
+# bin_starts, mean, err = scan.run()
+
+class TimeScan:
+
+  ##
+  # Builder for the time scan, validates the parameters
+  class Builder:
+    _settings = {}
+    _duration = None
+    _bin = 1
+    _instrument = None
+
+    ##
+    # Dictionary of field name to the value set at the start of the scan
+    def with_settings(self, settings):
+      self._settings = dict(settings)
+      return self
+
+    ##
+    # Seconds recorded
+    def with_duration(self, duration):
+      self._duration = duration
+      return self
+
+    ##
+    # Seconds of data averaged into every bin
+    def with_bin(self, seconds):
+      self._bin = seconds
+      return self
+
+    ##
+    # Name of the instrument recorded, the default laser if None
+    def with_instrument(self, instrument):
+      self._instrument = instrument
+      return self
+
+    ##
+    # Validates the parameters and builds the scan
+    def build(self):
+      assert self._duration is not None and int(self._duration) == self._duration
+      assert self._duration > 0
+      assert 0 < self._bin <= self._duration
+      return TimeScan(self)
+
+  @staticmethod
+  ##
+  # Should be called by the user to retrieve the class Builder
+  def builder():
+    return TimeScan.Builder()
+
+  def __init__(self, builder):
+    self._duration = int(builder._duration)
+    self._bin = builder._bin
+    self._instrument = builder._instrument
+    # the settings are applied at the first tick, and a tick with nothing
+    # to set records as any other
+    actions = [ScheduledAction(field_name, {1: value}, self._instrument)
+               for field_name, value in builder._settings.items()]
+    if not actions:
+      actions = [ScheduledAction(None, {}, self._instrument)]
+    self._experiment = Experiment.builder() \
+      .with_actions(actions) \
+      .with_duration(self._duration + 1) \
+      .build()
+
+  ##
+  # The underlying Experiment the scan is compiled into
+  def experiment(self):
+    return self._experiment
+
+  ##
+  # Estimate of the scan before running it, see ScanExperiment.estimate
+  def estimate(self, tune_time = 5.0, params_time = 0.0):
+    actions = self._experiment._actions
+    overhead = sum(tune_time if action._field_name == 'wavelength' else params_time
+                   for action in actions if action._field_name is not None)
+    ticks = self._experiment._duration
+    return ScanEstimate(len(actions), ticks, 0.0, ticks + overhead)
+
+  ##
+  # Runs the scan and reduces the acquired data
+  def run(self):
+    self._experiment.run()
+    return self.analyze()
+
+  ##
+  # Reduces the data into bins from the start of the recording. Defaults
+  # to the data of the recorded laser.
+  #
+  # @param time_axis 1D numpy array of lock-in sample times
+  # @param data 1D numpy array of lock-in samples
+  # @returns tuple of (bin start times from the first sample, mean,
+  #   standard error) arrays
+  def analyze(self, time_axis = None, data = None):
+    if time_axis is None or data is None:
+      laser_obj = laser.get(self._instrument)
+      time_axis = np.concatenate(laser_obj.time_axis)
+      data = np.concatenate(laser_obj.data)
+    if time_axis.size == 0:
+      return np.empty(0), np.empty(0), np.empty(0)
+    starts = np.arange(0, time_axis[-1] - time_axis[0], self._bin)
+    mean, err, _ = reduction.reduce_windows(time_axis, data,
+      time_axis[0] + starts, time_axis[0] + starts + self._bin)
+    return starts, mean, err
@@ -0,0 +1,115 @@
+## @package test_acquisition
+#  This module contains unit tests for acquisition in a dedicated process -
+#   the SharedRing hand-off and the AcquisitionProcess polling into it.
+
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+import numpy as np
+from laser import acquisition
+from laser.acquisition import SharedRing, AcquisitionProcess
+
+## Lock-in data server stand-in returning 20 samples per poll at 1 kHz
+class FakeDAQ:
+    def __init__(self, ip, port):
+        self.polls = 0
+
+    def sync(self):
+        return
+
+    def getInt(self, path):
+        return 1000
+
+    def subscribe(self, path):
+        return
+
+    def unsubscribe(self, path):
+        return
+
+    def poll(self, length, timeout):
+        time.sleep(0.02)
+        stamps = np.arange(self.polls * 20, (self.polls + 1) * 20)
+        self.polls += 1
+        return {'dev0': {'demods': {'0': {'sample': {
+            'x': np.full(20, 3.0), 'y': np.full(20, 4.0), 'timestamp': stamps,
+            'time': {'dataloss': self.polls == 3}}}}}}
+
+## Testing class for `SharedRing` and `AcquisitionProcess`
+class AcquisitionTesting(unittest.TestCase):
+
+    ## setUp method creates a small ring so that tests wrap around it
+    def setUp(self):
+        self.ring = SharedRing(capacity = 10)
+
+    ## Test that a second handle attached by name sees the samples in order,
+    #   as zero-copy views split at the end of the ring
+    def test_views(self):
+        reader = SharedRing(10, name = self.ring.name)
+        try:
+            self.ring.publish(np.arange(8), np.arange(8) * 2)
+            self.ring.publish(np.arange(8, 13), np.arange(8, 13) * 2)
+
+            chunks, cursor, overrun = reader.read(5)
+            self.assertEqual(cursor, 13)
+            self.assertFalse(overrun)
+            self.assertEqual(len(chunks), 2)
+            self.assertTrue(np.shares_memory(chunks[0][0], reader._time))
+            np.testing.assert_array_equal(np.concatenate([t for t, _ in chunks]),
+                                          np.arange(5, 13))
+            self.assertTrue(reader.valid(5))
+            chunks = None
+        finally:
+            reader.close()
+
+    ## Test that reading from overwritten samples is flagged as an overrun
+    #   and resumes from the oldest sample held
+    def test_overrun(self):
+        self.ring.publish(np.arange(25), np.arange(25))
+        time_axis, data, cursor, overrun = self.ring.copy(0)
+        self.assertTrue(overrun)
+        np.testing.assert_array_equal(time_axis, np.arange(15, 25))
+        self.assertFalse(self.ring.copy(cursor)[3])
+
+    ## Test that rings fall back to memory mapped files where shared_memory
+    #   is missing, as before Python 3.8
+    def test_mapped_file(self):
+        with mock.patch.object(acquisition, 'shared_memory', None):
+            ring = SharedRing(capacity = 10)
+            reader = SharedRing(10, name = ring.name)
+        path = os.path.join(tempfile.gettempdir(), ring.name)
+        self.assertTrue(os.path.exists(path))
+        ring.publish(np.arange(13), np.arange(13) * 2)
+        time_axis, data, cursor, overrun = reader.copy(5)
+        np.testing.assert_array_equal(time_axis, np.arange(5, 13))
+        np.testing.assert_array_equal(data, np.arange(5, 13) * 2)
+        self.assertEqual((cursor, overrun), (13, False))
+        reader.close()
+        ring.close()
+        self.assertFalse(os.path.exists(path))
+
+    ## Test that the acquisition process publishes every polled sample, in
+    #   order, and counts reported data loss
+    def test_process(self):
+        acquisition = AcquisitionProcess('dev0', capacity = 1000, daq_factory = FakeDAQ)
+        acquisition.start()
+        deadline = time.time() + 30
+        while acquisition.ring.written < 100 and time.time() < deadline:
+            time.sleep(0.05)
+        acquisition.stop()
+
+        time_axis, data, cursor, overrun = acquisition.ring.copy(0)
+        self.assertFalse(overrun)
+        self.assertGreaterEqual(cursor, 100)
+        np.testing.assert_allclose(time_axis, np.arange(cursor) / 1000)
+        np.testing.assert_allclose(data, 5.0)
+        self.assertEqual(acquisition.ring.dataloss, 1)
+        acquisition.close()
+
+    def tearDown(self):
+        self.ring.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
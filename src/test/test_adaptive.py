@@ -0,0 +1,88 @@
+## @package test_adaptive
+#  This module contains unit tests for adapting the acquisition to the host -
+#   poll slice length, demod rate and recording of gaps.
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from laser import Laser
+from laser.adaptive import AcquisitionController, with_gaps
+
+## Testing class for `AcquisitionController` and `with_gaps`
+class AdaptiveTesting(unittest.TestCase):
+
+    ## setUp method creates a controller at 100 samples/s polling 0.1 s slices
+    def setUp(self):
+        self.controller = AcquisitionController(100, poll_length = 0.1, max_poll_length = 0.4,
+                                                min_demod_rate = 25, recover_after = 3)
+
+    ## Test that gaps within and between polls are recorded as intervals
+    def test_gaps(self):
+        self.controller.update(np.arange(10) / 100, False, 0.1)
+        self.controller.update(np.array([0.15, 0.16, 0.3, 0.31]), True, 0.1)
+        self.assertEqual(self.controller.gaps, [(0.09, 0.15), (0.16, 0.3)])
+        self.assertEqual(self.controller.lost_polls, 1)
+
+    ## Test that lost samples first lengthen the slice, then lower the demod
+    #   rate down to the floor, and that clean polls shorten the slice again
+    def test_adapt(self):
+        rates = [self.controller.update(np.empty(0), True, 0.1) for _ in range(5)]
+        self.assertEqual(rates, [None, None, 50, 25, None])
+        self.assertEqual(self.controller.poll_length, 0.4)
+        self.assertEqual(self.controller.poll_timeout, 800)
+        self.assertEqual([event[1:] for event in self.controller.events],
+                         [('poll_length', 0.1, 0.2), ('poll_length', 0.2, 0.4),
+                          ('demod_rate', 100, 50), ('demod_rate', 50, 25)])
+
+        for _ in range(3):
+            self.controller.update(np.empty(0), False, 0.4)
+        self.assertEqual(self.controller.poll_length, 0.2)
+
+    ## Test that a backlog of samples lengthens the slice
+    def test_backlog(self):
+        self.controller.update(np.arange(30) / 100, False, 0.1)
+        self.assertEqual(self.controller.poll_length, 0.2)
+
+    ## Test that a masked sample is inserted in the middle of each gap
+    def test_with_gaps(self):
+        time_axis, data = with_gaps([0, 1, 5, 6], [1, 2, 3, 4], [(1, 5)])
+        np.testing.assert_allclose(time_axis, [0, 1, 3, 5, 6])
+        self.assertEqual(data.mask.tolist(), [False, False, True, False, False])
+        self.assertEqual(data.compressed().tolist(), [1, 2, 3, 4])
+
+
+    ## Test that the laser saves the gaps and events of a run with its data,
+    #   and removes those of the previous run when the new one has none
+    def test_laser_files(self):
+        self.controller.update(np.array([0, 0.01, 0.5]), True, 0.1)
+        self.controller.update(np.empty(0), True, 0.1)
+        sdk = mock.Mock()
+        sdk.SidekickSDK_Initialize.return_value = 0
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                for controller in (self.controller, None):
+                    with mock.patch.object(Laser, '_Laser__startup'):
+                        laser_obj = Laser(testing_sdk = sdk, testing_zi_sdk = object(),
+                                          instrument = False)
+                    laser_obj.poll_thread = mock.Mock()
+                    laser_obj.acquisition_controller = controller
+                    with mock.patch('sys.stderr'):
+                        laser_obj.turn_off_laser()
+                    if controller is not None:
+                        np.testing.assert_allclose(
+                            np.genfromtxt('Gaps.csv', delimiter = ','), [0.01, 0.5])
+                        with open('Events.csv') as f:
+                            events = [line.split(',')[1:] for line in f.read().splitlines()]
+                        self.assertEqual(events, [['poll_length', '0.1', '0.2'],
+                                                  ['poll_length', '0.2', '0.4']])
+                self.assertEqual(sorted(os.listdir(directory)), ['Data.csv'])
+            finally:
+                os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+## @package test_aio
+#  This module contains unit tests for the asyncio API - Laser.set_field_async,
+#   the AsyncLaser facade and Experiment.run_async.
+
+import asyncio
+import time
+import unittest
+from unittest import mock
+import laser
+from laser import Laser, Laser_Exception, aio
+from laser.emulator import EmulatedLaser
+from action import ScheduledAction
+from experiment import Experiment
+
+## Runs a coroutine to completion on an event loop of its own
+def run_until_complete(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+## Sidekick SDK stand-in keeping the QCL parameters and tuning requests
+class FakeSDK:
+    def __init__(self):
+        self.params = [0, 15000, 500, 1500, 17.0, 0, 0, 0.0]
+        self.tuned = []
+
+    def SidekickSDK_Initialize(self):
+        return 0
+
+    def SidekickSDK_ReadWriteLaserQclParams(self, handle, write, slot):
+        return 0
+
+    def SidekickSDK_GetLaserQclParams(self, handle, *ptrs):
+        for ptr, value in zip(ptrs, self.params):
+            ptr.contents.value = value
+        return 0
+
+    def SidekickSDK_SetLaserQclParams(self, handle, *values):
+        self.params = [value.value for value in values]
+        return 0
+
+    def SidekickSDK_SetTuneToWW(self, handle, units, value, pref):
+        self.tuned.append(value.value)
+        return 0
+
+    def SidekickSDK_ExecTuneToWW(self, handle):
+        return 0
+
+## Testing class for the asyncio API
+class AsyncTesting(unittest.TestCase):
+
+    ## Test that set_field_async awaits the hardware waits instead of
+    #   sleeping and still validates and records setpoints
+    def test_set_field_async(self):
+        sdk = FakeSDK()
+        with mock.patch.object(Laser, '_Laser__startup'):
+            laser_obj = Laser(testing_sdk = sdk, testing_zi_sdk = object(), instrument = False)
+
+        waits = []
+        async def fake_sleep(seconds):
+            waits.append(seconds)
+
+        async def scenario():
+            with mock.patch('laser.asyncio.sleep', fake_sleep):
+                await laser_obj.set_field_async('current', 1300)
+                await laser_obj.set_field_async('wavelength', 1100)
+            with self.assertRaises(Laser_Exception):
+                await laser_obj.set_field_async('current', 2000)
+
+        run_until_complete(scenario())
+        laser_obj.sdk_executor.shutdown()
+        self.assertEqual(waits, [5])
+        self.assertEqual(sdk.params[3], 1300)
+        self.assertEqual(sdk.tuned, [1100])
+        self.assertEqual([s[1:] for s in laser_obj.setpoints],
+                         [('current', 1300), ('wavelength', 1100)])
+
+    ## Test that waits on two lasers overlap instead of adding up
+    def test_concurrent_lasers(self):
+        lasers = [aio.AsyncLaser(EmulatedLaser(tune_time = 0.3)) for _ in range(2)]
+
+        async def scenario():
+            await asyncio.gather(*(l.set_field('wavelength', 1000 + 10*i)
+                                   for i, l in enumerate(lasers)))
+
+        start = time.perf_counter()
+        run_until_complete(scenario())
+        self.assertLess(time.perf_counter() - start, 0.55)
+        self.assertEqual([l.wavelength for l in lasers], [1000, 1010])
+
+    ## Test that an experiment runs its actions and turns the laser off from
+    #   an event loop, alongside another task
+    def test_run_async(self):
+        emulated = EmulatedLaser()
+        laser.set_for_test(emulated)
+        experiment = Experiment.builder() \
+            .with_actions([ScheduledAction('wavelength', {1: 1000})]) \
+            .with_duration(1) \
+            .build()
+        ticks = []
+
+        async def other_task():
+            while emulated.laser_on:
+                ticks.append(time.perf_counter())
+                await asyncio.sleep(0.1)
+
+        async def scenario():
+            await asyncio.gather(experiment.run_async(), other_task())
+
+        run_until_complete(scenario())
+        self.assertEqual(emulated.wavelength, 1000)
+        self.assertFalse(emulated.laser_on)
+        self.assertGreater(len(ticks), 5)
+
+    def tearDown(self):
+        laser.reset_for_testing()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,9 +3,12 @@
 #   handles reading the data obtained from an experiment and analysis 
 #   functions like taking the derivative or integral of the data.
 
+import os
+import subprocess
+import sys
 import unittest
 import numpy as np
-from data_analysis import analysis
+from data_analysis import align, analysis, resample
 import time
 
 ## Testing class for the `Analysis` module
@@ -50,16 +53,17 @@ class AnalysisTesting(unittest.TestCase):
 
 
     ## Test the differentiate function:
-    #   - For the analysis linspace used, the derivative should be a constant 
-    #       1 for all values
-    #   - Square original, deriv should be 2*orig, ignore end points as np.gradient
-    #       uses first differences with those points
+    #   - Without an x axis samples are one apart, so for the analysis
+    #       linspace used the derivative should be a constant step for all values
+    #   - Square original, deriv should be 2*orig*step, ignore end points as
+    #       np.gradient uses first differences with those points
     #   - Repeat this with the cube and to the fourth power
     def test_differentiate(self):
+        step = self.analysis_obj.data_raw[1] - self.analysis_obj.data_raw[0]
         self.analysis_obj.differentiate()
 
         for value in self.analysis_obj.data_adjusted.tolist():
-            self.assertAlmostEqual(value, 1) 
+            self.assertAlmostEqual(value, step) 
 
 
         self.analysis_obj.reset()
@@ -68,7 +72,7 @@ class AnalysisTesting(unittest.TestCase):
 
         for value,orig in zip(self.analysis_obj.data_adjusted.tolist()[1:-1],\
                           self.analysis_obj.data_raw.tolist()[1:-1]):
-            self.assertAlmostEqual(value, 2*orig)
+            self.assertAlmostEqual(value, 2*orig*step)
 
 
         self.analysis_obj.reset()
@@ -78,7 +82,7 @@ class AnalysisTesting(unittest.TestCase):
 
         for value,orig in zip(self.analysis_obj.data_adjusted.tolist()[2:-2],\
                           self.analysis_obj.data_raw.tolist()[2:-2]):
-            self.assertAlmostEqual(value, 6*orig)
+            self.assertAlmostEqual(value, 6*orig*step**2)
 
 
         self.analysis_obj.reset()
@@ -89,7 +93,7 @@ class AnalysisTesting(unittest.TestCase):
 
         for value,orig in zip(self.analysis_obj.data_adjusted.tolist()[3:-3],\
                           self.analysis_obj.data_raw.tolist()[3:-3]):
-            self.assertAlmostEqual(value, 24*orig)
+            self.assertAlmostEqual(value, 24*orig*step**3)
 
 
 
@@ -134,8 +138,10 @@ class AnalysisTesting(unittest.TestCase):
 
     ## Test the ratio function:
     #   - Make sure that the division works correctly
-    #   - Ensure the data remains unchanged if the size of the divisor is not
-    #       equal to the size of the dividend
+    #   - Ensure a ValueError naming the missing axis is raised, and the data
+    #       left unchanged, if the size of the divisor is not equal to the
+    #       size of the dividend and there are no axes to align them on
+    #   - Ensure frequency domain data is not divided by time domain data
     def test_ratio(self):
         ratio_array = np.linspace(3,3,500)
         self.analysis_obj.ratio(ratio_array)
@@ -146,12 +152,137 @@ class AnalysisTesting(unittest.TestCase):
 
         self.analysis_obj.reset()
         ratio_array = np.linspace(3,3,100)
-        self.analysis_obj.ratio(ratio_array)
+        with self.assertRaisesRegex(ValueError, 'x axis of the data and ratio_data'):
+            self.analysis_obj.ratio(ratio_array)
+        with self.assertRaisesRegex(ValueError, 'x axis of the data is'):
+            self.analysis_obj.ratio(ratio_array, x = np.arange(100))
 
         for value,orig in zip(self.analysis_obj.data_adjusted.tolist(),
                             self.analysis_obj.data_raw.tolist()):
             self.assertEqual(value,orig)
 
+        spectrum = analysis.Analysis(np.ones(500))
+        spectrum.fft()
+        with self.assertRaisesRegex(ValueError, 'frequency domain'):
+            spectrum.ratio(self.analysis_obj)
+
+    ## Test differentiating and integrating over an unevenly spaced x:
+    #   - The derivative of 3x is 3 and the integral of 2x from the first
+    #       sample is x^2 - x0^2, at every sample, however x is spaced
+    #   - Trimming and reset keep x_axis in step with data_adjusted
+    def test_uneven_axis(self):
+        x = np.cumsum(np.random.RandomState(0).uniform(0.1, 2.0, 50))
+        derivative = analysis.Analysis(3*x, x = x)
+        derivative.differentiate()
+        np.testing.assert_allclose(derivative.data_adjusted, 3)
+
+        integral = analysis.Analysis(2*x, x = x)
+        integral.integrate()
+        np.testing.assert_allclose(integral.data_adjusted, x[1:]**2 - x[0]**2)
+        np.testing.assert_array_equal(integral.x_axis, x[1:])
+        integral.trim(5, 10)
+        np.testing.assert_array_equal(integral.x_axis, x[6:11])
+        integral.reset()
+        np.testing.assert_array_equal(integral.x_axis, x)
+
+    ## Test resampling onto evenly spaced grids:
+    #   - Linear resampling of a line is exact, and points outside the
+    #       samples are NaN
+    #   - Cubic resampling follows a smooth curve closely, for stacked traces
+    #   - Two traces on different axes are ratioed on their common grid
+    def test_resample(self):
+        x = np.array([0.0, 0.5, 2.0, 2.5, 4.0])
+        np.testing.assert_allclose(resample.resample(x, 2*x + 1, [0.25, 3.0, 5.0]),
+                                   [1.5, 7.0, np.nan])
+
+        x = np.sort(np.random.RandomState(1).uniform(0, 10, 200))
+        grid = resample.uniform_grid(x, 100)
+        traces = np.stack([np.sin(x), np.cos(x)])
+        cubic = resample.resample(x, traces, grid, 'cubic')
+        self.assertEqual(cubic.shape, (2, 100))
+        np.testing.assert_allclose(cubic, [np.sin(grid), np.cos(grid)], atol = 1e-3)
+        with self.assertRaises(ValueError):
+            resample.resample(x, traces, grid, 'nearest')
+
+        t_sample = np.arange(0, 10, 0.5)
+        t_reference = np.arange(1, 12, 0.3)
+        sample = analysis.Analysis(4*t_sample, x = t_sample)
+        reference = analysis.Analysis(2*t_reference, x = t_reference)
+        grid = resample.common_grid([sample.x_axis, reference.x_axis])
+        self.assertEqual((grid[0], grid[-1], grid.size), (1.0, 9.5, 37))
+        sample.resample(grid)
+        reference.resample(grid)
+        sample.ratio(reference.data_adjusted)
+        np.testing.assert_allclose(sample.data_adjusted, 2)
+
+    ## Test that x_axis and sample_rate follow the data through the methods:
+    #   - Peaks are located on x_axis outside the frequency domain
+    #   - resample sets the sample rate of the new grid
+    #   - fft leaves the time axis behind for the frequency axis
+    def test_axes(self):
+        x = np.linspace(100, 200, 201)
+        axes_obj = analysis.Analysis(np.exp(-(x - 150)**2), x = x)
+        self.assertAlmostEqual(axes_obj.find_peaks().center[0], 150)
+        axes_obj.resample(num = 101)
+        self.assertAlmostEqual(axes_obj.sample_rate, 1.0)
+        axes_obj.fft()
+        self.assertIsNone(axes_obj.x_axis)
+        self.assertEqual(axes_obj.frequency_axis.size, axes_obj.data_adjusted.size)
+
+    ## Test the timestamp alignment against a search of every timestamp:
+    #   - As-of and forward matches, ties included, agree with searchsorted
+    #   - Nearest and linear matches, and the tolerance, on a small example
+    #   - Linear matches on repeated timestamps
+    def test_align(self):
+        rng = np.random.RandomState(2)
+        t_right = np.sort(rng.randint(0, 100, 300)).astype(float)
+        t_left = np.sort(rng.randint(-5, 105, 200)).astype(float)
+        np.testing.assert_array_equal(align.backward_indices(t_left, t_right),
+            np.searchsorted(t_right, t_left, side = 'right') - 1)
+        np.testing.assert_array_equal(align.forward_indices(t_left, t_right),
+            np.searchsorted(t_right, t_left, side = 'left'))
+
+        t_left = [0.0, 1.0, 1.2, 1.5, 3.5, 9.0]
+        t_right = [1.0, 2.0, 3.0, 4.0]
+        y_right = [10.0, 20.0, 30.0, 40.0]
+        np.testing.assert_allclose(align.align(t_left, t_right, y_right, 'nearest'),
+                                   [10, 10, 10, 10, 30, 40])
+        np.testing.assert_allclose(align.align(t_left, t_right, y_right, 'backward', 0.3),
+                                   [np.nan, 10, 10, np.nan, np.nan, np.nan])
+        np.testing.assert_allclose(align.align(t_left, t_right, y_right),
+                                   [np.nan, 10, 12, 15, 35, np.nan])
+        # a timestamp repeated on the right matches the last of its samples
+        np.testing.assert_allclose(align.align([2.0], [2.0, 2.0], [5.0, 7.0]), [7.0])
+        with self.assertRaises(ValueError):
+            align.align(t_left, t_right, y_right, 'cubic')
+
+    ## Test ratios of data sets with time axes of different lengths and
+    #   starts, the reference being aligned to the sample's timestamps
+    def test_ratio_aligned(self):
+        t_sample = np.arange(0, 10, 0.5)
+        t_reference = np.arange(-1, 12, 0.3)
+        sample = analysis.Analysis(6*t_sample + 6, x = t_sample)
+        sample.ratio(analysis.Analysis(2*t_reference + 2, x = t_reference))
+        np.testing.assert_allclose(sample.data_adjusted, 3)
+
+        sample.reset()
+        sample.ratio(np.full(t_reference.size, 2.0), x = t_reference,
+                     method = 'nearest', tolerance = 0.05)
+        self.assertEqual(np.count_nonzero(np.isnan(sample.data_adjusted)), 13)
+
+    ## Test that importing the analysis module, and the experiment code,
+    #   leaves out the GUI and the lock-in SDK:
+    #   - Assert that neither matplotlib nor zhinst end up in sys.modules
+    #       of a fresh interpreter.
+    def test_lean_imports(self):
+        src = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        out = subprocess.run([sys.executable, '-c',
+            'import sys, data_analysis.analysis, experiment; '
+            'print(sorted(m for m in ("matplotlib", "zhinst") if m in sys.modules))'],
+            cwd = src, check = True, stdout = subprocess.PIPE,
+            universal_newlines = True).stdout
+        self.assertEqual(out.strip(), '[]')
+
         
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
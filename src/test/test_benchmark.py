@@ -0,0 +1,71 @@
+## @package test_benchmark
+#  This module contains unit tests for the benchmark suite - measuring,
+#   saving baselines and comparing runs for regressions.
+
+import os
+import tempfile
+import unittest
+import benchmark
+import laser
+from benchmark.cases import CASES
+
+## Testing class for the `benchmark` package
+class BenchmarkTesting(unittest.TestCase):
+
+    ## setUp method prepares a trivial case with an allocation to trace
+    def setUp(self):
+        self.case = benchmark.Case('test.allocate',
+            lambda size: size, lambda size: bytearray(size))
+
+    ## Test that a sweep records statistics for every size in range and
+    #   skips sizes above a case's maximum
+    def test_run_suite(self):
+        limited = benchmark.Case('test.limited', lambda size: size,
+            lambda size: None, max_size = 1000)
+        baseline = benchmark.run_suite([self.case, limited], [1000, 100000], 3)
+
+        result = baseline['results']['test.allocate']['100000']
+        self.assertEqual(len(result['times']), 3)
+        self.assertLessEqual(result['min'], result['median'])
+        self.assertLessEqual(result['median'], result['p95'])
+        self.assertGreaterEqual(result['peak_bytes'], 100000)
+        self.assertEqual(list(baseline['results']['test.limited']), ['1000'])
+        self.assertIn('numpy', baseline['meta'])
+
+    ## Test that baselines survive a round trip through JSON and that only
+    #   slow-downs and memory growth beyond the tolerance are regressions
+    def test_compare(self):
+        baseline = benchmark.run_suite([self.case], [1000], 1)
+        handle, path = tempfile.mkstemp(suffix = '.json')
+        os.close(handle)
+        try:
+            benchmark.save(baseline, path)
+            baseline = benchmark.load(path)
+        finally:
+            os.remove(path)
+
+        current = {'results': {'test.allocate': {'1000': dict(
+            baseline['results']['test.allocate']['1000'])}}}
+        self.assertFalse(benchmark.compare(baseline, current)[0]['regression'])
+
+        current['results']['test.allocate']['1000']['median'] *= 1.2
+        self.assertFalse(benchmark.compare(baseline, current, 0.25)[0]['regression'])
+        current['results']['test.allocate']['1000']['median'] *= 1.2
+        self.assertTrue(benchmark.compare(baseline, current, 0.25)[0]['regression'])
+
+        current['results']['test.allocate']['1000']['median'] = \
+            baseline['results']['test.allocate']['1000']['median']
+        current['results']['test.allocate']['1000']['peak_bytes'] *= 2
+        self.assertTrue(benchmark.compare(baseline, current)[0]['regression'])
+
+    ## Test that every shipped case runs at the smallest size
+    def test_cases(self):
+        baseline = benchmark.run_suite(CASES, [1000], 1)
+        self.assertEqual(set(baseline['results']), set(case.name for case in CASES))
+
+    def tearDown(self):
+        laser.reset_for_testing()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+## @package test_cavity_loss
+#  This module contains unit tests for the cavity loss experiment and the
+#   ring-down fitting behind it.
+
+import unittest
+import numpy as np
+import laser
+from cavity_loss import CavityLossExperiment
+from data_analysis import ringdown
+
+## Testing class for the cavity loss experiment
+class CavityLossTesting(unittest.TestCase):
+
+    ## setUp method prepares 2000 noisy transients with decay times
+    #   spread between 1 and 3 ms, sampled at 20 kHz
+    def setUp(self):
+        rng = np.random.RandomState(3)
+        self.t = np.arange(400)/2e4
+        self.tau = rng.uniform(1e-3, 3e-3, 2000)
+        self.amplitude = rng.uniform(0.5, 1.5, 2000)
+        self.transients = (self.amplitude[:, np.newaxis]
+            * np.exp(-self.t/self.tau[:, np.newaxis]) + 0.02
+            + 0.002*rng.randn(2000, self.t.size))
+
+    ## Test that the closed form fit finds every decay time
+    def test_fit_log_linear(self):
+        fit = ringdown.fit_log_linear(self.t, self.transients)
+
+        np.testing.assert_allclose(fit.tau, self.tau, rtol = 0.05)
+        np.testing.assert_allclose(fit.baseline, 0.02, atol = 0.005)
+        self.assertTrue(np.all(fit.tau_err > 0))
+
+    ## Test that refinement improves on the closed form fit and that its
+    #   uncertainties match the actual errors
+    def test_refine(self):
+        initial = ringdown.fit_log_linear(self.t, self.transients)
+        fit = ringdown.refine(self.t, self.transients, initial)
+
+        refined_error = np.abs(fit.tau - self.tau)
+        initial_error = np.abs(initial.tau - self.tau)
+        self.assertLess(np.median(refined_error), np.median(initial_error))
+        np.testing.assert_allclose(fit.amplitude, self.amplitude, rtol = 0.02)
+        self.assertAlmostEqual(np.std((fit.tau - self.tau)/fit.tau_err), 1.0,
+            delta = 0.15)
+
+    ## Test that flat traces are flagged rather than fitted
+    def test_no_decay(self):
+        fit = ringdown.fit_log_linear(self.t, np.ones((2, self.t.size)))
+        self.assertTrue(np.all(np.isnan(fit.tau)))
+
+    ## Test the loss spectrum averaging per wavelength
+    def test_loss_spectrum(self):
+        tau = np.array([1e-6, 1e-6, 2e-6, np.nan])
+        labels, loss, loss_err, mean_tau, round_trip = ringdown.loss_spectrum(
+            tau, [1000, 1000, 1100, 1100], cavity_length = 50)
+
+        np.testing.assert_array_equal(labels, [1000, 1100])
+        np.testing.assert_allclose(loss, 1/(ringdown.SPEED_OF_LIGHT*np.array([1e-6, 2e-6])))
+        np.testing.assert_allclose(round_trip, 100*loss)
+        np.testing.assert_allclose(mean_tau, [1e-6, 2e-6])
+
+    ## Test the whole experiment against a simulated laser whose cavity
+    #   decay time depends on wavelength
+    def test_experiment(self):
+        t = self.t
+        tau = {1000: 1e-3, 1100: 2e-3}
+        rng = np.random.RandomState(4)
+
+        class Laser:
+            wavelength = None
+            def set_field(self, field_name, value):
+                self.wavelength = value
+            def capture_transients(self, count, duration):
+                self.duration = duration
+                return t, (np.exp(-t/tau[self.wavelength])
+                    + 0.001*rng.randn(count, t.size))
+        laser.set_for_test(Laser())
+
+        loss_exp = CavityLossExperiment.builder() \
+            .with_wavelengths([1000, 1100]) \
+            .with_transients(30, 0.02) \
+            .with_settle(1) \
+            .build()
+
+        experiment = loss_exp.experiment()
+        for tick in range(1, experiment._duration + 1):
+            for action in experiment._actions:
+                action.run_wrapper(tick)
+
+        labels, loss, loss_err, mean_tau = loss_exp.analyze()
+        np.testing.assert_array_equal(labels, [1000, 1100])
+        np.testing.assert_allclose(mean_tau, [1e-3, 2e-3], rtol = 0.01)
+        self.assertEqual(loss_exp.fit.tau.size, 60)
+
+    def tearDown(self):
+        laser.reset_for_testing()
+
+
+if __name__ == '__main__':
+    unittest.main()
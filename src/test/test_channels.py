@@ -0,0 +1,139 @@
+## @package test_channels
+#  This module contains unit tests for acquiring several demods and aux
+#   inputs merged into a structured array.
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from laser import Laser
+from laser.channels import Channels, magnitude, phase
+from data_analysis.segments import SegmentWriter
+
+## @brief Poll result holding a sample of a demod for each of the
+#         given timestamps, all with x 3 and y 4.
+def demod(stamps, dataloss=False):
+    stamps = np.asarray(stamps, dtype=np.uint64)
+    return {'sample': {'timestamp': stamps, 'x': np.full(stamps.size, 3.0),
+                       'y': np.full(stamps.size, 4.0), 'auxin0': stamps * 0.5,
+                       'time': {'dataloss': dataloss}}}
+
+## Sidekick SDK stand-in that only initializes
+class FakeSDK:
+    def SidekickSDK_Initialize(self):
+        return 0
+
+## Lock-in stand-in returning two demods, and asking the laser to stop
+#  after three polls
+class FakeDAQ:
+    def __init__(self, laser_obj):
+        self.laser = laser_obj
+        self.subscribed = []
+        self.polls = 0
+
+    def sync(self):
+        return
+
+    def getInt(self, path):
+        return 10
+
+    def subscribe(self, path):
+        self.subscribed.append(path)
+
+    def unsubscribe(self, path):
+        return
+
+    def poll(self, length, timeout):
+        self.polls += 1
+        if self.polls == 3:
+            self.laser.poll_stop.set()
+        first = self.polls * 10
+        return {'dev0': {'demods': {'0': demod(range(first, first + 10)),
+                                    '1': demod(range(first + 5, first + 15, 2))}}}
+
+## Testing class for `Channels` and its use by `Laser`
+class ChannelsTesting(unittest.TestCase):
+
+    ## setUp method creates channels of two demods and one aux input
+    def setUp(self):
+        self.channels = Channels(demods = ('0', '1'), aux = ('auxin0',))
+
+    ## Test that samples of both demods are merged by timestamp, with NaN
+    #   where a demod has no sample
+    def test_merge(self):
+        poll_data = {'dev0': {'demods': {'0': demod([0, 2, 4]), '1': demod([2, 3], True)}}}
+        merged, lost = self.channels.merge(poll_data, 'dev0', 2.0)
+        self.assertTrue(lost)
+        np.testing.assert_allclose(merged['time'], [0, 1, 1.5, 2])
+        np.testing.assert_allclose(merged['x'][:, 0], [3, 3, np.nan, 3])
+        np.testing.assert_allclose(merged['x'][:, 1], [np.nan, 3, 3, np.nan])
+        np.testing.assert_allclose(merged['aux'][:, 0], [0, 1, np.nan, 2])
+        np.testing.assert_allclose(magnitude(merged)[[0, 1, 3], 0], 5)
+        np.testing.assert_allclose(phase(merged)[1], np.arctan2(4, 3))
+
+        self.assertEqual(self.channels.merge({'dev0': {'demods': {}}}, 'dev0', 2.0), (None, False))
+
+    ## Test that the laser subscribes to every demod at once and keeps the
+    #   primary demod's magnitude as its data
+    def test_laser(self):
+        with mock.patch.object(Laser, '_Laser__startup'):
+            laser_obj = Laser(testing_sdk = FakeSDK(), testing_zi_sdk = object(),
+                              instrument = False, channels = self.channels)
+        laser_obj.daq = FakeDAQ(laser_obj)
+        laser_obj.device = 'dev0'
+        laser_obj._Laser__collect_data(laser_obj.data, laser_obj.time_axis)
+
+        self.assertEqual(laser_obj.daq.subscribed, [self.channels.paths('dev0')])
+        self.assertEqual(len(laser_obj.samples), 3)
+        np.testing.assert_allclose(np.concatenate(laser_obj.time_axis), np.arange(10, 40) / 10)
+        np.testing.assert_allclose(np.concatenate(laser_obj.data), 5)
+
+
+    ## Test that the merged samples are moved out of the laser along with
+    #   data and time_axis, and written into segments
+    def test_take_acquired(self):
+        with mock.patch.object(Laser, '_Laser__startup'):
+            laser_obj = Laser(testing_sdk = FakeSDK(), testing_zi_sdk = object(),
+                              instrument = False, channels = self.channels)
+        laser_obj.daq = FakeDAQ(laser_obj)
+        laser_obj.device = 'dev0'
+        laser_obj._Laser__collect_data(laser_obj.data, laser_obj.time_axis)
+        samples = np.concatenate(laser_obj.samples)
+
+        with tempfile.TemporaryDirectory() as directory:
+            writer = SegmentWriter(directory, laser_obj)
+            writer.close(1)
+            with np.load(os.path.join(directory, writer.segments[0]['file'])) as f:
+                self.assertEqual(f['samples'].dtype, samples.dtype)
+                np.testing.assert_array_equal(f['samples']['time'], samples['time'])
+                self.assertEqual(f['time'].size, 30)
+        self.assertEqual((laser_obj.samples, laser_obj.data, laser_obj.time_axis), ([], [], []))
+        self.assertEqual(laser_obj.data_offset, 3)
+
+    ## Test that every channel acquired is saved to Samples.npy with the data
+    def test_save(self):
+        with mock.patch.object(Laser, '_Laser__startup'):
+            laser_obj = Laser(testing_sdk = FakeSDK(), testing_zi_sdk = object(),
+                              instrument = False, channels = self.channels)
+        laser_obj.daq = FakeDAQ(laser_obj)
+        laser_obj.device = 'dev0'
+        laser_obj._Laser__collect_data(laser_obj.data, laser_obj.time_axis)
+        laser_obj.poll_thread = mock.Mock()
+        laser_obj.sdk = mock.Mock()
+
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                with mock.patch('sys.stderr'):
+                    laser_obj.turn_off_laser()
+                samples = np.load('Samples.npy')
+            finally:
+                os.chdir(cwd)
+        self.assertEqual(samples.dtype, self.channels.dtype)
+        np.testing.assert_array_equal(samples['time'],
+                                      np.concatenate(laser_obj.samples)['time'])
+
+if __name__ == '__main__':
+    unittest.main()
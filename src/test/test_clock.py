@@ -0,0 +1,153 @@
+## @package test_clock
+#  This module contains unit tests for the clocks experiments and lasers
+#   wait on, and the dry runs of experiments on a virtual clock.
+
+import asyncio
+import time
+import unittest
+from unittest import mock
+import laser
+from laser import Laser
+from action import CurrentAction, ScheduledAction
+from clock import VirtualClock
+from experiment import Experiment
+from grid_scan import GridScan
+
+## Runs a coroutine to completion on an event loop of its own
+def run_until_complete(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+## Sidekick SDK stand-in keeping the QCL parameters
+class FakeSDK:
+    def __init__(self):
+        self.params = [0, 15000, 500, 1500, 17.0, 0, 0, 0.0]
+
+    def SidekickSDK_Initialize(self):
+        return 0
+
+    def SidekickSDK_ReadWriteLaserQclParams(self, handle, write, slot):
+        return 0
+
+    def SidekickSDK_GetLaserQclParams(self, handle, *ptrs):
+        for ptr, value in zip(ptrs, self.params):
+            ptr.contents.value = value
+        return 0
+
+    def SidekickSDK_SetLaserQclParams(self, handle, *values):
+        self.params = [value.value for value in values]
+        return 0
+
+    def SidekickSDK_SetTuneToWW(self, handle, units, value, pref):
+        return 0
+
+    def SidekickSDK_ExecTuneToWW(self, handle):
+        return 0
+
+## Stand-in for the laser registered for the real run
+class FakeLaser:
+    def __init__(self):
+        self.setpoints = []
+
+    def set_field(self, field_name, value):
+        self.setpoints.append((None, field_name, value))
+
+    def turn_off_laser(self):
+        return
+
+## Current action stepping up by one every 10 minutes
+class StepAction(CurrentAction):
+    def run(self, current_time):
+        if current_time % 600 == 1:
+            return 1300 + current_time // 600
+
+## Testing class for `VirtualClock` and `Experiment.simulate`
+class ClockTesting(unittest.TestCase):
+
+    ## setUp method clears the laser registry
+    def setUp(self):
+        laser.reset_for_testing()
+
+    ## Test that a virtual clock advances by what is slept without waiting,
+    #   from threads and event loops alike
+    def test_virtual_clock(self):
+        clock = VirtualClock(start = 10)
+        with mock.patch('time.sleep') as sleep:
+            clock.sleep(3600)
+            run_until_complete(clock.sleep_async(0.5))
+        sleep.assert_not_called()
+        self.assertEqual(clock.now(), 3610.5)
+
+    ## Test that the waits of a laser go through its clock
+    def test_laser_waits(self):
+        clock = VirtualClock()
+        with mock.patch.object(Laser, '_Laser__startup'):
+            laser_obj = Laser(testing_sdk = FakeSDK(), testing_zi_sdk = object(),
+                              instrument = False, clock = clock)
+        with mock.patch('time.sleep') as sleep:
+            laser_obj.set_field('wavelength', 1100)
+            laser_obj.set_field('current', 1300)
+        sleep.assert_not_called()
+        self.assertEqual(clock.now(), 5)
+
+    ## Test that a 2-hour experiment dry-runs against emulated lasers,
+    #   predicting its duration, setpoints and hardware time, and leaves the
+    #   registered lasers alone
+    def test_simulate(self):
+        registered = FakeLaser()
+        laser.set_for_test(registered)
+        experiment = Experiment.builder() \
+            .with_actions([ScheduledAction('wavelength', {1: 1000, 3601: 1100}),
+                           StepAction()]) \
+            .with_duration(7199) \
+            .build()
+
+        started = time.perf_counter()
+        with mock.patch('time.sleep') as sleep:
+            report = experiment.simulate(tune_time = 5, params_time = 0.5)
+        self.assertLess(time.perf_counter() - started, 5)
+        sleep.assert_not_called()
+
+        self.assertEqual(report.ticks, 7199)
+        self.assertEqual(report.hardware_time, {None: 2*5 + 12*0.5})
+        self.assertEqual(report.seconds, 7199 + 16)
+        setpoints = report.setpoints[None]
+        self.assertEqual([(field_name, value) for _, field_name, value in setpoints[:3]],
+                         [('wavelength', 1000), ('current', 1300), ('current', 1301)])
+        self.assertEqual([when for when, _, _ in setpoints[:3]], [6, 6.5, 607])
+        self.assertIn('14 setpoints', report.report())
+
+        self.assertEqual(registered.setpoints, [])
+        self.assertIs(laser.get(), registered)
+
+    ## Test that a dry run leaves the state of the actions alone, so the
+    #   real run of a scan still sets every field of its first cell
+    def test_simulate_then_run(self):
+        # setpoints marked at the start of the lock-in time axis
+        class ScannedLaser(FakeLaser):
+            def set_field(self, field_name, value):
+                self.setpoints.append((0.0, field_name, value))
+
+        registered = ScannedLaser()
+        laser.set_for_test(registered)
+        scan = GridScan.builder() \
+            .with_wavelengths([1000, 1100]) \
+            .with_currents([1300]) \
+            .with_dwell(2) \
+            .with_settle(1) \
+            .build()
+        with mock.patch('time.sleep'):
+            scan.experiment().simulate()
+            scan.run()
+        self.assertEqual([(field_name, value) for _, field_name, value in registered.setpoints],
+                         [('wavelength', 1000), ('current', 1300), ('wavelength', 1100)])
+
+    def tearDown(self):
+        laser.reset_for_testing()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+## @package test_compact
+#  This module contains unit tests for the compact sample log - raw
+#   timestamps stored as runs of equally spaced ticks, float32 x and y,
+#   and the lazy conversion done by Analysis.
+
+import os
+import tempfile
+import unittest
+import numpy as np
+from data_analysis.analysis import Analysis
+from data_analysis.compact import CompactLog
+
+## Testing class for `CompactLog`
+class CompactTesting(unittest.TestCase):
+
+    ## setUp method records timestamps 30 ticks apart, with a gap and a
+    #   change to 60 ticks apart, split across chunks
+    def setUp(self):
+        self.ticks = np.concatenate([np.arange(1000, 1300, 30),
+                                     np.arange(1600, 2200, 30),
+                                     np.arange(2200, 4600, 60)]).astype(np.uint64)
+        n = self.ticks.size
+        self.x = np.linspace(1, 2, n)
+        self.y = np.linspace(0, 1, n)
+        self.log = CompactLog(clockbase = 3000)
+        for chunk in np.array_split(np.arange(n), 7):
+            self.log.append(self.ticks[chunk], self.x[chunk], self.y[chunk])
+
+    ## Test that the timestamps are rebuilt exactly from a few runs
+    def test_ticks(self):
+        index, tick, step = self.log.runs()
+        self.assertEqual(index.tolist(), [0, 10, 31])
+        self.assertEqual(step.tolist(), [30, 30, 60])
+        np.testing.assert_array_equal(self.log.ticks(), self.ticks)
+        np.testing.assert_allclose(self.log.time_axis(), self.ticks / 3000)
+
+    ## Test that x and y are kept as float32 and the magnitude derived
+    def test_payload(self):
+        x, y = self.log.xy()
+        self.assertEqual(x.dtype, np.float32)
+        self.assertEqual(x.nbytes + y.nbytes, 8 * self.ticks.size)
+        np.testing.assert_allclose(self.log.magnitude(), np.hypot(self.x, self.y), rtol = 1e-6)
+
+    ## Test that a saved log loads back the same, and that Analysis takes
+    #   the sample rate of its longest run
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'Data.npz')
+            self.log.save(path)
+            log = CompactLog.load(path)
+        np.testing.assert_array_equal(log.ticks(), self.ticks)
+        np.testing.assert_array_equal(log.xy()[0], self.log.xy()[0])
+
+        analysis_obj = Analysis.from_compact(log)
+        self.assertEqual(analysis_obj.sample_rate, 50)
+        np.testing.assert_allclose(analysis_obj.data_raw, log.magnitude())
+
+    ## Test that jittered timestamps fall back to raw ticks, which are
+    #   saved and loaded back as they are
+    def test_jitter(self):
+        ticks = np.cumsum(np.random.RandomState(0).randint(29, 32, 5000)).astype(np.uint64)
+        log = CompactLog(clockbase = 3000)
+        for chunk in np.array_split(np.arange(ticks.size), 50):
+            log.append(ticks[chunk], np.zeros(chunk.size), np.zeros(chunk.size))
+        self.assertEqual(log._runs, [])
+        np.testing.assert_array_equal(log.ticks(), ticks)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'Data.npz')
+            log.save(path)
+            log = CompactLog.load(path)
+        np.testing.assert_array_equal(log.ticks(), ticks)
+        self.assertEqual(log.xy()[0].size, ticks.size)
+
+    ## Test that isolated glitches only add runs around them
+    def test_glitches(self):
+        ticks = np.arange(0, 30 * 20000, 30)
+        ticks[[500, 7000, 12345]] += 7
+        log = CompactLog(clockbase = 3000)
+        for chunk in np.array_split(np.arange(ticks.size), 9):
+            log.append(ticks[chunk], np.zeros(chunk.size), np.zeros(chunk.size))
+        self.assertLessEqual(len(log._runs), 10)
+        np.testing.assert_array_equal(log.ticks(), ticks)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 import unittest
 from experiment import *
+from clock import VirtualClock
 import laser
 
 class Testing(unittest.TestCase):
@@ -25,13 +26,16 @@ class Testing(unittest.TestCase):
             self.results = 1337
 
       action = CustomWavelengthAction()
+      clock = VirtualClock()
       foobar_exp = Experiment.builder() \
         .with_actions([action]) \
         .with_duration(5) \
+        .with_clock(clock) \
         .build()
       foobar_exp.run()
 
       self.assertEqual(action.results, 1337)
+      self.assertEqual(clock.now(), 5)
 
     def test_invalid_experiements(self):
 
@@ -0,0 +1,145 @@
+## @package test_extinction
+#  This module contains unit tests for the extinction coefficient
+#   experiment and the step reduction and Beer-Lambert fit behind it.
+
+import asyncio
+import unittest
+from unittest import mock
+import numpy as np
+import laser
+from extinction import ExtinctionExperiment
+from data_analysis import beer_lambert, reduction
+
+## Runs a coroutine to completion on an event loop of its own
+def run_until_complete(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+## Testing class for the extinction coefficient experiment
+class ExtinctionTesting(unittest.TestCase):
+
+    ## setUp method prepares coefficients for a 300 point spectrum
+    def setUp(self):
+        self.rng = np.random.RandomState(2)
+        self.coefficient = np.linspace(0.1, 2.0, 300)
+        self.amounts = np.array([0.25, 0.5, 1.0, 2.0])
+
+    ## Test the window reduction against slicing each window
+    def test_reduce_windows(self):
+        time_axis = np.arange(0, 100, 0.1)
+        data = self.rng.randn(time_axis.size) + 5
+        mean, err, count = reduction.reduce_windows(time_axis, data,
+            [10, 50, 200], [20, 60, 210])
+
+        window = data[(time_axis >= 50) & (time_axis < 60)]
+        self.assertAlmostEqual(mean[1], window.mean())
+        self.assertAlmostEqual(err[1], window.std(ddof = 1)/np.sqrt(window.size))
+        np.testing.assert_array_equal(count, [100, 100, 0])
+        self.assertTrue(np.isnan(mean[2]))
+
+    ## Test that the unweighted fit recovers slope and offset everywhere
+    #   and that its uncertainties follow the added noise
+    def test_fit(self):
+        absorbance = (np.outer(self.amounts, self.coefficient) + 0.05
+            + 0.01*self.rng.randn(4, 300))
+        fit = beer_lambert.fit(self.amounts, absorbance)
+
+        np.testing.assert_allclose(fit.coefficient, self.coefficient, atol = 0.05)
+        np.testing.assert_allclose(fit.intercept, 0.05, atol = 0.05)
+        self.assertAlmostEqual(np.median(fit.coefficient_err), 0.01/np.sqrt(
+            np.sum((self.amounts - self.amounts.mean())**2)), delta = 0.005)
+
+    ## Test the weighted fit, which also works for a single sample
+    def test_weighted_fit(self):
+        absorbance = np.outer(self.amounts[:1], self.coefficient)
+        fit = beer_lambert.fit(self.amounts[:1], absorbance,
+            np.full(absorbance.shape, 0.01), intercept = False)
+
+        np.testing.assert_allclose(fit.coefficient, self.coefficient)
+        np.testing.assert_allclose(fit.coefficient_err, 0.01/self.amounts[0])
+
+    ## Test the whole experiment against a simulated laser and lock-in:
+    #   - the passes are reference, each sample, reference
+    #   - the fitted coefficient is that of the simulated sample
+    def test_experiment(self):
+        wavelengths = [1000, 1050, 1100]
+        coefficient = {1000: 0.2, 1050: 0.5, 1100: 0.3}
+        clock = {'t': 0.0}
+        changes = []
+
+        class Laser:
+            setpoints = []
+            def set_field(self, field_name, value):
+                self.setpoints.append((clock['t'], field_name, value))
+        fake = Laser()
+        laser.set_for_test(fake)
+
+        extinction_exp = ExtinctionExperiment.builder() \
+            .with_wavelengths(wavelengths) \
+            .with_samples([0.5, 1.0]) \
+            .with_dwell(3) \
+            .with_settle(1) \
+            .with_sample_change(changes.append) \
+            .build()
+
+        experiment = extinction_exp.experiment()
+        for tick in range(1, experiment._duration + 1):
+            clock['t'] = float(tick)
+            for action in experiment._actions:
+                action.run_wrapper(tick)
+
+        self.assertEqual(changes, ['reference', 'sample 0', 'sample 1', 'reference'])
+        self.assertEqual(len(fake.setpoints), 12)
+
+        # signal at each time follows the pass and wavelength active then
+        time_axis = np.arange(0, experiment._duration + 3, 0.01)
+        data = np.empty(time_axis.size)
+        amounts = [0.0, 0.5, 1.0, 0.0]
+        for i, (t, _, wavelength) in enumerate(fake.setpoints):
+            window = time_axis >= t
+            data[window] = 10**(-coefficient[wavelength]*amounts[i // 3])
+
+        fit = extinction_exp.analyze(time_axis, data, fake.setpoints)
+        np.testing.assert_allclose(fit.coefficient, [0.2, 0.5, 0.3])
+        np.testing.assert_allclose(fit.intercept, 0, atol = 1e-12)
+
+    ## Test that the sample changes, which act through their own
+    #   run_wrapper, are made when the experiment runs on an event loop
+    def test_run_async(self):
+        changes = []
+
+        class Laser:
+            setpoints = []
+            def set_field(self, field_name, value):
+                self.setpoints.append((0.0, field_name, value))
+
+            def turn_off_laser(self):
+                return
+        fake = Laser()
+        laser.set_for_test(fake)
+
+        extinction_exp = ExtinctionExperiment.builder() \
+            .with_wavelengths([1000, 1050]) \
+            .with_samples([0.5]) \
+            .with_dwell(2) \
+            .with_settle(1) \
+            .with_intercept(False) \
+            .with_sample_change(changes.append) \
+            .build()
+
+        async def no_wait(seconds):
+            return
+        with mock.patch('asyncio.sleep', no_wait):
+            run_until_complete(extinction_exp.experiment().run_async())
+        self.assertEqual(changes, ['reference', 'sample 0', 'reference'])
+        self.assertEqual([value for _, _, value in fake.setpoints], [1000, 1050]*3)
+
+    def tearDown(self):
+        laser.reset_for_testing()
+
+
+if __name__ == '__main__':
+    unittest.main()
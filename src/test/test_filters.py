@@ -0,0 +1,82 @@
+## @package test_filters
+#  This module contains unit tests for the filters module - the smoothing
+#   filters of the analysis class and their streaming forms.
+
+import unittest
+import numpy as np
+from scipy import signal
+from data_analysis import analysis
+from data_analysis import filters
+
+## Testing class for the `filters` module
+class FiltersTesting(unittest.TestCase):
+
+    ## setUp method prepares a noisy trace and uneven chunk boundaries
+    def setUp(self):
+        rng = np.random.RandomState(1)
+        self.trace = np.sin(np.linspace(0, 20, 1000)) + 0.2*rng.randn(1000)
+        self.bounds = [0, 3, 4, 250, 251, 600, 997, 1000]
+
+    ## feed the trace to a stream in uneven chunks and join the outputs
+    def stream(self, stream):
+        out = [stream.process(self.trace[a:b])
+               for a, b in zip(self.bounds[:-1], self.bounds[1:])]
+        out.append(stream.flush())
+        return np.concatenate(out)
+
+    ## Test the moving average against a direct average of each window,
+    #   shrinking at the edges
+    def test_moving_average(self):
+        smoothed = filters.moving_average(self.trace, 5)
+
+        self.assertAlmostEqual(smoothed[0], self.trace[:3].mean())
+        self.assertAlmostEqual(smoothed[500], self.trace[498:503].mean())
+        self.assertAlmostEqual(smoothed[-1], self.trace[-3:].mean())
+        with self.assertRaises(ValueError):
+            filters.moving_average(self.trace, 4)
+
+    ## Test the exponential filter against the recurrence it implements
+    def test_exponential(self):
+        smoothed = filters.exponential(self.trace, 0.25)
+
+        expected = np.empty_like(self.trace)
+        expected[0] = self.trace[0]
+        for i in range(1, self.trace.size):
+            expected[i] = 0.25*self.trace[i] + 0.75*expected[i-1]
+        np.testing.assert_allclose(smoothed, expected)
+
+    ## Test that every stream reproduces its whole trace filter, including
+    #   at chunk boundaries and at both edges of the trace
+    def test_streams_match(self):
+        cases = [
+            (filters.MovingAverageStream(21), filters.moving_average(self.trace, 21)),
+            (filters.SavitzkyGolayStream(21, 3), signal.savgol_filter(self.trace, 21, 3)),
+            (filters.MedianStream(9), filters.median(self.trace, 9)),
+            (filters.ExponentialStream(0.1), filters.exponential(self.trace, 0.1)),
+        ]
+        for stream, expected in cases:
+            np.testing.assert_allclose(self.stream(stream), expected, rtol = 1e-12,
+                atol = 1e-12)
+
+    ## Test a stream given less than one window in total
+    def test_short_stream(self):
+        stream = filters.MedianStream(9)
+        self.assertEqual(stream.process(self.trace[:4]).size, 0)
+        np.testing.assert_allclose(stream.flush(), filters.median(self.trace[:4], 9))
+
+    ## Test that the Analysis methods change data_adjusted only
+    def test_analysis_filters(self):
+        analysis_obj = analysis.Analysis(self.trace)
+        analysis_obj.savitzky_golay(11)
+        self.assertLess(np.std(np.diff(analysis_obj.data_adjusted)),
+                        np.std(np.diff(analysis_obj.data_raw)))
+
+        analysis_obj.reset()
+        analysis_obj.median_filter(5)
+        analysis_obj.moving_average(5)
+        analysis_obj.exponential(0.5)
+        self.assertEqual(analysis_obj.data_adjusted.shape, self.trace.shape)
+
+
+if __name__ == '__main__':
+    unittest.main()
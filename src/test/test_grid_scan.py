@@ -0,0 +1,170 @@
+## @package test_grid_scan
+#  This module contains unit tests for the grid scan of current against
+#   wavelength, the GridMap it fills and the heatmap showing it.
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import laser
+from grid_scan import GridScan, serpentine_cells
+from journal import acquired_since
+from data_analysis.grid_map import GridMap
+from data_analysis.display import GridDisplay
+
+## Stand-in for a laser acquiring ten samples a second of a signal that
+#  depends on its wavelength and current
+class FakeLaser:
+    def __init__(self):
+        self.data = []
+        self.time_axis = []
+        self.setpoints = []
+        self.now = 0.0
+        self.wavelength = 1000
+        self.current = 1300
+
+    def acquire(self, seconds = 1):
+        time_axis = self.now + np.arange(10) / 10
+        self.now += 1
+        self.data.append(np.full(10, signal(self.wavelength, self.current)))
+        self.time_axis.append(time_axis)
+
+    def set_field(self, field_name, value):
+        setattr(self, field_name, value)
+        self.setpoints.append((self.time_axis[-1][-1], field_name, value))
+
+    def turn_off_laser(self):
+        return
+
+## Signal the fake laser measures at a wavelength and current
+def signal(wavelength, current):
+    return wavelength / 1000 + current / 10000
+
+## Testing class for `GridScan`, `GridMap` and `GridDisplay`
+class GridScanTesting(unittest.TestCase):
+
+    ## setUp method registers the fake laser and a directory for maps
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'map.npz')
+        self.laser = FakeLaser()
+        laser.reset_for_testing()
+        laser.set_for_test(self.laser)
+
+    ## Builds a scan of three wavelengths by two currents
+    def build(self, path = None):
+        builder = GridScan.builder() \
+            .with_wavelengths([1100, 1000, 1050]) \
+            .with_currents([1300, 1400]) \
+            .with_dwell(2) \
+            .with_settle(1)
+        if path is not None:
+            builder.with_file(path)
+        return builder.build()
+
+    ## Test the serpentine order over either axis, leaving out filled cells
+    def test_serpentine(self):
+        self.assertEqual(serpentine_cells((2, 3)),
+                         [(0, 0), (0, 1), (0, 2), (1, 2), (1, 1), (1, 0)])
+        self.assertEqual(serpentine_cells((2, 3), 'current'),
+                         [(0, 0), (1, 0), (1, 1), (0, 1), (0, 2), (1, 2)])
+        skip = np.zeros((2, 3), dtype = bool)
+        skip[0, 1] = skip[1, 2] = True
+        self.assertEqual(serpentine_cells((2, 3), skip = skip),
+                         [(0, 0), (0, 2), (1, 1), (1, 0)])
+        with self.assertRaises(ValueError):
+            serpentine_cells((2, 3), 'pulse_rate')
+
+    ## Test that a scan fills every cell with its own samples, setting
+    #   only the fields that change, and estimates its duration
+    def test_scan(self):
+        scan = self.build(self.path)
+        self.assertEqual(scan.experiment()._duration, 13)
+        estimate = scan.estimate(tune_time = 5, params_time = 1)
+        self.assertEqual((estimate.steps, estimate.tuning_distance), (6, 100))
+        self.assertEqual(estimate.seconds, 13 + 3*5 + 4*1)
+
+        with mock.patch('time.sleep', side_effect = lambda seconds: self.laser.acquire()):
+            grid = scan.run()
+        self.assertEqual([field_name for _, field_name, _ in self.laser.setpoints],
+                         ['wavelength', 'current', 'current', 'wavelength',
+                          'current', 'wavelength', 'current'])
+        expected = signal(np.array([[1000], [1050], [1100]]), np.array([1300, 1400]))
+        np.testing.assert_allclose(grid.mean, expected)
+        np.testing.assert_array_equal(grid.count, 10)
+        self.assertTrue(grid.filled.all())
+        np.testing.assert_allclose(GridMap.load(self.path).values, grid.values)
+
+    ## Test that every tick reads only what was acquired since the last,
+    #   keeping no more chunks than the cells not reduced yet need
+    def test_since(self):
+        scan = self.build()
+        chunks = []
+
+        def sleep(seconds):
+            self.laser.acquire()
+            chunks.append(len(scan._action._chunks))
+
+        with mock.patch('grid_scan.acquired_since', wraps = acquired_since) as since:
+            with mock.patch('time.sleep', side_effect = sleep):
+                grid = scan.run()
+        cursors = [call[0][1] for call in since.call_args_list]
+        self.assertEqual(cursors, sorted(cursors))
+        self.assertEqual(cursors[-1], 13)
+        self.assertLessEqual(max(chunks), 3)
+        np.testing.assert_array_equal(grid.count, 10)
+
+    ## Test that an interrupted scan leaves unfilled cells NaN, and that a
+    #   scan built again with the same file fills in only those
+    def test_resume(self):
+        ticks = iter(range(8))
+
+        def sleep(seconds):
+            if next(ticks) == 7:
+                raise KeyboardInterrupt
+            self.laser.acquire()
+
+        with mock.patch('time.sleep', side_effect = sleep):
+            with self.assertRaises(KeyboardInterrupt):
+                self.build(self.path).run()
+        partial = GridMap.load(self.path)
+        self.assertEqual(partial.filled.sum(), 3)
+        self.assertTrue(np.isnan(partial.mean[~partial.filled]).all())
+
+        scan = self.build(self.path)
+        self.assertEqual(scan.cells, [(1, 0), (2, 0), (2, 1)])
+        with mock.patch('time.sleep', side_effect = lambda seconds: self.laser.acquire()):
+            grid = scan.run()
+        self.assertTrue(grid.filled.all())
+        np.testing.assert_allclose(grid.values[partial.filled], partial.values[partial.filled])
+
+        with self.assertRaises(ValueError):
+            GridScan.builder() \
+                .with_wavelengths([1000]) \
+                .with_currents([1300, 1400]) \
+                .with_file(self.path) \
+                .build()
+
+    ## Test that the heatmap redraws only when cells were filled
+    def test_display(self):
+        grid = GridMap([1000, 1050], [1300, 1400, 1500])
+        display = GridDisplay(grid)
+        self.assertEqual(display.mesh.get_array().count(), 0)
+
+        grid.fill(1, 2, np.arange(5.0), np.arange(5.0), 0, 5)
+        with mock.patch.object(display.fig.canvas, 'draw_idle') as draw:
+            display.refresh()
+            display.refresh()
+        self.assertEqual(draw.call_count, 1)
+        self.assertEqual(display.mesh.get_array().count(), 1)
+
+    def tearDown(self):
+        laser.reset_for_testing()
+        self.directory.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
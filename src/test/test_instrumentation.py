@@ -0,0 +1,67 @@
+## @package test_instrumentation
+#  This module contains unit tests for the SDK call instrumentation - the
+#   InstrumentedProxy wrapping the SDK objects and the CallRecorder behind it.
+
+import unittest
+from laser.instrumentation import (BUCKET_EDGES, CallRecorder, InstrumentedProxy,
+                                   sidekick_failed)
+
+## Stand-in SDK with a succeeding, a failing and a raising function
+class FakeSDK:
+    version = 7
+
+    def Ok(self, value):
+        return 0
+
+    def Fail(self):
+        return 3
+
+    def Raise(self):
+        raise IOError('device gone')
+
+## Testing class for `InstrumentedProxy` and `CallRecorder`
+class InstrumentationTesting(unittest.TestCase):
+
+    ## setUp method wraps a fake SDK
+    def setUp(self):
+        self.recorder = CallRecorder()
+        self.sdk = InstrumentedProxy(FakeSDK(), self.recorder, 'sidekick.', sidekick_failed)
+
+    ## Test that calls are forwarded and counted per function, and that
+    #   failure statuses and exceptions are counted as errors
+    def test_counts(self):
+        for i in range(5):
+            self.assertEqual(self.sdk.Ok(i), 0)
+        self.sdk.Fail()
+        with self.assertRaises(IOError):
+            self.sdk.Raise()
+
+        stats = self.recorder.summary()
+        self.assertEqual(stats['sidekick.Ok']['count'], 5)
+        self.assertEqual(stats['sidekick.Ok']['errors'], 0)
+        self.assertEqual(stats['sidekick.Fail']['errors'], 1)
+        self.assertEqual(stats['sidekick.Raise']['errors'], 1)
+        self.assertEqual(sum(stats['sidekick.Ok']['histogram']), 5)
+        self.assertIn('sidekick.Ok', self.recorder.format())
+
+    ## Test that plain attributes pass through and wrappers are built once
+    def test_passthrough(self):
+        self.assertEqual(self.sdk.version, 7)
+        self.assertIs(self.sdk.Ok, self.sdk.Ok)
+        self.assertNotIn('sidekick.version', self.recorder.summary())
+
+    ## Test that latencies land in the right histogram bucket and that
+    #   quantiles are bounded by the slowest call
+    def test_histogram(self):
+        self.recorder.add('laser.tune_wait', 2e-3)
+        self.recorder.add('laser.tune_wait', 5.0)
+        stats = self.recorder.summary()['laser.tune_wait']
+        self.assertEqual(stats['histogram'][BUCKET_EDGES.index(10**-2.5)], 1)
+        self.assertEqual(stats['histogram'][BUCKET_EDGES.index(10**1)], 1)
+        self.assertEqual(stats['max'], 5.0)
+        self.assertLessEqual(stats['p95'], 5.0)
+        self.assertLessEqual(stats['p50'], 10**-2.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
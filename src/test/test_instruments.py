@@ -0,0 +1,74 @@
+## @package test_instruments
+#  This module contains unit tests for driving several instruments - the
+#   named instrument registry, routing actions to instruments and hosting an
+#   instrument in its own process.
+
+import unittest
+import laser
+from laser import Laser_Exception
+from laser.emulator import EmulatedLaser
+from laser.remote import RemoteLaser
+from action import ScheduledAction
+from experiment import Experiment
+
+## Testing class for the instrument registry and `RemoteLaser`
+class InstrumentsTesting(unittest.TestCase):
+
+    ## Test that registered instruments are created once on first use, that
+    #   get() without a name keeps returning the default laser and that
+    #   unknown names are rejected
+    def test_registry(self):
+        default = EmulatedLaser()
+        laser.set_for_test(default)
+        laser.register('bench_a', EmulatedLaser, tune_time = 0.0)
+
+        bench_a = laser.get('bench_a')
+        self.assertIsInstance(bench_a, EmulatedLaser)
+        self.assertIs(laser.get('bench_a'), bench_a)
+        self.assertIs(laser.get(), default)
+        self.assertEqual(laser.instruments(), ['bench_a'])
+        with self.assertRaises(Laser_Exception):
+            laser.get('bench_c')
+
+        laser.register('bench_b', EmulatedLaser, default = True)
+        self.assertIs(laser.get(), laser.get('bench_b'))
+
+    ## Test that actions set and an experiment turns off the instrument
+    #   they are routed to
+    def test_routing(self):
+        benches = {name: EmulatedLaser() for name in ('bench_a', 'bench_b')}
+        for name, bench in benches.items():
+            laser.set_for_test(bench, name)
+        experiment = Experiment.builder() \
+            .with_actions([ScheduledAction('wavelength', {1: 1000}, 'bench_a'),
+                           ScheduledAction('wavelength', {1: 1100}, 'bench_b')]) \
+            .with_duration(1) \
+            .build()
+        experiment.run()
+
+        self.assertEqual(benches['bench_a'].wavelength, 1000)
+        self.assertEqual(benches['bench_b'].wavelength, 1100)
+        self.assertFalse(any(bench.laser_on for bench in benches.values()))
+
+    ## Test that a remote instrument serves calls and attribute reads and
+    #   re-raises errors from its process
+    def test_remote(self):
+        remote = RemoteLaser(EmulatedLaser)
+        try:
+            remote.set_field('wavelength', 1100)
+            self.assertEqual(remote.wavelength, 1100)
+            with self.assertRaises(Laser_Exception):
+                remote.set_field('wavelength', 10)
+            remote.turn_off_laser()
+            self.assertFalse(remote.laser_on)
+            self.assertEqual([s[1:] for s in remote.setpoints], [('wavelength', 1100)])
+        finally:
+            remote.close()
+        self.assertFalse(remote.process.is_alive())
+
+    def tearDown(self):
+        laser.reset_for_testing()
+
+
+if __name__ == '__main__':
+    unittest.main()
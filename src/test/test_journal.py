@@ -0,0 +1,186 @@
+## @package test_journal
+#  This module contains unit tests for the journal of experiment runs and
+#   the recovery of a run from it after a crash.
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import laser
+from laser import Laser
+from laser.emulator import EmulatedLaser
+from action import CurrentAction
+from experiment import Experiment
+from journal import Journal, main, recover
+from data_analysis.compact import CompactLog
+
+## Stand-in for a laser acquiring one chunk of samples per set_field
+class FakeLaser:
+    def __init__(self):
+        self.data = []
+        self.time_axis = []
+        self.setpoints = []
+
+    def set_field(self, field_name, value):
+        start = len(self.time_axis)
+        self.data.append(np.full(3, float(value)))
+        self.time_axis.append(np.arange(start * 3, start * 3 + 3) / 10)
+        self.setpoints.append((start * 0.3, field_name, value))
+
+    def turn_off_laser(self):
+        return
+
+## Current action that fails on its third tick
+class FailingAction(CurrentAction):
+    def run(self, current_time):
+        if current_time == 3:
+            raise IOError('USB connection lost')
+        return 1000 + current_time
+
+## Testing class for `Journal` and `recover`
+class JournalTesting(unittest.TestCase):
+
+    ## setUp method creates a directory for the journal
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'run.journal')
+        self.laser = FakeLaser()
+        laser.reset_for_testing()
+
+    ## Test that a run cut short mid-record is rebuilt up to its last
+    #   complete record, with fsyncs bounded by flush_interval
+    def test_crash(self):
+        with mock.patch('journal.os.fsync') as fsync:
+            journal = Journal(self.path, flush_interval = 3600)
+            journal.start(10, [], [self.laser], [None])
+            for tick in range(1, 4):
+                self.laser.set_field('current', 1000 + tick)
+                journal.checkpoint(tick)
+            self.assertEqual(fsync.call_count, 1)
+            self.laser.set_field('current', 1004)
+            journal._collect()
+            journal._file.close()
+        # the process dies halfway through writing a record
+        with open(self.path, 'ab') as f:
+            f.write(b'ALJ1\x02\x40')
+
+        recovery = recover(self.path)
+        self.assertFalse(recovery.completed)
+        self.assertEqual(recovery.last_tick, 3)
+        self.assertEqual(recovery.truncated, 6)
+        self.assertEqual(len(recovery.setpoints), 3)
+        time_axis, data = recovery.data[None]
+        np.testing.assert_allclose(time_axis, np.arange(12) / 10)
+        np.testing.assert_allclose(data, np.repeat([1001, 1002, 1003, 1004], 3))
+        self.assertIn('after tick 3 of 10', recovery.report())
+
+    ## Test that instruments with since, which RemoteLaser forwards, are
+    #   asked only for what is new at every checkpoint
+    def test_since(self):
+        emulated = EmulatedLaser()
+        emulated.data.append(np.ones(3))
+        emulated.time_axis.append(np.arange(3) / 10)
+        journal = Journal(self.path)
+        journal.start(10, [], [emulated], [None])
+        emulated.data.append(np.full(3, 2.0))
+        emulated.time_axis.append(np.arange(3, 6) / 10)
+        emulated.set_field('current', 1300)
+        with mock.patch.object(emulated, 'since', wraps = emulated.since) as since:
+            journal.checkpoint(1)
+            journal.checkpoint(2)
+        self.assertEqual(since.call_args_list, [mock.call(1, 0, 0), mock.call(2, 1, 0)])
+        journal.close(True)
+
+        recovery = recover(self.path)
+        time_axis, data = recovery.data[None]
+        np.testing.assert_allclose(time_axis, np.arange(3, 6) / 10)
+        np.testing.assert_allclose(data, 2.0)
+        self.assertEqual(len(recovery.setpoints), 1)
+
+        # chunks moved out before they were seen are skipped
+        del emulated.data[:1], emulated.time_axis[:1]
+        emulated.data_offset = 1
+        acquired = emulated.since(0, 0)
+        self.assertEqual((len(acquired['time_axis']), acquired['data_end'],
+                          len(acquired['setpoints']), acquired['setpoints_end']), (1, 2, 1, 1))
+
+    ## Test that compact samples, merged channel samples and acquisition
+    #   events are journaled and recovered
+    def test_compact_and_channels(self):
+        sdk = mock.Mock()
+        sdk.SidekickSDK_Initialize.return_value = 0
+        with mock.patch.object(Laser, '_Laser__startup'):
+            compact = Laser(testing_sdk = sdk, testing_zi_sdk = object(), instrument = False)
+            merged = Laser(testing_sdk = sdk, testing_zi_sdk = object(), instrument = False)
+        compact.compact_log = CompactLog(clockbase = 10)
+        compact.compact_log.append(np.arange(3), np.zeros(3), np.zeros(3))
+        compact.acquisition_controller = mock.Mock(events = [])
+        channels = np.zeros(3, dtype = [('time', float), ('x', float, 2)])
+        channels['time'] = np.arange(3) / 10
+        journal = Journal(self.path)
+        journal.start(10, [], [compact, merged], ['a', 'b'])
+        compact.compact_log.append(np.arange(3, 6), np.full(3, 3.0), np.full(3, 4.0))
+        compact.acquisition_controller.events.append((0.5, 'demod_rate', 1000, 500))
+        merged.samples.append(channels)
+        merged.data.append(np.ones(3))
+        merged.time_axis.append(channels['time'])
+        journal.checkpoint(1)
+        journal.close(True)
+
+        recovery = recover(self.path)
+        time_axis, data = recovery.data['a']
+        np.testing.assert_allclose(time_axis, np.arange(3, 6) / 10)
+        np.testing.assert_allclose(data, 5.0)
+        self.assertEqual(recovery.events, [[0, 0.5, 'demod_rate', 1000, 500]])
+        self.assertNotIn('a', recovery.samples)
+        np.testing.assert_array_equal(recovery.samples['b'], channels)
+
+    ## Test that an experiment that raises is journaled up to the failure,
+    #   and that the recovery tool writes the samples out
+    def test_experiment(self):
+        laser.set_for_test(self.laser)
+        experiment = Experiment.builder() \
+            .with_actions([FailingAction()]) \
+            .with_duration(5) \
+            .with_journal(self.path) \
+            .build()
+        with mock.patch('time.sleep'):
+            with self.assertRaises(IOError):
+                experiment.run()
+
+        recovery = recover(self.path)
+        self.assertEqual(recovery.last_tick, 2)
+        self.assertIn('USB connection lost', recovery.error)
+        self.assertEqual([setpoint[3] for setpoint in recovery.setpoints], [1001, 1002])
+
+        with mock.patch('builtins.print'):
+            self.assertEqual(main(['recover', self.path]), 1)
+        data = np.genfromtxt(os.path.join(self.directory.name, 'run.csv'), delimiter = ',')
+        np.testing.assert_allclose(data[0], np.repeat([1001, 1002], 3))
+
+    ## Test that an error during startup is raised as it is, without
+    #   shutting down the unconnected laser or saving over the last run's data
+    def test_startup_error(self):
+        sdk = mock.Mock()
+        sdk.SidekickSDK_Initialize.return_value = 0
+        cwd = os.getcwd()
+        os.chdir(self.directory.name)
+        try:
+            with mock.patch.object(Laser, '_Laser__connect_laser', side_effect = IOError('no laser')):
+                with mock.patch('sys.stderr'):
+                    with self.assertRaisesRegex(IOError, 'no laser'):
+                        Laser(testing_sdk = sdk, testing_zi_sdk = object(), instrument = False)
+        finally:
+            os.chdir(cwd)
+        sdk.SidekickSDK_SetLaserOnOff.assert_not_called()
+        sdk.SidekickSDK_Disconnect.assert_not_called()
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def tearDown(self):
+        laser.reset_for_testing()
+        self.directory.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+## @package test_live
+#  This module contains unit tests for the live acquisition view - the
+#   LiveFeed ring that the acquisition thread publishes into and the
+#   LiveDisplay that plots it.
+
+import unittest
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+from laser.live_feed import LiveFeed
+from data_analysis import live
+
+## Testing class for the `LiveFeed` ring and `LiveDisplay`
+class LiveTesting(unittest.TestCase):
+
+    ## setUp method prepares a small feed so that tests wrap around the ring
+    def setUp(self):
+        self.feed = LiveFeed(capacity = 10)
+
+    ## Test that snapshots return the newest samples in order, across wraps
+    #   of the ring and for chunks larger than the ring.
+    def test_publish_wraps(self):
+        self.feed.publish(np.arange(6), np.arange(6)*2)
+        self.feed.publish(np.arange(6, 13), np.arange(6, 13)*2)
+
+        time_axis, data, _ = self.feed.snapshot()
+        np.testing.assert_array_equal(time_axis, np.arange(3, 13))
+        np.testing.assert_array_equal(data, np.arange(3, 13)*2)
+        self.assertEqual(self.feed.written, 13)
+
+        self.feed.publish(np.arange(13, 40), np.arange(13, 40)*2)
+        time_axis, data, _ = self.feed.snapshot(span = 4)
+        np.testing.assert_array_equal(time_axis, np.arange(36, 40))
+
+    ## Test that markers carry the time of the latest sample when set.
+    def test_markers(self):
+        self.feed.publish(np.arange(5)*0.5, np.zeros(5))
+        self.feed.mark('wavelength', 1100)
+        _, _, markers = self.feed.snapshot()
+        self.assertEqual(markers, ((2.0, 'wavelength', 1100),))
+
+    ## Test that decimation bounds the point count but keeps the extremes.
+    def test_decimate(self):
+        time_axis = np.arange(100000, dtype = float)
+        data = np.zeros(100000)
+        data[54321] = 5.0
+        data[123] = -3.0
+
+        t, d = live.decimate(time_axis, data, 1000)
+        self.assertLessEqual(d.size, 1000)
+        self.assertEqual(d.max(), 5.0)
+        self.assertEqual(d.min(), -3.0)
+        self.assertIn(54321.0, t)
+        self.assertTrue(np.all(np.diff(t) >= 0))
+
+    ## Test that a refresh draws the latest samples and markers headlessly.
+    def test_refresh(self):
+        self.feed.publish(np.arange(8), np.arange(8))
+        self.feed.mark('current', 1300)
+        display = live.LiveDisplay(self.feed, max_points = 4)
+        display.refresh()
+
+        self.assertLessEqual(len(display.line.get_xdata()), 4)
+        self.assertEqual(len(display._marker_artists), 2)
+
+        # nothing new arrived, so nothing is redrawn
+        display.line.set_data([], [])
+        display.refresh()
+        self.assertEqual(len(display.line.get_xdata()), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
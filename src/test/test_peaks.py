@@ -0,0 +1,92 @@
+## @package test_peaks
+#  This module contains unit tests for the peaks module - the batched peak
+#   finder and the LineIndex of spectral lines it builds.
+
+import unittest
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+from data_analysis import analysis
+from data_analysis import display
+from data_analysis import peaks
+
+## sum of gaussian lines on a flat baseline
+def spectrum(x, centers, heights, sigma):
+    y = np.full(x.shape, 0.1)
+    for center, height in zip(centers, heights):
+        y += height*np.exp(-0.5*((x - center)/sigma)**2)
+    return y
+
+## Testing class for the `peaks` module
+class PeaksTesting(unittest.TestCase):
+
+    ## setUp method prepares a wavelength scan with three gaussian lines
+    def setUp(self):
+        self.x = np.linspace(950, 1250, 3001)
+        self.centers = np.array([1012.34, 1040.81, 1101.07])
+        self.heights = np.array([1.0, 0.5, 2.0])
+        self.sigma = 2.0
+        self.scan = spectrum(self.x, self.centers, self.heights, self.sigma)
+
+    ## Test that centers, widths and areas of the lines are recovered in
+    #   the units of the x axis
+    def test_find_peaks(self):
+        lines = peaks.find_peaks(self.scan, self.x, min_prominence = 0.1)
+
+        self.assertEqual(len(lines), 3)
+        np.testing.assert_allclose(lines.center, self.centers, atol = 1e-3)
+        np.testing.assert_allclose(lines.height, self.heights + 0.1, rtol = 1e-3)
+        np.testing.assert_allclose(lines.width, 2.3548*self.sigma, rtol = 1e-2)
+        np.testing.assert_allclose(lines.area,
+            self.heights*self.sigma*np.sqrt(2*np.pi), rtol = 2e-2)
+
+    ## Test that small wiggles are dropped by the prominence threshold
+    def test_min_prominence(self):
+        noisy = self.scan + 0.01*np.sin(self.x*7)
+        self.assertGreater(len(peaks.find_peaks(noisy, self.x)), 3)
+        self.assertEqual(len(peaks.find_peaks(noisy, self.x, 0.1)), 3)
+
+    ## Test range queries and matching against a reference line list
+    def test_line_index(self):
+        lines = peaks.find_peaks(self.scan, self.x, 0.1)
+
+        part = lines.query(1000, 1050)
+        np.testing.assert_allclose(part.center, self.centers[:2], atol = 1e-3)
+        self.assertEqual(len(lines.query(1200, 1250)), 0)
+
+        index, offset = lines.match([1101.0, 1012.0, 1200.0], tolerance = 1.0)
+        np.testing.assert_array_equal(index, [2, 0, -1])
+        np.testing.assert_allclose(offset[:2], [0.07, 0.34], atol = 1e-3)
+        self.assertTrue(np.isnan(offset[2]))
+
+    ## Test that a batch of drifting scans is processed in one call and that
+    #   peaks never leak from one scan into the next
+    def test_batch_drift(self):
+        drift = np.linspace(0, 1.5, 200)
+        scans = np.array([spectrum(self.x, self.centers + d, self.heights,
+            self.sigma) for d in drift])
+        # a scan ending on a rising edge must not borrow the next scan's peak
+        scans[:, -1] = 5.0
+
+        lines = peaks.find_peaks_batch(scans, self.x, min_prominence = 0.1)
+        self.assertEqual(len(lines), 200)
+        self.assertTrue(all(len(index) == 3 for index in lines))
+
+        offsets = peaks.track_drift(lines, self.centers, tolerance = 2.0)
+        np.testing.assert_allclose(offsets, np.repeat(drift[:, np.newaxis], 3, 1),
+            atol = 1e-3)
+
+    ## Test the Analysis and Display entry points
+    def test_analysis_display(self):
+        analysis_obj = analysis.Analysis(self.scan)
+        display_obj = display.Display(np.array([analysis_obj]))
+        display_obj.min_prominence = 0.1
+        display_obj.find_peaks(None)
+
+        self.assertEqual(len(analysis_obj.lines), 3)
+        np.testing.assert_allclose(analysis_obj.lines.center,
+            (self.centers - 950)/0.1, atol = 1e-2)
+
+
+if __name__ == '__main__':
+    unittest.main()
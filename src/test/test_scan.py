@@ -0,0 +1,103 @@
+## @package test_scan
+#  This module contains unit tests for the built-in wavelength, current and
+#   time scans and the ordering of their steps.
+
+import unittest
+import numpy as np
+import laser
+from scan import CurrentScan, TimeScan, WavelengthScan, step_order, tuning_distance
+
+## Testing class for the scan experiments
+class ScanTesting(unittest.TestCase):
+
+    ## Test the step orders, with and without interleaved repeats
+    def test_step_order(self):
+        values = [1030, 1000, 1020, 1010]
+        self.assertEqual(step_order(values, 2, 'serpentine'),
+                         [1000, 1010, 1020, 1030, 1030, 1020, 1010, 1000])
+        self.assertEqual(step_order(values, 2, 'monotonic', start = 1040),
+                         [1030, 1020, 1010, 1000, 1030, 1020, 1010, 1000])
+        self.assertEqual(step_order(values, 2, 'given', interleave = False),
+                         [1030, 1030, 1000, 1000, 1020, 1020, 1010, 1010])
+        self.assertLess(tuning_distance(step_order(values, 2, 'serpentine')),
+                        tuning_distance(step_order(values, 2, 'monotonic')))
+        with self.assertRaises(ValueError):
+            step_order(values, order = 'random')
+
+    ## Test that a scan compiles into one scheduled action with the
+    #   dwell of every value, and estimates its duration
+    def test_compile(self):
+        scan = CurrentScan.builder() \
+            .with_values([1200, 1100]) \
+            .with_dwell([3, 5]) \
+            .with_settle(1) \
+            .with_repeats(2) \
+            .build()
+        self.assertEqual(scan.sequence, [1100, 1200, 1200, 1100])
+        experiment = scan.experiment()
+        self.assertEqual(experiment._duration, 17)
+        self.assertEqual(experiment._actions[0]._schedule, {1: 1100, 6: 1200, 9: 1200, 12: 1100})
+        self.assertIsInstance(experiment._actions[0]._schedule[1], int)
+
+        estimate = scan.estimate(params_time = 0.5)
+        self.assertEqual((estimate.steps, estimate.ticks), (4, 17))
+        self.assertEqual(estimate.tuning_distance, 200)
+        self.assertEqual(estimate.seconds, 18.5)
+
+    ## Test a wavelength scan against a simulated laser and lock-in, with
+    #   linear drift that the serpentine passes cancel
+    def test_scan(self):
+        clock = {'t': 0.0}
+
+        class Laser:
+            setpoints = []
+            def set_field(self, field_name, value):
+                self.setpoints.append((clock['t'], field_name, value))
+        fake = Laser()
+        laser.set_for_test(fake)
+
+        scan = WavelengthScan.builder() \
+            .with_range(1000, 1040, 20) \
+            .with_dwell(4) \
+            .with_settle(1) \
+            .with_repeats(2) \
+            .build()
+        self.assertEqual(scan.estimate().seconds, 25 + 5*5)
+        experiment = scan.experiment()
+        for tick in range(1, experiment._duration + 1):
+            clock['t'] = float(tick)
+            for action in experiment._actions:
+                action.run_wrapper(tick)
+        self.assertEqual([value for _, _, value in fake.setpoints],
+                         [1000, 1020, 1040, 1040, 1020, 1000])
+
+        time_axis = np.arange(0, experiment._duration + 1, 0.01)
+        data = np.empty(time_axis.size)
+        for t, _, wavelength in fake.setpoints:
+            data[time_axis >= t] = wavelength / 1000
+        data += 0.01 * time_axis
+        values, mean, err = scan.analyze(time_axis, data, fake.setpoints)
+        np.testing.assert_allclose(values, [1000, 1020, 1040])
+        self.assertAlmostEqual(np.ptp(mean - values / 1000), 0, places = 9)
+
+    ## Test that a time scan applies its settings once and bins the data
+    def test_time_scan(self):
+        scan = TimeScan.builder() \
+            .with_settings({'wavelength': 1050}) \
+            .with_duration(10) \
+            .with_bin(2) \
+            .build()
+        self.assertEqual(scan.experiment()._actions[0]._schedule, {1: 1050})
+        self.assertEqual(scan.estimate().seconds, 16)
+
+        time_axis = np.arange(0, 10, 0.5) + 100
+        starts, mean, err = scan.analyze(time_axis, time_axis - 100)
+        np.testing.assert_allclose(starts, [0, 2, 4, 6, 8])
+        np.testing.assert_allclose(mean, [0.75, 2.75, 4.75, 6.75, 8.75])
+
+    def tearDown(self):
+        laser.reset_for_testing()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+## @package test_segments
+#  This module contains unit tests for long runs split into segment files
+#   and reading time windows back from them.
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import laser
+from laser import Laser
+from laser.emulator import EmulatedLaser
+from laser.remote import RemoteLaser
+from action import CurrentAction
+from experiment import Experiment
+from journal import recover
+from data_analysis.analysis import Analysis
+from data_analysis.compact import CompactLog
+from data_analysis.segments import SegmentIndex, SegmentWriter
+
+## Stand-in for a laser acquiring ten samples a second, one chunk per
+#  set_field, with a sample every 0.1 s
+class FakeLaser(EmulatedLaser):
+    def __init__(self):
+        super().__init__()
+        self.chunks = 0
+
+    def set_field(self, field_name, value):
+        start = self.chunks
+        self.chunks += 1
+        self.data.append(np.full(10, float(value)))
+        self.time_axis.append(np.arange(start * 10, start * 10 + 10) / 10)
+        self.setpoints.append((float(start), field_name, value))
+
+## Current action setting the tick as the current
+class TickAction(CurrentAction):
+    def run(self, current_time):
+        return current_time
+
+## Testing class for `SegmentWriter`, `SegmentIndex` and long-run experiments
+class SegmentsTesting(unittest.TestCase):
+
+    ## setUp method creates a directory for the segments
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+        self.laser = FakeLaser()
+        laser.reset_for_testing()
+
+    ## Test that segments end after the set samples, leaving the laser's
+    #   lists empty, and that windows load only the segments they overlap
+    def test_rotation(self):
+        writer = SegmentWriter(self.path, self.laser, seconds = 3600, samples = 30)
+        for tick in range(1, 8):
+            self.laser.set_field('current', tick)
+            writer.rotate_if_due(tick)
+        writer.close(7)
+        self.assertEqual([segment['samples'] for segment in writer.segments], [30, 30, 10])
+        self.assertEqual(self.laser.data, [])
+        self.assertEqual((self.laser.data_offset, self.laser.setpoints_offset), (7, 7))
+
+        index = SegmentIndex(self.path)
+        with mock.patch('data_analysis.segments.np.load', wraps = np.load) as load:
+            time_axis, data = index.window(3.5, 5.0)
+        self.assertEqual(load.call_count, 1)
+        np.testing.assert_allclose(time_axis, np.arange(35, 51) / 10)
+        np.testing.assert_allclose(data, np.repeat([4, 5, 6], [5, 10, 1]))
+        self.assertEqual(index.setpoints(3, 4.5), [(3.0, 'current', 4.0), (4.0, 'current', 5.0)])
+
+    ## Test that a laser in a process of its own is rotated in that process,
+    #   so no segment saves the samples of an earlier one again
+    def test_remote(self):
+        remote = RemoteLaser(FakeLaser)
+        try:
+            writer = SegmentWriter(self.path, remote, seconds = 3600, samples = 30)
+            for tick in range(1, 8):
+                remote.set_field('current', tick)
+                writer.rotate_if_due(tick)
+            writer.close(7)
+            self.assertEqual(remote.data, [])
+            self.assertEqual((remote.data_offset, remote.setpoints_offset), (7, 7))
+        finally:
+            remote.close()
+        self.assertEqual([segment['samples'] for segment in writer.segments], [30, 30, 10])
+        time_axis, data = SegmentIndex(self.path).window()
+        np.testing.assert_allclose(time_axis, np.arange(70) / 10)
+
+    ## Test that the samples of a compact laser count towards a segment and
+    #   are written into it with the acquisition events, and that turning
+    #   the laser off then leaves Data.npz alone
+    def test_compact(self):
+        sdk = mock.Mock()
+        sdk.SidekickSDK_Initialize.return_value = 0
+        with mock.patch.object(Laser, '_Laser__startup'):
+            laser_obj = Laser(testing_sdk = sdk, testing_zi_sdk = object(), instrument = False)
+        laser_obj.compact_log = CompactLog(clockbase = 10)
+        laser_obj.acquisition_controller = mock.Mock(events = [], gaps = [])
+        writer = SegmentWriter(self.path, laser_obj, seconds = 3600, samples = 30)
+        for tick in range(1, 8):
+            laser_obj.compact_log.append(np.arange(tick * 10 - 10, tick * 10),
+                                         np.full(10, 3.0), np.full(10, 4.0))
+            if tick == 2:
+                laser_obj.acquisition_controller.events.append((1.5, 'demod_rate', 1000, 500))
+            writer.rotate_if_due(tick)
+        writer.close(7)
+        self.assertEqual([segment['samples'] for segment in writer.segments], [30, 30, 10])
+        self.assertEqual(laser_obj.data_offset, 70)
+
+        index = SegmentIndex(self.path)
+        time_axis, data = index.window()
+        np.testing.assert_allclose(time_axis, np.arange(70) / 10)
+        np.testing.assert_allclose(data, 5.0)
+        self.assertEqual(index.events(), [(1.5, 'demod_rate', 1000.0, 500.0)])
+
+        laser_obj.poll_thread = mock.Mock()
+        cwd = os.getcwd()
+        os.chdir(self.path)
+        try:
+            with mock.patch('sys.stderr'):
+                laser_obj.turn_off_laser(save_data = False)
+            self.assertFalse(os.path.exists('Data.npz'))
+            self.assertTrue(os.path.exists('Events.csv'))
+        finally:
+            os.chdir(cwd)
+
+    ## Test that a segmented experiment turns its lasers off without saving
+    #   the samples over Data.csv
+    def test_end(self):
+        laser.set_for_test(self.laser)
+        experiment = Experiment.builder() \
+            .with_actions([TickAction()]) \
+            .with_duration(3) \
+            .with_segments(os.path.join(self.path, 'run')) \
+            .build()
+        with mock.patch.object(self.laser, 'turn_off_laser') as turn_off_laser:
+            with mock.patch('time.sleep'):
+                experiment.run()
+        turn_off_laser.assert_called_once_with(save_data = False)
+
+    ## Test that a segmented experiment may last longer than 2 hours, with a
+    #   segment per hour, and is journaled in full
+    def test_long_run(self):
+        laser.set_for_test(self.laser)
+        experiment = Experiment.builder() \
+            .with_actions([TickAction()]) \
+            .with_duration(3*60*60) \
+            .with_segments(os.path.join(self.path, 'run'), minutes = 60) \
+            .with_journal(os.path.join(self.path, 'run.journal'), flush_interval = 3600) \
+            .build()
+        with mock.patch('time.sleep'):
+            experiment.run()
+
+        index = SegmentIndex(os.path.join(self.path, 'run'))
+        self.assertEqual([segment['last_tick'] for segment in index.segments], [3600, 7200, 10800])
+        self.assertEqual(sum(segment['samples'] for segment in index.segments), 108000)
+        analysis_obj = Analysis.from_segments(os.path.join(self.path, 'run'), 3600, 3700)
+        self.assertEqual(analysis_obj.data_raw.size, 1001)
+        self.assertAlmostEqual(analysis_obj.sample_rate, 10)
+
+        time_axis, data = recover(os.path.join(self.path, 'run.journal')).data[None]
+        self.assertEqual(time_axis.size, 108000)
+
+    def tearDown(self):
+        laser.reset_for_testing()
+        self.directory.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
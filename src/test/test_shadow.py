@@ -0,0 +1,127 @@
+## @package test_shadow
+#  This module contains unit tests for the shadow state of the laser
+#   parameters - skipping redundant writes and invalidating on errors.
+
+import unittest
+from unittest import mock
+from laser import Laser, QCL_Exception
+from laser.shadow import ShadowState
+from clock import VirtualClock
+
+## Sidekick SDK stand-in counting writes, which can be made to fail or
+#  ignore them
+class FakeSDK:
+    def __init__(self):
+        self.params = [0, 15000, 500, 1500, 17.0, 0, 0, 0.0]
+        self.writes = 0
+        self.tunes = 0
+        self.broken = False
+        self.ignoring = False
+
+    def SidekickSDK_Initialize(self):
+        return 0
+
+    def SidekickSDK_ReadWriteLaserQclParams(self, handle, write, slot):
+        return 0
+
+    def SidekickSDK_GetLaserQclParams(self, handle, *ptrs):
+        for ptr, value in zip(ptrs, self.params):
+            ptr.contents.value = value
+        return 0
+
+    def SidekickSDK_SetLaserQclParams(self, handle, *values):
+        self.writes += 1
+        if self.broken:
+            raise IOError('USB connection lost')
+        if not self.ignoring:
+            self.params = [value.value for value in values]
+        return 0
+
+    def SidekickSDK_SetTuneToWW(self, handle, units, value, pref):
+        self.tunes += 1
+        return 0
+
+    def SidekickSDK_ExecTuneToWW(self, handle):
+        return 0
+
+## Testing class for `ShadowState` and its use by `Laser`
+class ShadowTesting(unittest.TestCase):
+
+    ## setUp method builds a laser on the fake SDK without starting it, and
+    #   skips the tuning and verification sleeps
+    def setUp(self):
+        self.sdk = FakeSDK()
+        with mock.patch.object(Laser, '_Laser__startup'):
+            self.laser = Laser(testing_sdk = self.sdk, testing_zi_sdk = object(),
+                               instrument = False)
+        self.sleep = mock.patch('laser.time.sleep')
+        self.sleep.start()
+
+    ## Test that confirmed values expire after max_age and can be invalidated
+    def test_state(self):
+        now = [0.0]
+        shadow = ShadowState(max_age = 10, clock = lambda: now[0])
+        shadow.confirm('current', 1300)
+        self.assertTrue(shadow.matches('current', 1300))
+        self.assertFalse(shadow.matches('current', 1400))
+        now[0] = 11
+        self.assertIsNone(shadow.get('current'))
+
+        shadow.confirm('current', 1300)
+        shadow.invalidate('current')
+        self.assertFalse(shadow.matches('current', 1300))
+
+    ## Test that setting a confirmed value again skips the hardware but is
+    #   still recorded as a setpoint
+    def test_skip_redundant(self):
+        self.laser.set_field('current', 1300)
+        self.laser.set_field('current', 1300)
+        self.laser.set_field('wavelength', 1100)
+        self.laser.set_field('wavelength', 1100)
+        self.assertEqual(self.sdk.writes, 1)
+        self.assertEqual(self.sdk.tunes, 1)
+        self.assertEqual(len(self.laser.setpoints), 4)
+
+        # the pulse rate was confirmed by the same write
+        self.laser.set_field('pulse_rate', 15000)
+        self.assertEqual(self.sdk.writes, 1)
+
+    ## Test that reads come from the shadow state unless forced, and that a
+    #   failed write invalidates it
+    def test_read_and_invalidate(self):
+        self.assertEqual(self.laser.read_field('current'), 1500)
+        self.sdk.params[3] = 1250
+        self.assertEqual(self.laser.read_field('current'), 1500)
+        self.assertEqual(self.laser.read_field('current', fresh = True), 1250)
+        self.assertIsNone(self.laser.read_field('wavelength'))
+
+        self.sdk.broken = True
+        with self.assertRaises(IOError):
+            self.laser.set_field('pulse_width', 700)
+        self.assertIsNone(self.laser.shadow.get('current'))
+        self.assertEqual(self.laser.setpoints, [])
+
+    ## Test that a write the controller ignores is caught by reading the
+    #   parameters back, and is neither confirmed nor recorded
+    def test_ignored_write(self):
+        with mock.patch.object(Laser, '_Laser__startup'):
+            laser_obj = Laser(testing_sdk = self.sdk, testing_zi_sdk = object(),
+                              instrument = False, clock = VirtualClock())
+        self.sdk.ignoring = True
+        with self.assertRaises(QCL_Exception):
+            laser_obj.set_field('current', 1300)
+        self.assertIsNone(laser_obj.shadow.get('current'))
+        self.assertEqual(laser_obj.read_field('current'), 1500)
+        self.assertEqual(laser_obj.setpoints, [])
+
+        self.sdk.ignoring = False
+        laser_obj.set_field('current', 1300)
+        self.assertEqual(self.sdk.params[3], 1300)
+        self.assertEqual(laser_obj.shadow.get('current'), 1300)
+
+    def tearDown(self):
+        self.sleep.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
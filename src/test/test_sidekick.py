@@ -0,0 +1,63 @@
+## @package test_sidekick
+#  This module contains unit tests for the typed Sidekick SDK binding.
+
+import ctypes
+import unittest
+from ctypes import CFUNCTYPE, c_float, c_int32, c_uint8, c_uint32, pointer
+from laser.sidekick import SIGNATURES, QclParams, SidekickSDK, bind
+
+## Stand-in for the SDK library made of C callable function pointers, whose
+#  GetLaserQclParams reports a current of 1300 mA
+class FakeLibrary:
+    def __init__(self):
+        self.calls = []
+        for name, argtypes in SIGNATURES.items():
+            setattr(self, name, CFUNCTYPE(c_int32, *argtypes)(self.__function(name)))
+
+    def __function(self, name):
+        def call(*args):
+            self.calls.append(name)
+            if name == 'SidekickSDK_GetLaserQclParams':
+                args[4][0] = 1300
+            return 0
+        return call
+
+## Testing class for the `laser.sidekick` binding
+class SidekickTesting(unittest.TestCase):
+
+    ## setUp method binds the stand-in library
+    def setUp(self):
+        self.sdk = SidekickSDK(FakeLibrary())
+        self.handle = c_uint32(1)
+
+    ## Test that arguments are converted to the declared types and that
+    #   mismatched types are rejected before reaching the library
+    def test_signatures(self):
+        self.assertEqual(self.sdk.SidekickSDK_SetTuneToWW(
+            self.handle, c_uint8(2), 1100.0, c_uint8(0)), 0)
+        with self.assertRaises(ctypes.ArgumentError):
+            self.sdk.SidekickSDK_SetTuneToWW(
+                self.handle, c_uint8(2), pointer(c_float(1100.0)), c_uint8(0))
+        self.assertEqual(self.sdk.library.calls, ['SidekickSDK_SetTuneToWW'])
+
+    ## Test that parameters are read in place through pointers that are
+    #   built once per structure
+    def test_qcl_params(self):
+        params = QclParams()
+        ptrs = params.pointers()
+        self.assertIs(params.pointers(), ptrs)
+        self.sdk.SidekickSDK_GetLaserQclParams(self.handle, *ptrs.values())
+        self.assertEqual(params.current_ma, 1300)
+        self.assertEqual(ptrs['current_ma_ptr'].contents.value, 1300)
+
+        ptrs['pulse_rate_hz_ptr'].contents.value = 10000
+        self.assertEqual(params.pulse_rate_hz, 10000)
+
+    ## Test that test doubles are used as they are
+    def test_bind_double(self):
+        double = object()
+        self.assertIs(bind(double), double)
+
+
+if __name__ == '__main__':
+    unittest.main()
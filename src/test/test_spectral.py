@@ -0,0 +1,115 @@
+## @package test_spectral
+#  This module contains unit tests for the spectral module - the FFT, Welch
+#   PSD and spectrogram routines behind the frequency domain methods of the
+#   analysis class.
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from scipy import signal
+import matplotlib
+matplotlib.use('Agg')
+from data_analysis import analysis
+from data_analysis import display
+from data_analysis import spectral
+
+## Testing class for the `spectral` module
+class SpectralTesting(unittest.TestCase):
+
+    ## setUp method prepares a batch of noisy 50 Hz sines sampled at 2 kHz
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.fs = 2e3
+        self.time_axis = np.arange(4096)/self.fs
+        self.traces = (np.sin(2*np.pi*50*self.time_axis)
+            + 0.1*rng.randn(6, self.time_axis.size))
+
+    ## Test the sampling rate helper, it should ignore a single gap
+    def test_sample_rate(self):
+        time_axis = np.delete(self.time_axis, 100)
+        self.assertAlmostEqual(spectral.sample_rate(time_axis), self.fs)
+
+    ## Test that the batched Welch PSD matches scipy trace by trace
+    def test_welch(self):
+        freqs, psd = spectral.welch(self.traces, self.fs, nperseg = 512)
+        ref_freqs, ref_psd = signal.welch(self.traces, self.fs, nperseg = 512)
+
+        np.testing.assert_allclose(freqs, ref_freqs)
+        np.testing.assert_allclose(psd, ref_psd, rtol = 1e-10)
+        self.assertAlmostEqual(freqs[np.argmax(psd[0])], 50, delta = 4)
+
+    ## Test that the batched spectrogram matches scipy
+    def test_spectrogram(self):
+        freqs, times, sxx = spectral.spectrogram(self.traces, self.fs)
+        ref_freqs, ref_times, ref_sxx = signal.spectrogram(self.traces, self.fs,
+            window = 'hann')
+
+        np.testing.assert_allclose(freqs, ref_freqs)
+        np.testing.assert_allclose(times, ref_times)
+        np.testing.assert_allclose(sxx, ref_sxx, rtol = 1e-10)
+
+    ## Test the FFT against numpy and that windows are cached by length
+    def test_fft(self):
+        freqs, spectra = spectral.fft(self.traces, self.fs)
+        np.testing.assert_allclose(spectra, np.fft.rfft(self.traces))
+        np.testing.assert_allclose(freqs, np.fft.rfftfreq(4096, 1/self.fs))
+
+        self.assertIs(spectral._window('hann', 64), spectral._window('hann', 64))
+
+    ## Test that memory-mapped traces give the same PSD as in memory ones
+    def test_memmap(self):
+        handle, path = tempfile.mkstemp(suffix = '.npy')
+        os.close(handle)
+        try:
+            np.save(path, self.traces)
+            mapped = np.load(path, mmap_mode = 'r')
+            _, psd = spectral.welch(mapped, self.fs)
+            _, ref = spectral.welch(self.traces, self.fs)
+            np.testing.assert_allclose(psd, ref)
+            del mapped
+        finally:
+            os.remove(path)
+
+    ## Test the Analysis psd method:
+    #   - frequency_axis is set and matches data_adjusted
+    #   - reset goes back to the time domain
+    def test_analysis_psd(self):
+        analysis_obj = analysis.Analysis(self.traces[0],
+            spectral.sample_rate(self.time_axis))
+        analysis_obj.psd(nperseg = 256)
+
+        self.assertEqual(analysis_obj.frequency_axis.shape,
+            analysis_obj.data_adjusted.shape)
+        self.assertAlmostEqual(analysis_obj.frequency_axis[-1], self.fs/2)
+
+        analysis_obj.reset()
+        self.assertIsNone(analysis_obj.frequency_axis)
+
+    ## Test that Display draws the frequency domain view on a log axis
+    def test_display_psd(self):
+        display_obj = display.Display(np.array(
+            [analysis.Analysis(self.traces[0], self.fs)]))
+        display_obj.psd(None)
+
+        self.assertEqual(display_obj.subplots[0].get_yscale(), 'log')
+        self.assertEqual(display_obj.subplots[0].get_xlabel(), 'Frequency (Hz)')
+
+
+    ## Test that Display reports, and does not redraw, the ratio of a
+    #   spectrum and time domain data
+    def test_display_ratio(self):
+        display_obj = display.Display(np.array(
+            [analysis.Analysis(trace, self.fs) for trace in self.traces[:2]]))
+        display_obj.psd(None)
+        spectrum = display_obj.data[0].data_adjusted
+        with mock.patch('builtins.print') as printed:
+            with mock.patch.object(display_obj.subplots[0], 'cla') as cla:
+                display_obj.ratio('1')
+        cla.assert_not_called()
+        self.assertIn('frequency domain', str(printed.call_args[0][0]))
+        self.assertIs(display_obj.data[0].data_adjusted, spectrum)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+## @package test_timeline
+#  This module contains unit tests for the experiment Timeline - recording
+#   ticks and actions and exporting them as a Chrome trace.
+
+import json
+import os
+import tempfile
+import unittest
+import numpy as np
+import laser
+from action import ScheduledAction
+from clock import VirtualClock
+from experiment import Experiment
+from timeline import Timeline, TICK, ACTION
+
+## Laser test double recording the fields it is asked to set
+class Laser:
+    def __init__(self):
+        self.calls = []
+
+    def set_field(self, field_name, value):
+        if value < 0:
+            raise ValueError('negative')
+        self.calls.append((field_name, value))
+
+    def turn_off_laser(self):
+        return
+
+## Testing class for `Timeline`
+class TimelineTesting(unittest.TestCase):
+
+    ## setUp method installs the laser test double
+    def setUp(self):
+        self.laser = Laser()
+        laser.set_for_test(self.laser)
+
+    ## Test that every tick and action is recorded with the value applied,
+    #   and that records past the capacity are dropped rather than stored
+    def test_records(self):
+        actions = [ScheduledAction('wavelength', {1: 1000, 2: 1010}),
+                   ScheduledAction('current', {2: 1300})]
+        timeline = Timeline(capacity = 5)
+        timeline.start(actions)
+        timeline.run_tick(1, actions)
+        timeline.run_tick(2, actions)
+
+        records = timeline.records
+        self.assertEqual(len(records), 5)
+        self.assertEqual(timeline.dropped, 1)
+        self.assertEqual(list(records['kind']), [ACTION, ACTION, TICK, ACTION, ACTION])
+        self.assertEqual(records['value'][0], 1000)
+        self.assertTrue(np.isnan(records['value'][1]))
+        self.assertLessEqual(records['start'][2], records['start'][0])
+        self.assertLessEqual(records['start'][0], records['start'][1])
+        self.assertEqual(timeline.names[1], 'ScheduledAction current')
+
+    ## Test that an exception is recorded against its action and re-raised
+    def test_error(self):
+        actions = [ScheduledAction('wavelength', {1: -1})]
+        timeline = Timeline(capacity = 4)
+        timeline.start(actions)
+        with self.assertRaises(ValueError):
+            timeline.run_tick(1, actions)
+        self.assertEqual(list(timeline.records['error']), [1, 1])
+        self.assertIn('negative', timeline.errors[0])
+
+    ## Test that a traced experiment saves a Chrome trace with one complete
+    #   event per tick and per action, on one row each
+    def test_experiment_trace(self):
+        handle, path = tempfile.mkstemp(suffix = '.json')
+        os.close(handle)
+        try:
+            experiment = Experiment.builder() \
+                .with_actions([ScheduledAction('wavelength', {1: 1000})]) \
+                .with_duration(1) \
+                .with_trace(path) \
+                .build()
+            experiment.run()
+            with open(path) as f:
+                trace = json.load(f)
+        finally:
+            os.remove(path)
+
+        complete = [event for event in trace['traceEvents'] if event['ph'] == 'X']
+        self.assertEqual([event['tid'] for event in complete], [1, 0])
+        self.assertEqual(complete[0]['args']['value'], 1000)
+        self.assertGreaterEqual(complete[1]['ts'], 1e6)
+        self.assertEqual(self.laser.calls, [('wavelength', 1000)])
+
+    ## Test that an experiment on a virtual clock is traced on that clock,
+    #   every tick starting on schedule
+    def test_virtual_clock(self):
+        experiment = Experiment.builder() \
+            .with_actions([ScheduledAction('wavelength', {1: 1000})]) \
+            .with_duration(600) \
+            .with_clock(VirtualClock(start = 100)) \
+            .with_trace() \
+            .build()
+        experiment.run()
+        ticks, lateness = experiment.timeline.lateness()
+        np.testing.assert_array_equal(ticks, np.arange(1, 601))
+        np.testing.assert_array_equal(lateness, 0)
+
+    def tearDown(self):
+        laser.reset_for_testing()
+
+
+if __name__ == '__main__':
+    unittest.main()
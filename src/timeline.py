@@ -0,0 +1,165 @@
+import json
+import numpy as np
+from clock import SystemClock
+
+##
+# Layout of one Timeline record. kind is TICK or ACTION, tick the experiment
+# second, action the index of the action in the experiment (-1 for ticks),
+# start and duration are in seconds from the start of the run, value is
+# what the action applied (NaN for none or non-numeric values) and error
+# is 1 if the action raised.
+RECORD = np.dtype([
+  ('kind', np.uint8),
+  ('tick', np.int32),
+  ('action', np.int16),
+  ('error', np.uint8),
+  ('start', np.float64),
+  ('duration', np.float64),
+  ('value', np.float64),
+])
+
+## Record kind of a whole experiment tick.
+TICK = 0
+## Record kind of a single Action.run_wrapper call.
+ACTION = 1
+
+##
+# The Timeline class records when every tick of an experiment started,
+# how long each action took, what it applied and whether it raised. Records
+# go into a preallocated structured array so recording does not allocate
+# while the experiment runs; records past the capacity are counted in
+# dropped. The result can be exported in the Chrome trace-event format and
+# opened in chrome://tracing or https://ui.perfetto.dev.
+#
+# Times are read from a clock, the experiment's own, so that on a
+# VirtualClock the records and lateness follow the simulated schedule.
+#
+# Experiments record a timeline when built with .with_trace(path).
+#
+# Example: Recording an experiment by hand
+#
+# timeline = Timeline(capacity = duration * (len(actions) + 1))
+# timeline.start(actions)
+# for current_time in range(1, duration + 1):
+#   time.sleep(1)
+#   timeline.run_tick(current_time, actions)
+# timeline.save('trace.json')
+
+class Timeline:
+
+  def __init__(self, capacity, clock = None):
+    self._records = np.zeros(capacity, dtype = RECORD)
+    self._count = 0
+    self._clock = SystemClock() if clock is None else clock
+    self._origin = self._clock.now()
+    self.dropped = 0
+    self.errors = {}
+    self.names = []
+
+  ##
+  # Marks the start of the run, from which all times are measured, and
+  # names the actions after their class and field
+  def start(self, actions):
+    self.names = ['{} {}'.format(type(action).__name__, getattr(action, '_field_name', ''))
+                  for action in actions]
+    self._origin = self._clock.now()
+
+  ##
+  # Runs every action for one tick, recording each of them and the tick as
+  # a whole. Exceptions are recorded and then re-raised
+  def run_tick(self, current_time, actions):
+    clock = self._clock.now
+    tick_start = clock()
+    for index, action in enumerate(actions):
+      start = clock()
+      try:
+        value = action.run_wrapper(current_time)
+      except Exception as e:
+        self._add(ACTION, current_time, index, start, clock() - start, None, e)
+        self._add(TICK, current_time, -1, tick_start, clock() - tick_start, None, e)
+        raise
+      self._add(ACTION, current_time, index, start, clock() - start, value)
+    self._add(TICK, current_time, -1, tick_start, clock() - tick_start, None)
+
+  ##
+  # Awaitable version of run_tick for Experiment.run_async
+  async def run_tick_async(self, current_time, actions):
+    clock = self._clock.now
+    tick_start = clock()
+    for index, action in enumerate(actions):
+      start = clock()
+      try:
+        value = await action.run_wrapper_async(current_time)
+      except Exception as e:
+        self._add(ACTION, current_time, index, start, clock() - start, None, e)
+        self._add(TICK, current_time, -1, tick_start, clock() - tick_start, None, e)
+        raise
+      self._add(ACTION, current_time, index, start, clock() - start, value)
+    self._add(TICK, current_time, -1, tick_start, clock() - tick_start, None)
+
+  def _add(self, kind, tick, action, start, duration, value, error = None):
+    if self._count >= len(self._records):
+      self.dropped += 1
+      return
+    try:
+      value = float(value)
+    except (TypeError, ValueError):
+      value = np.nan
+    self._records[self._count] = (kind, tick, action, error is not None,
+                                  start - self._origin, duration, value)
+    if error is not None:
+      self.errors[self._count] = repr(error)
+    self._count += 1
+
+  ##
+  # View of the records written so far
+  @property
+  def records(self):
+    return self._records[:self._count]
+
+  ##
+  # How late each tick started compared to its nominal time of one second
+  # per tick after the start. Returns the tick numbers and the lateness in
+  # seconds
+  def lateness(self):
+    ticks = self.records[self.records['kind'] == TICK]
+    return ticks['tick'], ticks['start'] - ticks['tick']
+
+  ##
+  # The timeline as a Chrome trace-event dictionary. Ticks are on the first
+  # row and every action on its own row, with the tick lateness as a counter
+  def to_chrome(self):
+    events = [{'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': 0,
+               'args': {'name': 'ticks'}}]
+    for index, name in enumerate(self.names):
+      events.append({'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': index + 1,
+                     'args': {'name': name}})
+
+    for row, record in enumerate(self.records):
+      tick = int(record['tick'])
+      start = float(record['start']) * 1e6
+      args = {'tick': tick}
+      if record['kind'] == TICK:
+        name = 'tick {}'.format(tick)
+        tid = 0
+        events.append({'name': 'tick lateness', 'ph': 'C', 'pid': 0, 'ts': start,
+                       'args': {'ms': (float(record['start']) - tick) * 1e3}})
+      else:
+        action = int(record['action'])
+        name = self.names[action] if action < len(self.names) else str(action)
+        tid = action + 1
+        if not np.isnan(record['value']):
+          args['value'] = float(record['value'])
+      if record['error']:
+        args['error'] = self.errors[row]
+      events.append({'name': name, 'ph': 'X', 'pid': 0, 'tid': tid, 'ts': start,
+                     'dur': float(record['duration']) * 1e6, 'args': args})
+
+    return {'traceEvents': events, 'displayTimeUnit': 'ms',
+            'otherData': {'dropped': self.dropped}}
+
+  ##
+  # Writes the Chrome trace-event JSON to a file
+  def save(self, path):
+    with open(path, 'w') as f:
+      json.dump(self.to_chrome(), f)